@@ -0,0 +1,402 @@
+"""
+Differential fuzzer, random gcc-style assembly is assembled with maspsx + GNU as
+and with the real ASPSX, and any case where the .text differs is kept.
+
+    python3 fuzz.py --aspsx-versions 2.56,2.77 --cases 10000 --out fuzz-out
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import psyq2elf
+import util
+
+from maspsx.api import assemble, process
+from maspsx.elf import read_elf_section
+from maspsx.jobserver import job_slots
+from maspsx.options import MaspsxOptions
+from maspsx.versions import parse_version, parse_version_list
+
+AS_ARGS = ["-march=r3000", "-mtune=r3000"]
+
+REGISTERS = ["$2", "$3", "$4", "$5", "$6", "$7", "$16", "$17"]
+LOADS = ["lw", "lh", "lhu", "lb", "lbu"]
+STORES = ["sw", "sh", "sb"]
+DIVS = ["div", "divu", "rem", "remu"]
+
+# around the 16-bit boundaries where $at expansions kick in
+OFFSETS = [
+    0,
+    4,
+    -4,
+    100,
+    0x7FFC,
+    0x7FFF,
+    0x8000,
+    0x8004,
+    0xFFFF,
+    0x10000,
+    56200,
+    -0x8000,
+    -0x8001,
+    -56200,
+    0x12345,
+]
+IMMEDIATES = [
+    0,
+    1,
+    -1,
+    100,
+    -23,
+    0x7FFF,
+    0x8000,
+    0xFFFF,
+    0x10000,
+    0x10001,
+    0x11000,
+    -0x8000,
+    -0x8001,
+    -0x9000,
+    0x12345678,
+]
+SDATA_LIMITS = [0, 8]
+
+
+@dataclass(frozen=True)
+class FuzzCase:
+    text: str
+    sdata_limit: int = 0
+    expand_div: bool = False
+
+    @property
+    def data_limit(self) -> str:
+        return f"-G{self.sdata_limit}"
+
+    @property
+    def extra_flags(self) -> str:
+        # ASPSX only partially expands div/rem with -0
+        return "" if self.expand_div else "-0"
+
+    def key(self, aspsx_version: str) -> str:
+        return util.oracle_key(
+            self.text.encode("utf"), aspsx_version, self.data_limit, self.extra_flags
+        )
+
+
+@dataclass
+class FuzzResult:
+    case: FuzzCase
+    aspsx_version: str
+    expected: Optional[List[str]] = None  # from ASPSX
+    actual: Optional[List[str]] = None  # from maspsx
+    error: Optional[str] = None
+
+    @property
+    def is_match(self) -> bool:
+        return (
+            self.error is None
+            and self.expected is not None
+            and self.actual is not None
+            and words_match(self.expected, self.actual)
+        )
+
+
+def generate_case(rng: random.Random, num_statements: int = 8) -> FuzzCase:
+    symbols = []
+    declarations = []
+    for i in range(rng.randint(1, 3)):
+        name = f"fuzzVar{i}"
+        kind = rng.choice(["comm", "lcomm", "sdata", "extern"])
+        size = rng.choice([4, 8, 40])
+        if kind == "comm":
+            declarations.append(f"\t.comm\t{name},{size}")
+        elif kind == "lcomm":
+            declarations.append(f"\t.lcomm\t{name},{size}")
+        elif kind == "sdata":
+            declarations += ["\t.sdata", "\t.align\t2", f"{name}:", "\t.word\t0"]
+        else:
+            name = f"D_8{rng.randrange(0x10000000):07X}"
+        symbols.append((name, size))
+
+    def reg() -> str:
+        return rng.choice(REGISTERS)
+
+    def symbol() -> str:
+        name, size = rng.choice(symbols)
+        offset = rng.randrange(0, size, 4)
+        return f"{name}+{offset}" if offset else name
+
+    body = []
+    labels = 0
+    for _ in range(num_statements):
+        kind = rng.randrange(10)
+        if kind == 0:
+            body.append(
+                f"\t{rng.choice(LOADS)}\t{reg()},{rng.choice(OFFSETS)}({reg()})"
+            )
+        elif kind == 1:
+            body.append(
+                f"\t{rng.choice(STORES)}\t{reg()},{rng.choice(OFFSETS)}({reg()})"
+            )
+        elif kind == 2:
+            op = rng.choice(LOADS + STORES)
+            body.append(f"\t{op}\t{reg()},{symbol()}")
+        elif kind == 3:
+            body.append(f"\tla\t{reg()},{symbol()}")
+        elif kind == 4:
+            body.append(f"\tli\t{reg()},{rng.choice(IMMEDIATES)}")
+        elif kind == 5:
+            body.append(f"\tsltu\t{reg()},{reg()},{rng.choice(IMMEDIATES)}")
+        elif kind == 6:
+            body.append(f"\t{rng.choice(DIVS)}\t{reg()},{reg()},{reg()}")
+        elif kind == 7:
+            body.append(f"\t{rng.choice(['mult', 'multu'])}\t{reg()},{reg()}")
+            body.append(f"\t{rng.choice(['mflo', 'mfhi'])}\t{reg()}")
+        elif kind == 8:
+            body += [
+                "\t.set\tnoreorder",
+                f"\tlw\t{reg()},{rng.choice(OFFSETS)}({reg()})",
+                "\tnop",
+                "\t.set\treorder",
+            ]
+        else:
+            labels += 1
+            body += [f"$L{labels}:", f"\tbne\t{reg()},$0,$L{labels}"]
+
+    lines = [
+        *declarations,
+        "\t.text",
+        "\t.align\t2",
+        "\t.globl\tfuzz",
+        "\t.ent\tfuzz",
+        "fuzz:",
+        *body,
+        "\tj\t$31",
+        "\t.end\tfuzz",
+    ]
+    return FuzzCase(
+        "".join(f"{x}\n" for x in lines),
+        sdata_limit=rng.choice(SDATA_LIMITS),
+        expand_div=rng.random() < 0.5,
+    )
+
+
+def case_for_version(case: FuzzCase, aspsx_version: str) -> FuzzCase:
+    # ASPSX doesn't support -0 before 2.30, so div/rem are always expanded
+    if not case.expand_div and parse_version(aspsx_version) < (2, 30):
+        return replace(case, expand_div=True)
+    return case
+
+
+def words_match(expected: List[str], actual: List[str]) -> bool:
+    # GNU as pads .text to 16 bytes, ASPSX doesn't
+    if actual[: len(expected)] != expected:
+        return False
+    return all(int(x, 16) == 0 for x in actual[len(expected) :])
+
+
+def elf_text_words(data: bytes) -> List[str]:
+    """
+    .text of a PSY-Q object after conversion to ELF, so that symbol+offset
+    addends are in place as they are for GNU as
+    """
+    return util.text_words(read_elf_section(psyq2elf.psyq_to_elf(data), ".text"))
+
+
+def maspsx_object(case: FuzzCase, aspsx_version: str, as_path: str) -> bytes:
+    options = MaspsxOptions(
+        aspsx_version=aspsx_version,
+        sdata_limit=case.sdata_limit,
+        expand_div=case.expand_div,
+    )
+    return assemble(process(case.text, options), as_path, AS_ARGS, native=True)
+
+
+def maspsx_words(case: FuzzCase, aspsx_version: str, as_path: str) -> List[str]:
+    obj = maspsx_object(case, aspsx_version, as_path)
+    return util.text_words(read_elf_section(obj, ".text"))
+
+
+def run_batch(
+    cases: List[FuzzCase], aspsx_version: str, as_path: str
+) -> List[FuzzResult]:
+    """
+    Assembles cases (which must share flags) with a single ASPSX session and
+    with maspsx
+    """
+    data_limit, extra_flags = cases[0].data_limit, cases[0].extra_flags
+    with tempfile.TemporaryDirectory(prefix="fuzz-") as tmp_dir:
+        paths = []
+        for i, case in enumerate(cases):
+            paths.append(Path(tmp_dir) / f"CASE{i}.S")
+            paths[-1].write_text(case.text)
+        oracle = util.run_aspsx_batch(
+            paths, aspsx_version, data_limit, extra_flags, decode=elf_text_words
+        )
+
+    results = []
+    for case, path in zip(cases, paths):
+        result = FuzzResult(case, aspsx_version)
+        expected = oracle[path]
+        if isinstance(expected, Exception):
+            result.error = f"ASPSX: {expected}"
+        else:
+            result.expected = expected
+            try:
+                result.actual = maspsx_words(case, aspsx_version, as_path)
+            except Exception as err:
+                result.error = f"maspsx: {err}"
+        results.append(result)
+    return results
+
+
+def write_reproducer(out_dir: Path, result: FuzzResult) -> Path:
+    key = result.case.key(result.aspsx_version)
+    path = out_dir / f"{key[:16]}.S"
+    path.write_text(result.case.text)
+    path.with_suffix(".json").write_text(
+        json.dumps(
+            {
+                "aspsx_version": result.aspsx_version,
+                "flags": [result.case.data_limit, result.case.extra_flags],
+                "expected": result.expected,
+                "actual": result.actual,
+                "error": result.error,
+            },
+            indent=2,
+        )
+        + "\n"
+    )
+    return path
+
+
+def make_batches(
+    cases: Iterable[FuzzCase],
+    aspsx_versions: List[str],
+    seen: Set[str],
+    batch_size: int,
+) -> List[Tuple[str, List[FuzzCase]]]:
+    """
+    Groups cases not in seen by version and flags, batch_size at a time
+    """
+    queued: Set[str] = set()
+    groups: Dict[Tuple[str, int, bool], List[FuzzCase]] = {}
+    for case in cases:
+        for aspsx_version in aspsx_versions:
+            version_case = case_for_version(case, aspsx_version)
+            key = version_case.key(aspsx_version)
+            if key in seen or key in queued:
+                continue
+            queued.add(key)
+            groups.setdefault(
+                (aspsx_version, version_case.sdata_limit, version_case.expand_div), []
+            ).append(version_case)
+
+    batches = []
+    for (aspsx_version, *_), group in groups.items():
+        for i in range(0, len(group), batch_size):
+            batches.append((aspsx_version, group[i : i + batch_size]))
+    return batches
+
+
+def fuzz(
+    aspsx_versions: List[str],
+    num_cases: int,
+    out_dir: Path,
+    seed: Optional[int] = None,
+    jobs: Optional[int] = None,
+    batch_size: int = 256,
+    as_path: str = "mipsel-linux-gnu-as",
+) -> Counter:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    seen_path = out_dir / "seen"
+    seen = set(seen_path.read_text().split()) if seen_path.exists() else set()
+
+    rng = random.Random(seed)
+    cases = [generate_case(rng) for _ in range(num_cases)]
+    batches = make_batches(cases, aspsx_versions, seen, batch_size)
+
+    stats: Counter = Counter()
+    with job_slots(jobs) as workers, ProcessPoolExecutor(
+        max_workers=workers, initializer=util.init_oracle_worker
+    ) as executor, open(seen_path, "a") as seen_file:
+        futures = {
+            executor.submit(run_batch, batch, aspsx_version, as_path): (
+                aspsx_version,
+                batch,
+            )
+            for aspsx_version, batch in batches
+        }
+        for future in as_completed(futures):
+            aspsx_version, batch = futures[future]
+            try:
+                results = future.result()
+            except Exception as err:
+                # e.g. dosemu/wine fell over, the cases aren't marked as seen
+                # so that they are tried again by the next run
+                stats["oracle error"] += len(batch)
+                sys.stderr.write(
+                    f"{aspsx_version}: {len(batch)} cases failed to run: {err}\n"
+                )
+                continue
+
+            for result in results:
+                # only once the result is recorded, so aborted runs are retried
+                seen_file.write(f"{result.case.key(result.aspsx_version)}\n")
+                if result.is_match:
+                    stats["match"] += 1
+                    continue
+                stats["error" if result.error else "mismatch"] += 1
+                path = write_reproducer(out_dir, result)
+                print(f"{result.aspsx_version}: {result.error or 'mismatch'} {path}")
+            seen_file.flush()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--aspsx-versions", default="all")
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", type=Path, default=Path("fuzz-out"))
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--gnu-as-path", default="mipsel-linux-gnu-as")
+    args = parser.parse_args()
+
+    aspsx_versions = [
+        x
+        for x in parse_version_list(args.aspsx_versions)
+        if x in util.ASPSX_RUNNER_LOOKUP
+    ]
+    missing = [x for x in aspsx_versions if not util.emulator_available(x)]
+    if missing:
+        sys.stderr.write(f"fuzz: can't run ASPSX {', '.join(missing)}\n")
+        sys.exit(1)
+
+    stats = fuzz(
+        aspsx_versions,
+        args.cases,
+        args.out,
+        seed=args.seed,
+        jobs=args.jobs,
+        batch_size=args.batch_size,
+        as_path=args.gnu_as_path,
+    )
+    print(", ".join(f"{count} {name}" for name, count in sorted(stats.items())))
+
+
+if __name__ == "__main__":
+    main()
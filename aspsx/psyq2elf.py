@@ -0,0 +1,231 @@
+"""
+Converts PSY-Q LNK objects (e.g. from ASPSX.EXE) into ELF relocatables, in the
+same way as psyq-obj-parser, so they can be compared with objdiff/asm-differ.
+
+    python3 psyq2elf.py FILE.OBJ -o file.o
+    python3 psyq2elf.py OBJ_DIR -o ELF_DIR --jobs 8
+"""
+
+import argparse
+import struct
+import sys
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import util
+
+from maspsx.elf import (
+    COMMON_SECTION,
+    EF_MIPS_ABI_O32,
+    R_MIPS_26,
+    R_MIPS_32,
+    R_MIPS_GPREL16,
+    R_MIPS_HI16,
+    R_MIPS_LO16,
+    SHF_ALLOC,
+    SHF_EXECINSTR,
+    SHF_MIPS_GPREL,
+    SHF_WRITE,
+    SHT_NOBITS,
+    SHT_PROGBITS,
+    STB_GLOBAL,
+    STB_LOCAL,
+    ElfRelocation,
+    ElfSection,
+    ElfSymbol,
+    write_elf_relocatable,
+)
+from maspsx.jobserver import job_slots
+
+PATCH_RELOCATIONS = {
+    16: R_MIPS_32,
+    74: R_MIPS_26,
+    82: R_MIPS_HI16,
+    84: R_MIPS_LO16,
+    100: R_MIPS_GPREL16,
+}
+
+# name: (sh_type, flags), anything else is treated as data
+SECTION_TYPES = {
+    ".text": (SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR),
+    ".rdata": (SHT_PROGBITS, SHF_ALLOC),
+    ".data": (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE),
+    ".sdata": (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE | SHF_MIPS_GPREL),
+    ".sbss": (SHT_NOBITS, SHF_ALLOC | SHF_WRITE | SHF_MIPS_GPREL),
+    ".bss": (SHT_NOBITS, SHF_ALLOC | SHF_WRITE),
+}
+
+WORD = struct.Struct("<I")
+
+
+def split_expression(
+    obj: util.PsyqObject, names: Dict[int, str], expression: util.PsyqExpression
+) -> Tuple[str, int]:
+    """
+    Returns the symbol (or section) name and the addend of a patch expression,
+    names maps symbol numbers to names
+    """
+    if expression.kind == "symbol":
+        if expression.value not in names:
+            raise Exception(f"Unknown symbol {expression.value}")
+        return (names[expression.value], 0)
+    if expression.kind in ("section_base", "section_start"):
+        return (obj.sections[expression.value].name, 0)
+
+    left, right = expression.left, expression.right
+    if expression.kind == "+" and left is not None and right is not None:
+        if left.kind == "constant":
+            left, right = right, left
+        if right.kind == "constant":
+            name, addend = split_expression(obj, names, left)
+            return (name, addend + right.value)
+    if expression.kind == "-" and left is not None and right is not None:
+        if right.kind == "constant":
+            name, addend = split_expression(obj, names, left)
+            return (name, addend - right.value)
+
+    raise Exception(f"Unsupported patch expression: {expression}")
+
+
+def apply_addend(data: bytearray, offset: int, elf_type: int, addend: int) -> None:
+    # REL relocations keep the addend in the instruction/word being relocated
+    if not addend:
+        return
+    (word,) = WORD.unpack_from(data, offset)
+    if elf_type == R_MIPS_32:
+        word = (word + addend) & 0xFFFFFFFF
+    elif elf_type == R_MIPS_26:
+        word = (word & 0xFC000000) | ((word + (addend >> 2)) & 0x3FFFFFF)
+    elif elf_type == R_MIPS_HI16:
+        word = (word & 0xFFFF0000) | ((word + ((addend + 0x8000) >> 16)) & 0xFFFF)
+    else:
+        word = (word & 0xFFFF0000) | ((word + addend) & 0xFFFF)
+    WORD.pack_into(data, offset, word)
+
+
+def common_alignment(size: int) -> int:
+    alignment = 1
+    while alignment < 8 and alignment * 2 <= size:
+        alignment *= 2
+    return alignment
+
+
+def psyq_to_elf(data: bytes) -> bytes:
+    obj = util.parse_psyq_object(data)
+
+    contents: Dict[int, bytearray] = {
+        index: bytearray(section.data) for index, section in obj.sections.items()
+    }
+
+    names = {x.index: x.name for x in obj.symbols if x.index is not None}
+
+    relocations: Dict[str, List[ElfRelocation]] = {}
+    for patch in obj.patches:
+        if patch.type not in PATCH_RELOCATIONS:
+            raise Exception(f"Unsupported patch type: {patch.type_name}")
+        elf_type = PATCH_RELOCATIONS[patch.type]
+        name, addend = split_expression(obj, names, patch.expression)
+        apply_addend(contents[patch.section], patch.offset, elf_type, addend)
+        relocations.setdefault(obj.sections[patch.section].name, []).append(
+            ElfRelocation(patch.offset, name, elf_type)
+        )
+
+    sections = []
+    for index, section in obj.sections.items():
+        sh_type, flags = SECTION_TYPES.get(
+            section.name, (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE)
+        )
+        sections.append(
+            ElfSection(
+                section.name,
+                sh_type,
+                flags,
+                b"" if sh_type == SHT_NOBITS else bytes(contents[index]),
+                size=section.size,
+                addralign=max(section.alignment, 1),
+            )
+        )
+
+    symbols = []
+    for symbol in obj.symbols:
+        if symbol.kind == "xref":
+            symbols.append(ElfSymbol(symbol.name, bind=STB_GLOBAL))
+        elif symbol.kind == "xbss":
+            # uninitialised data is allocated by the linker, like .comm
+            symbols.append(
+                ElfSymbol(
+                    symbol.name,
+                    value=common_alignment(symbol.offset),
+                    size=symbol.offset,
+                    bind=STB_GLOBAL,
+                    section=COMMON_SECTION,
+                )
+            )
+        else:
+            symbols.append(
+                ElfSymbol(
+                    symbol.name,
+                    value=symbol.offset,
+                    bind=STB_GLOBAL if symbol.kind == "xdef" else STB_LOCAL,
+                    section=obj.sections[symbol.section].name,
+                )
+            )
+
+    return write_elf_relocatable(
+        sections, symbols, relocations, e_flags=EF_MIPS_ABI_O32
+    )
+
+
+def convert_file(in_path: Path, out_path: Path) -> None:
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(psyq_to_elf(in_path.read_bytes()))
+
+
+def convert_directory(
+    in_dir: Path, out_dir: Path, jobs: Optional[int] = None
+) -> List[Tuple[Path, Exception]]:
+    """
+    Converts every .obj under in_dir to a .o under out_dir (keeping the same
+    layout) in parallel, returns the objects that couldn't be converted
+    """
+    failures = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for in_path in sorted(in_dir.rglob("*")):
+            if in_path.suffix.lower() != ".obj":
+                continue
+            out_path = out_dir / in_path.relative_to(in_dir).with_suffix(".o")
+            futures[executor.submit(convert_file, in_path, out_path)] = in_path
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as err:
+                failures.append((futures[future], err))
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", type=Path, help="PSY-Q object, or directory of them")
+    parser.add_argument("-o", "--output", type=Path, required=True)
+    parser.add_argument("--jobs", type=int)
+    args = parser.parse_args()
+
+    if args.input.is_dir():
+        with job_slots(args.jobs) as jobs:
+            failures = convert_directory(args.input, args.output, jobs)
+        for in_path, err in failures:
+            sys.stderr.write(f"psyq2elf: {in_path}: {err}\n")
+        if failures:
+            sys.exit(1)
+    else:
+        convert_file(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Delta-debugging reducer, shrinks an input where maspsx + GNU as doesn't match
+ASPSX down to a minimal reproducer.
+
+    python3 reduce.py func.s --aspsx-version 2.77 -G8 --out reduced.s
+    python3 reduce.py func.s --aspsx-version 2.77 --target func.o
+
+With the ASPSX oracle every candidate is assembled with ASPSX and must still
+mismatch in the same way (the same pair of opcodes at the first difference).
+With a --target dump each candidate's .text is aligned against the target's
+(with relocated fields masked, as in maspsx/compare.py) and the candidate is
+kept if it still has the original's first mismatch at an equivalent
+instruction, so lines either side of the difference can be removed.
+"""
+
+import argparse
+import hashlib
+import inspect
+import os
+import re
+import sys
+import tempfile
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from difflib import SequenceMatcher
+from itertools import zip_longest
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import fuzz
+import util
+
+from maspsx import MaspsxProcessor
+from maspsx.compare import apply_masks, masked_words, relocation_masks
+from maspsx.detect import read_target, text_words
+from maspsx.elf import ElfReader
+from maspsx.jobserver import job_slots
+from maspsx.options import MaspsxOptions
+
+SYMBOL_RE = re.compile(r"[A-Za-z_.$][A-Za-z0-9_.$]*")
+
+Words = List[str]
+Outcome = Optional[Tuple[Words, Words]]  # (expected, actual), None on error
+Mismatch = Tuple[Union[str, Tuple[str, ...]], ...]
+
+
+@dataclass(frozen=True)
+class ReduceConfig:
+    aspsx_version: str
+    sdata_limit: int = 0
+    expand_div: bool = False
+    as_path: str = "mipsel-linux-gnu-as"
+    # .text words with relocated fields zeroed, instead of ASPSX
+    target: Optional[Tuple[str, ...]] = None
+
+    def case(self, text: str) -> fuzz.FuzzCase:
+        return fuzz.FuzzCase(text, self.sdata_limit, self.expand_div)
+
+
+def evaluate_batch(config: ReduceConfig, texts: List[str]) -> List[Outcome]:
+    """
+    Assembles each text with maspsx, and (unless there is a target) with a
+    single ASPSX session
+    """
+    if config.target is not None:
+        expected: List = [list(config.target)] * len(texts)
+    else:
+        case = config.case("")
+        with tempfile.TemporaryDirectory(prefix="reduce-") as tmp_dir:
+            paths = []
+            for i, text in enumerate(texts):
+                paths.append(Path(tmp_dir) / f"CAND{i}.S")
+                paths[-1].write_text(text)
+            oracle = util.run_aspsx_batch(
+                paths,
+                config.aspsx_version,
+                case.data_limit,
+                case.extra_flags,
+                decode=fuzz.elf_text_words,
+            )
+        expected = [oracle[x] for x in paths]
+
+    outcomes: List[Outcome] = []
+    for text, words in zip(texts, expected):
+        if isinstance(words, Exception):
+            outcomes.append(None)
+            continue
+        try:
+            if config.target is not None:
+                obj = fuzz.maspsx_object(
+                    config.case(text), config.aspsx_version, config.as_path
+                )
+                actual = to_hex(masked_words(ElfReader(obj)))
+            else:
+                actual = fuzz.maspsx_words(
+                    config.case(text), config.aspsx_version, config.as_path
+                )
+        except Exception:
+            outcomes.append(None)
+            continue
+        outcomes.append((words, actual))
+    return outcomes
+
+
+def to_hex(words: List[int]) -> Words:
+    return [f"0x{x:08X}" for x in words]
+
+
+def mask_target(data: bytes, config: ReduceConfig, text: str) -> Tuple[str, ...]:
+    """
+    The target's .text words with relocated fields zeroed. A linked target
+    has no relocations, so the fields relocated in our object for the
+    original input are zeroed too (as maspsx.detect.find_first_difference does).
+    """
+    words, masks = text_words(data)
+    obj = fuzz.maspsx_object(config.case(text), config.aspsx_version, config.as_path)
+    for index, mask in relocation_masks(ElfReader(obj)).items():
+        masks[index] = masks.get(index, 0) | mask
+    return tuple(to_hex(apply_masks(words, masks)))
+
+
+def mismatches(expected: Words, actual: Words) -> List[Mismatch]:
+    """
+    Aligns actual against expected and returns what differs, in order: each
+    of our instructions that isn't in the target, and each run of target
+    instructions that we don't have (with our instructions either side of
+    it). Trailing padding is ignored.
+    """
+
+    def strip(words: Words) -> Words:
+        end = len(words)
+        while end and int(words[end - 1], 16) == 0:
+            end -= 1
+        return words[:end]
+
+    expected, actual = strip(expected), strip(actual)
+    res: List[Mismatch] = []
+    matcher = SequenceMatcher(None, expected, actual, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("replace", "insert"):
+            res += [("ours", x) for x in actual[j1:j2]]
+        elif tag == "delete" and 0 < j1 < len(actual):
+            res.append(("target", tuple(expected[i1:i2]), actual[j1 - 1], actual[j1]))
+    return res
+
+
+def has_mismatch(outcome: Outcome, mismatch: Mismatch) -> bool:
+    """
+    Whether outcome still has mismatch, removed lines leave more (and longer)
+    runs of target instructions that we don't have, so those only need to
+    contain the original run
+    """
+    if outcome is None:
+        return False
+    if mismatch[0] == "ours":
+        return mismatch in mismatches(*outcome)
+
+    _, missing, before, after = mismatch
+    for other in mismatches(*outcome):
+        if other[0] == "target" and other[2:] == (before, after):
+            run = other[1]
+            if any(
+                run[i : i + len(missing)] == missing
+                for i in range(len(run) - len(missing) + 1)
+            ):
+                return True
+    return False
+
+
+def first_difference(expected: Words, actual: Words) -> Optional[int]:
+    if fuzz.words_match(expected, actual):
+        return None
+    for i, (x, y) in enumerate(zip_longest(expected, actual, fillvalue="0x0")):
+        if int(x, 16) != int(y, 16):
+            return i
+    return None
+
+
+def signature(expected: Words, actual: Words) -> Optional[Tuple[int, int]]:
+    """
+    The opcodes of the first differing instruction, or None if they match
+    """
+    i = first_difference(expected, actual)
+    if i is None:
+        return None
+
+    def opcode(words: Words) -> int:
+        return int(words[i], 16) >> 26 if i < len(words) else -1
+
+    return (opcode(expected), opcode(actual))
+
+
+def ddmin(items: Sequence, evaluate: Callable[[List[Sequence]], List[bool]]) -> List:
+    """
+    Removes chunks of items for as long as evaluate says what's left is still
+    interesting, all the complements at one granularity are evaluated together
+    """
+    items = list(items)
+    n = 2
+    while len(items) >= 2:
+        size = -(-len(items) // n)
+        chunks = [items[i : i + size] for i in range(0, len(items), size)]
+        complements = [
+            [x for j, chunk in enumerate(chunks) if j != i for x in chunk]
+            for i in range(len(chunks))
+        ]
+        for complement, interesting in zip(complements, evaluate(complements)):
+            if interesting:
+                items = complement
+                n = max(n - 1, 2)
+                break
+        else:
+            if n >= len(items):
+                break
+            n = min(len(items), n * 2)
+    return items
+
+
+def split_units(lines: List[str]) -> Tuple[List[Tuple[int, ...]], List[int]]:
+    """
+    Returns the removable top-level units (a whole .ent/.end function, or a
+    single line) and the lines of function bodies that can be removed on
+    their own. .ent/.end, function labels and .comm/.lcomm are never removed
+    here, so the structure stays valid.
+    """
+    units: List[Tuple[int, ...]] = []
+    body: List[int] = []
+    function_start = None
+    function_name = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        op, _, rest = stripped.replace("\t", " ").partition(" ")
+        if op == ".ent":
+            function_start, function_name = i, rest.strip()
+        elif op == ".end" and function_start is not None:
+            units.append(tuple(range(function_start, i + 1)))
+            function_start = None
+        elif function_start is not None:
+            if stripped != f"{function_name}:" and stripped:
+                body.append(i)
+        elif op in (".comm", ".lcomm") or not stripped:
+            continue
+        else:
+            units.append((i,))
+    return (units, body)
+
+
+def declared_symbol(line: str) -> Optional[str]:
+    op, _, rest = line.strip().replace("\t", " ").partition(" ")
+    if op in (".comm", ".lcomm"):
+        return rest.split(",")[0].strip()
+    return None
+
+
+class Reducer:
+    def __init__(
+        self,
+        config: ReduceConfig,
+        jobs: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.config = config
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache: Dict[str, bool] = {}
+        self.evaluations = 0
+        self.executor = executor
+        self._owns_executor = executor is None
+        self.is_interesting: Callable[[Outcome], bool] = lambda x: False
+
+    def evaluate(self, texts: List[str]) -> List[bool]:
+        keys = [hashlib.sha256(x.encode("utf")).hexdigest() for x in texts]
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in self.cache:
+                pending[key] = text
+
+        if pending:
+            self.evaluations += len(pending)
+            items = list(pending.items())
+            size = -(-len(items) // self.jobs)
+            chunks = [items[i : i + size] for i in range(0, len(items), size)]
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.jobs, initializer=util.init_oracle_worker
+                )
+            futures = [
+                self.executor.submit(
+                    evaluate_batch, self.config, [text for _, text in chunk]
+                )
+                for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                for (key, _), outcome in zip(chunk, future.result()):
+                    self.cache[key] = self.is_interesting(outcome)
+        return [self.cache[x] for x in keys]
+
+    def reduce(self, text: str) -> str:
+        try:
+            return self._reduce(text)
+        finally:
+            if self._owns_executor and self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def _reduce(self, text: str) -> str:
+        lines = [x for x in text.splitlines() if x.strip()]
+
+        (outcome,) = evaluate_batch(self.config, [text])
+        if outcome is None:
+            raise Exception(
+                "The input doesn't assemble with both maspsx and the oracle"
+            )
+        expected, actual = outcome
+        original = signature(expected, actual)
+        if original is None:
+            raise Exception("maspsx already matches for this input")
+
+        if self.config.target is not None:
+            mismatch = mismatches(expected, actual)[0]
+            self.is_interesting = lambda x: has_mismatch(x, mismatch)
+        else:
+            self.is_interesting = lambda x: x is not None and signature(*x) == original
+
+        def render(keep) -> str:
+            keep = set(keep)
+            return "".join(f"{x}\n" for i, x in enumerate(lines) if i in keep)
+
+        everything = set(range(len(lines)))
+
+        # whole functions and top-level lines first, then the function bodies
+        units, _ = split_units(lines)
+        fixed = everything - {i for unit in units for i in unit}
+        units = ddmin(
+            units,
+            lambda candidates: self.evaluate(
+                [render(fixed | {i for unit in x for i in unit}) for x in candidates]
+            ),
+        )
+        lines = [
+            x for i, x in enumerate(lines) if i in fixed | {j for u in units for j in u}
+        ]
+
+        _, body = split_units(lines)
+        fixed = set(range(len(lines))) - set(body)
+        body = ddmin(
+            body,
+            lambda candidates: self.evaluate(
+                [render(fixed | set(x)) for x in candidates]
+            ),
+        )
+        lines = [x for i, x in enumerate(lines) if i in fixed | set(body)]
+
+        # .comm/.lcomm that nothing references any more
+        referenced = set()
+        for line in lines:
+            if declared_symbol(line) is None:
+                referenced.update(SYMBOL_RE.findall(line))
+        unused = {
+            i
+            for i, line in enumerate(lines)
+            if declared_symbol(line) not in (None, *referenced)
+        }
+        keep = set(range(len(lines))) - unused
+        if unused and self.evaluate([render(keep)])[0]:
+            lines = [x for i, x in enumerate(lines) if i in keep]
+
+        return "".join(f"{x}\n" for x in lines)
+
+
+def format_test(text: str, config: ReduceConfig, name: str) -> str:
+    """
+    A test in the style of tests/, expecting the .text that ASPSX (or the
+    target) has, so it fails until maspsx is fixed
+    """
+    options = MaspsxOptions(
+        aspsx_version=config.aspsx_version,
+        sdata_limit=config.sdata_limit,
+        expand_div=config.expand_div,
+    )
+    (outcome,) = evaluate_batch(config, [text])
+    if outcome is None:
+        raise Exception("Unable to get the expected .text for the reduced input")
+    expected, actual = outcome
+
+    kwargs = options_kwargs(options)
+    source = "the target" if config.target is not None else "ASPSX"
+
+    out = [
+        f"    def test_{name}(self):",
+        '        """',
+        f"        Reduced mismatch for ASPSX {config.aspsx_version}, currently",
+        f"        maspsx: {' '.join(actual)}",
+        '        """',
+        "        lines = [",
+    ]
+    out += [f'            "{escape(x)}",' for x in text.splitlines()]
+    out += ["        ]", f"        expected_words = [  # from {source}"]
+    out += [f'            "{x}",' for x in expected]
+    out += [
+        "        ]",
+        f"        mp = MaspsxProcessor({', '.join(['lines', *kwargs])})",
+        "        res = mp.process_lines()",
+        "",
+        "        self.assertEqual(expected_words, text_words(res))",
+    ]
+    return "\n".join(out) + "\n"
+
+
+def options_kwargs(options: MaspsxOptions) -> List[str]:
+    """
+    The MaspsxProcessor kwargs that differ from its defaults
+    """
+    defaults = inspect.signature(MaspsxProcessor).parameters
+    return [
+        f"{key}={value!r}"
+        for key, value in options.processor_kwargs().items()
+        if key in defaults and defaults[key].default != value
+    ]
+
+
+def escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", type=Path)
+    parser.add_argument("--aspsx-version", required=True)
+    parser.add_argument("-G", type=int, default=0, dest="sdata_limit")
+    parser.add_argument("--expand-div", action="store_true")
+    parser.add_argument("--target", type=Path, help="ELF object, .s or raw .text")
+    parser.add_argument("--gnu-as-path", default="mipsel-linux-gnu-as")
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--test-name", default="reduced")
+    args = parser.parse_args()
+
+    if not args.target and not util.emulator_available(args.aspsx_version):
+        sys.stderr.write(
+            f"reduce: can't run ASPSX {args.aspsx_version}, pass --target\n"
+        )
+        sys.exit(1)
+
+    config = ReduceConfig(
+        args.aspsx_version,
+        sdata_limit=args.sdata_limit,
+        expand_div=args.expand_div,
+        as_path=args.gnu_as_path,
+    )
+    text = args.input.read_text()
+    if args.target:
+        data = read_target(args.target, args.gnu_as_path, fuzz.AS_ARGS + ["-G0"])
+        config = replace(config, target=mask_target(data, config, text))
+
+    with job_slots(args.jobs) as jobs:
+        reducer = Reducer(config, jobs=jobs)
+        reduced = reducer.reduce(text)
+
+    sys.stderr.write(
+        f"reduce: {len(text.splitlines())} -> {len(reduced.splitlines())} lines "
+        f"in {reducer.evaluations} evaluations\n"
+    )
+    if args.out:
+        args.out.write_text(reduced)
+    else:
+        sys.stdout.write(reduced)
+    sys.stdout.write("\n" + format_test(reduced, config, args.test_name))
+
+
+if __name__ == "__main__":
+    main()
@@ -71,9 +71,14 @@ class TestExpandLw(unittest.TestCase):
     def test_expand_lw(self):
         source_asm: Path = Path(__file__).parent / TESTS["source_asm"]
 
+        # run anything that hasn't been recorded in parallel up front
+        util.record_missing(
+            util.OracleJob(source_asm, x["aspsx_version"]) for x in TESTS["versions"]
+        )
+
         for version in TESTS["versions"]:
             with self.subTest(version=version):
                 target_asm = version["target_asm"]
                 print(f"{source_asm.name}: {version['aspsx_version']}")
-                instructions = util.run_aspsx(source_asm, version)
+                instructions = util.aspsx_instructions(source_asm, version)
                 self.assertEqual(target_asm, instructions)
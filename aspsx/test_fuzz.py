@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+import random
+import tempfile
+import unittest
+
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import fuzz
+
+from maspsx.api import process
+from maspsx.options import MaspsxOptions
+
+CASE = fuzz.FuzzCase(
+    "\t.comm\tfuzzVar0,40\n"
+    "\t.text\n"
+    "\t.ent\tfuzz\n"
+    "fuzz:\n"
+    "\tlw\t$2,fuzzVar0+8\n"
+    "\tli\t$3,0x10001\n"
+    "\tj\t$31\n"
+    "\t.end\tfuzz\n",
+    sdata_limit=8,
+)
+
+
+class TestFuzz(unittest.TestCase):
+    def test_generate(self):
+        cases = [fuzz.generate_case(random.Random(1)) for _ in range(2)]
+        self.assertEqual(cases[0], cases[1])
+
+        rng = random.Random(2)
+        for _ in range(50):
+            case = fuzz.generate_case(rng)
+            options = MaspsxOptions(
+                aspsx_version="2.77",
+                sdata_limit=case.sdata_limit,
+                expand_div=case.expand_div,
+            )
+            self.assertIn(".end\tfuzz\n", process(case.text, options))
+
+    def test_words_match(self):
+        self.assertTrue(fuzz.words_match(["0x1"], ["0x1", "0x00000000"]))
+        self.assertFalse(fuzz.words_match(["0x1"], ["0x1", "0x2"]))
+        self.assertFalse(fuzz.words_match(["0x1", "0x0"], ["0x1"]))
+
+    def test_batches(self):
+        other = fuzz.FuzzCase(CASE.text, sdata_limit=0)
+        seen = {CASE.key("2.56")}
+        batches = fuzz.make_batches([CASE, other], ["2.56", "2.77"], seen, 1)
+        self.assertEqual(
+            [("2.77", [CASE]), ("2.56", [other]), ("2.77", [other])],
+            sorted(batches, key=lambda x: x[1][0].sdata_limit, reverse=True),
+        )
+        # cases are only ever tried once
+        batches = fuzz.make_batches([CASE, CASE], ["2.56", "2.77"], set(), 2)
+        self.assertEqual([[CASE], [CASE]], [x for _, x in batches])
+
+    def test_batches_without_0(self):
+        ((aspsx_version, (case,)), *rest) = fuzz.make_batches(
+            [CASE], ["2.21", "2.56"], set(), 1
+        )
+        # 2.21 doesn't support -0
+        self.assertEqual("2.21", aspsx_version)
+        self.assertEqual("", case.extra_flags)
+        self.assertEqual("-0", rest[0][1][0].extra_flags)
+
+    def test_oracle_failure(self):
+        def run_batch(cases, aspsx_version, as_path):
+            if aspsx_version == "2.56":
+                raise Exception("dosemu crashed")
+            return [fuzz.FuzzResult(x, aspsx_version, ["0x0"], ["0x0"]) for x in cases]
+
+        with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.object(
+            fuzz, "ProcessPoolExecutor", ThreadPoolExecutor
+        ), mock.patch.object(fuzz, "run_batch", run_batch), mock.patch.object(
+            fuzz, "generate_case", lambda rng: CASE
+        ):
+            out_dir = Path(tmp_dir)
+            stats = fuzz.fuzz(["2.56", "2.77"], 1, out_dir)
+            self.assertEqual({"match": 1, "oracle error": 1}, dict(stats))
+            # the case that failed to run is tried again
+            self.assertEqual(CASE.key("2.77"), (out_dir / "seen").read_text().strip())
+
+    def test_run_batch(self):
+        actual = fuzz.maspsx_words(CASE, "2.77", "mipsel-linux-gnu-as")
+
+        def run_aspsx_batch(paths, *args, **kwargs):
+            return {paths[0]: ["0x00000000", *actual[1:]]}
+
+        with mock.patch.object(fuzz.util, "run_aspsx_batch", run_aspsx_batch):
+            (result,) = fuzz.run_batch([CASE], "2.77", "mipsel-linux-gnu-as")
+        self.assertFalse(result.is_match)
+        self.assertEqual(actual, result.actual)
@@ -0,0 +1,56 @@
+from pathlib import Path
+import struct
+import tempfile
+import unittest
+
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import psyq2elf
+
+from maspsx.elf import read_elf_sections
+from test_util import OBJECT, TEXT
+
+
+class TestPsyq2Elf(unittest.TestCase):
+    def test_convert(self):
+        sections = read_elf_sections(psyq2elf.psyq_to_elf(OBJECT))
+
+        self.assertEqual(TEXT, sections[".text"])
+        self.assertEqual(b"\0\0\0\0\x01\x02\x03\x04", sections[".rdata"])
+        relocations = [
+            (offset, info & 0xFF)
+            for offset, info in struct.iter_unpack("<II", sections[".rel.text"])
+        ]
+        self.assertEqual(
+            [
+                (0, psyq2elf.R_MIPS_HI16),
+                (4, psyq2elf.R_MIPS_LO16),
+                (8, psyq2elf.R_MIPS_26),
+            ],
+            relocations,
+        )
+
+    def test_addends(self):
+        data = bytearray(struct.pack("<3I", 0x3C040000, 0x24840000, 0x0C000000))
+        psyq2elf.apply_addend(data, 0, psyq2elf.R_MIPS_HI16, 0x18000)
+        psyq2elf.apply_addend(data, 4, psyq2elf.R_MIPS_LO16, 0x18000)
+        psyq2elf.apply_addend(data, 8, psyq2elf.R_MIPS_26, 0x10)
+        self.assertEqual(
+            (0x3C040002, 0x24848000, 0x0C000004), struct.unpack("<3I", data)
+        )
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            in_dir = Path(tmp_dir) / "obj"
+            (in_dir / "sub").mkdir(parents=True)
+            (in_dir / "sub" / "FUNC.OBJ").write_bytes(OBJECT)
+            (in_dir / "BAD.OBJ").write_bytes(b"LNK\x02\xff")
+
+            out_dir = Path(tmp_dir) / "elf"
+            failures = psyq2elf.convert_directory(in_dir, out_dir, jobs=2)
+
+            self.assertEqual([in_dir / "BAD.OBJ"], [x for x, _ in failures])
+            elf = (out_dir / "sub" / "FUNC.o").read_bytes()
+            self.assertEqual(TEXT, read_elf_sections(elf)[".text"])
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from unittest import mock
+import struct
+import unittest
+
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import fuzz
+import reduce
+
+from maspsx.compare import relocation_masks
+from maspsx.elf import ElfReader
+
+INPUT = """\t.comm\tfuzzVar0,40
+\t.text
+\t.align\t2
+\t.globl\tfuzz
+\t.ent\tfuzz
+fuzz:
+\taddu\t$2,$3,$4
+\tlw\t$2,fuzzVar0+8
+\tli\t$3,0x10001
+\tsw\t$4,100($5)
+\tj\t$31
+\t.end\tfuzz
+\t.ent\tother
+other:
+\tj\t$31
+\t.end\tother
+"""
+
+CONFIG = reduce.ReduceConfig("2.77")
+
+
+def run_aspsx_batch(paths, *args, **kwargs):
+    """
+    Pretends ASPSX matches maspsx, other than for li $3,0x10001
+    """
+    results = {}
+    for path in paths:
+        text = path.read_text()
+        words = fuzz.maspsx_words(CONFIG.case(text), "2.77", CONFIG.as_path)
+        if "0x3C030001" in words:  # lui $3,0x1
+            words[words.index("0x3C030001")] = "0xFFFFFFFF"
+        results[path] = words
+    return results
+
+
+class TestReduce(unittest.TestCase):
+    def test_ddmin(self):
+        def evaluate(candidates):
+            return [3 in x and 7 in x for x in candidates]
+
+        self.assertEqual([3, 7], reduce.ddmin(range(10), evaluate))
+
+    def test_split_units(self):
+        lines = INPUT.splitlines()
+        units, body = reduce.split_units(lines)
+        # .comm is never a unit, functions are removed whole
+        self.assertEqual(
+            [(1,), (2,), (3,), tuple(range(4, 12)), (12, 13, 14, 15)], units
+        )
+        self.assertEqual([6, 7, 8, 9, 10, 14], body)
+
+    def test_reduce(self):
+        with ThreadPoolExecutor() as executor:
+            reducer = reduce.Reducer(CONFIG, jobs=2, executor=executor)
+            with mock.patch.object(reduce.util, "run_aspsx_batch", run_aspsx_batch):
+                reduced = reducer.reduce(INPUT)
+
+        self.assertEqual(
+            "\t.ent\tfuzz\nfuzz:\n\tli\t$3,0x10001\n\t.end\tfuzz\n", reduced
+        )
+
+    def test_reduce_target(self):
+        obj = fuzz.maspsx_object(CONFIG.case(INPUT), "2.77", CONFIG.as_path)
+        reader = ElfReader(obj)
+        words = reader.words(".text")
+        # a linked dump, with the relocated fields filled in
+        for index in relocation_masks(reader):
+            words[index] |= 0x1234
+        words[words.index(0x3C030001)] = 0xFFFFFFFF
+        data = struct.pack(f"<{len(words)}I", *words)
+
+        config = replace(CONFIG, target=reduce.mask_target(data, CONFIG, INPUT))
+        with ThreadPoolExecutor() as executor:
+            reducer = reduce.Reducer(config, jobs=2, executor=executor)
+            reduced = reducer.reduce(INPUT)
+
+        # the lines before the difference are removed too
+        self.assertEqual(
+            "\t.ent\tfuzz\nfuzz:\n\tli\t$3,0x10001\n\t.end\tfuzz\n", reduced
+        )
+
+    def test_mismatches(self):
+        target = ["0x1", "0x2", "0x3", "0x4"]
+        self.assertEqual([], reduce.mismatches(target, [*target, "0x0"]))
+        self.assertEqual(
+            [("ours", "0x5")], reduce.mismatches(target, ["0x1", "0x5", "0x4"])
+        )
+        mismatch = ("target", ("0x3",), "0x2", "0x4")
+        self.assertEqual([mismatch], reduce.mismatches(target, ["0x1", "0x2", "0x4"]))
+        # with 0x1 removed, it's still missing between 0x2 and 0x4
+        self.assertTrue(reduce.has_mismatch((target, ["0x2", "0x4"]), mismatch))
+        self.assertFalse(reduce.has_mismatch((target, ["0x2", "0x3"]), mismatch))
+
+    def test_format_test(self):
+        with mock.patch.object(reduce.util, "run_aspsx_batch", run_aspsx_batch):
+            test = reduce.format_test(
+                "\t.ent\tfuzz\nfuzz:\n\tli\t$3,0x10001\n\t.end\tfuzz\n", CONFIG, "li"
+            )
+        self.assertIn("    def test_li(self):", test)
+        self.assertIn('            "\tli\t$3,0x10001",', test)
+        self.assertIn("expected_words = [  # from ASPSX", test)
+        self.assertIn('            "0xFFFFFFFF",', test)
+        self.assertIn("mp = MaspsxProcessor(lines, ", test)
+
+        # the generated test fails until maspsx matches ASPSX
+        source = (
+            "import unittest\n"
+            "from maspsx import MaspsxProcessor\n"
+            "from tests.util import text_words\n"
+            "class TestReduced(unittest.TestCase):\n" + test
+        )
+        namespace = {}
+        exec(source, namespace)
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(
+            namespace["TestReduced"]
+        )
+        result = unittest.TestResult()
+        suite.run(result)
+        self.assertEqual((1, 0), (len(result.failures), len(result.errors)))
@@ -0,0 +1,240 @@
+from pathlib import Path
+from unittest import mock
+import os
+import struct
+import tempfile
+import unittest
+
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import util
+
+
+def pstring(value):
+    return bytes([len(value)]) + value.encode("latin-1")
+
+
+def section(index, name, alignment=8):
+    return struct.pack("<BHHB", 16, index, 0, alignment) + pstring(name)
+
+
+def code(data):
+    return struct.pack("<BH", 2, len(data)) + data
+
+
+# lui $a0, %hi(sym) ; addiu $a0, $a0, %lo(sym) ; jal func ; nop
+TEXT = struct.pack("<4I", 0x3C040000, 0x24840000, 0x0C000000, 0)
+
+OBJECT = b"".join(
+    [
+        b"LNK\x02",
+        bytes([46, 7]),  # PROGRAMTYPE
+        section(1, ".rdata"),
+        section(2, ".text"),
+        section(3, ".bss"),
+        struct.pack("<BH", 28, 9) + pstring("FUNC.S"),
+        struct.pack("<BH", 6, 2),  # SWITCH .text
+        code(TEXT[:8]),
+        struct.pack("<BBHBH", 10, 82, 0, 4, 1),  # HI16 .rdata base
+        struct.pack("<BBHBH", 10, 84, 4, 4, 1),
+        struct.pack("<BH", 50, 0),  # INC_SLD_LINENUM
+        code(TEXT[8:]),
+        struct.pack("<BBHB", 10, 74, 0, 44)  # REL26 func + 0
+        + struct.pack("<BHBI", 2, 5, 0, 0),
+        struct.pack("<BH", 6, 1),  # SWITCH .rdata
+        struct.pack("<BI", 8, 4),  # ZEROES
+        code(b"\x01\x02\x03\x04"),
+        struct.pack("<BHHI", 12, 4, 2, 0) + pstring("caller"),
+        struct.pack("<BH", 14, 5) + pstring("func"),
+        struct.pack("<BHHI", 48, 6, 3, 16) + pstring("buffer"),
+        struct.pack("<BHI", 18, 1, 4) + pstring("$LC0"),
+        b"\x00",
+    ]
+)
+
+
+def library(*modules):
+    data = b"LIB\x01"
+    for name, exports, obj in modules:
+        exports_data = b"".join(pstring(x) for x in exports) + b"\x00"
+        header_size = 20 + len(exports_data)
+        data += struct.pack(
+            "<8sIII", name.ljust(8).encode(), 0, header_size, header_size + len(obj)
+        )
+        data += exports_data + obj
+    return data
+
+
+class TestPsyqObject(unittest.TestCase):
+    def test_object(self):
+        obj = util.parse_psyq_object(OBJECT)
+
+        self.assertEqual(TEXT, obj.section(".text").data)
+        self.assertEqual(b"\0\0\0\0\x01\x02\x03\x04", obj.section(".rdata").data)
+        self.assertEqual(0, obj.section(".bss").size)
+        self.assertEqual({9: "FUNC.S"}, obj.filenames)
+
+        self.assertEqual(
+            [(2, 0, "HI16"), (2, 4, "LO16"), (2, 8, "REL26")],
+            [(x.section, x.offset, x.type_name) for x in obj.patches],
+        )
+        self.assertEqual("section_base[1]", str(obj.patches[0].expression))
+        self.assertEqual("(symbol[5] + 0x0)", str(obj.patches[2].expression))
+
+        self.assertEqual(
+            [
+                ("caller", "xdef", 4, 2, 0),
+                ("func", "xref", 5, None, 0),
+                ("buffer", "xbss", 6, 3, 16),
+                ("$LC0", "local", None, 1, 4),
+            ],
+            [(x.name, x.kind, x.index, x.section, x.offset) for x in obj.symbols],
+        )
+
+    def test_read_text_section(self):
+        self.assertEqual(TEXT, util.read_text_section(OBJECT))
+
+    def test_errors(self):
+        with self.assertRaises(Exception):
+            util.parse_psyq_object(b"ELF\x02")
+        with self.assertRaisesRegex(Exception, "Unknown LNK opcode 255"):
+            util.parse_psyq_object(b"LNK\x02\xff")
+
+    def test_library(self):
+        lib = util.PsyqLibrary(
+            library(("FUNC", ["caller"], OBJECT), ("EMPTY", [], b"LNK\x02\x00"))
+        )
+        self.assertEqual(["FUNC", "EMPTY"], list(lib))
+        self.assertEqual("FUNC", lib.exports["caller"])
+        # nothing is parsed until it is asked for
+        self.assertEqual({}, lib._objects)
+        self.assertEqual(TEXT, lib.module_for("caller").section(".text").data)
+        self.assertEqual([], lib["EMPTY"].symbols)
+
+
+class TestOracleStore(unittest.TestCase):
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = util.OracleStore(Path(tmp_dir) / "fixtures")
+            source_asm = Path(tmp_dir) / "LA.S"
+            source_asm.write_text("\tla\t$4,sym\n")
+
+            key = util.oracle_key(source_asm.read_bytes(), "2.77", "-G999")
+            self.assertNotEqual(key, util.oracle_key(source_asm.read_bytes(), "2.77"))
+            self.assertNotEqual(
+                key, util.oracle_key(source_asm.read_bytes(), "2.77", "-G999", "-0")
+            )
+
+            store.put(key, ["0x27840000"], source=source_asm.name)
+            self.assertEqual(
+                ["0x27840000"],
+                util.aspsx_instructions(
+                    source_asm, {"aspsx_version": "2.77"}, "-G999", store=store
+                ),
+            )
+
+    def test_missing_recording(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = util.OracleStore(Path(tmp_dir) / "fixtures")
+            source_asm = Path(tmp_dir) / "LA.S"
+            source_asm.write_text("\tla\t$4,sym\n")
+
+            with mock.patch("util.emulator_available", return_value=False):
+                with self.assertRaises(AssertionError):
+                    util.aspsx_instructions(
+                        source_asm, {"aspsx_version": "2.77"}, store=store
+                    )
+
+    def test_rerecord_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = util.OracleStore(Path(tmp_dir) / "fixtures")
+            source_asm = Path(tmp_dir) / "LA.S"
+            source_asm.write_text("\tla\t$4,sym\n")
+            key = util.oracle_key(source_asm.read_bytes(), "2.77")
+            fixture_path = store.path / f"{key}.json"
+
+            store.put(key, ["0x27840000"], source=source_asm.name)
+            # recorded by an earlier run
+            util.OracleStore.recorded_keys.discard(key)
+
+            with mock.patch.dict(os.environ, {"ASPSX_RERECORD": "1"}), mock.patch(
+                "util.emulator_available", return_value=True
+            ), mock.patch("util.run_aspsx", return_value=["0x27840001"]) as run:
+                version = {"aspsx_version": "2.77"}
+                self.assertEqual(
+                    ["0x27840001"],
+                    util.aspsx_instructions(source_asm, version, store=store),
+                )
+                # e.g. record_missing re-recorded it, so it isn't run again
+                self.assertEqual(
+                    ["0x27840001"],
+                    util.aspsx_instructions(source_asm, version, store=store),
+                )
+                self.assertEqual(1, run.call_count)
+            self.assertTrue(fixture_path.exists())
+
+
+class TestOracleMatrix(unittest.TestCase):
+    def test_errors_are_returned(self):
+        jobs = [
+            util.OracleJob(Path("MISSING.S"), "2.77"),
+            util.OracleJob(Path("MISSING.S"), "2.08", data_limit="-G8"),
+        ]
+        results = dict(util.run_oracle_matrix(jobs, max_workers=2))
+        self.assertEqual(set(jobs), set(results))
+        self.assertTrue(all(isinstance(x, Exception) for x in results.values()))
+
+
+# "assembles" each line of the batch file by wrapping the source in an object
+FAKE_DOSEMU = """#!{python}
+import struct, sys
+from pathlib import Path
+args = sys.argv[1:]
+drive = Path(args[args.index("-K") + 1])
+for line in (drive / args[args.index("-E") + 1]).read_bytes().decode().splitlines():
+    *_, obj, src = line.split()
+    if "BAD" in (drive / src).read_text():
+        continue
+    text = bytes.fromhex((drive / src).read_text().strip())
+    data = b"LNK\\x02" + struct.pack("<BHHBB", 16, 1, 0, 8, 5) + b".text"
+    data += struct.pack("<BH", 6, 1) + struct.pack("<BH", 2, len(text)) + text
+    (drive / obj.lower()).write_bytes(data + b"\\x00")
+"""
+
+
+class TestOracleBatch(unittest.TestCase):
+    def test_dosemu_batch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir)
+            (tmp_path / "bin").mkdir()
+            fake_dosemu = tmp_path / "bin" / "dosemu"
+            fake_dosemu.write_text(FAKE_DOSEMU.format(python=sys.executable))
+            fake_dosemu.chmod(0o755)
+            (tmp_path / "psyq" / "2.08").mkdir(parents=True)
+            (tmp_path / "psyq" / "2.08" / "ASPSX.EXE").write_bytes(b"")
+
+            sources = []
+            for i, text in enumerate(["0000043c", "00008424 0000043c", "BAD"]):
+                sources.append(tmp_path / f"SOURCE{i}.S")
+                sources[-1].write_text(text)
+
+            env = {"PATH": f"{tmp_path / 'bin'}:{os.environ['PATH']}"}
+            with mock.patch.object(util, "PSYQ_DIR", tmp_path / "psyq"):
+                with mock.patch.dict(os.environ, env):
+                    results = util.run_aspsx_batch(sources, "2.08", "-G8")
+
+            self.assertEqual(["0x3C040000"], results[sources[0]])
+            self.assertEqual(["0x24840000", "0x3C040000"], results[sources[1]])
+            self.assertIsInstance(results[sources[2]], Exception)
+
+    def test_batch_errors_are_returned(self):
+        jobs = [
+            util.OracleJob(Path("MISSING.S"), "2.77"),
+            util.OracleJob(Path("MISSING2.S"), "2.77"),
+            util.OracleJob(Path("MISSING.S"), "2.08", data_limit="-G8"),
+        ]
+        results = dict(util.run_oracle_batches(jobs, max_workers=2))
+        self.assertEqual(set(jobs), set(results))
+        self.assertTrue(all(isinstance(x, Exception) for x in results.values()))
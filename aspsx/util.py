@@ -1,7 +1,34 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import hashlib
+import json
+import multiprocessing.util
+import os
+import struct
 import subprocess
 import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maspsx.jobserver import job_slots
+
+PSYQ_DIR = Path(__file__).parent / "psyq"  # populated by download.sh
 
 ASPSX_RUNNER_LOOKUP = {
     # 16 bit
@@ -38,130 +65,410 @@ ASPSX_PSYQ_VERSION_LOOKUP = {
 }
 
 
-def read_text_section(data: bytes) -> bytes:
-    # with thanks to https://github.com/grumpycoders/pcsx-redux/blob/main/tools/psyq-obj-parser/psyq-obj-parser.cc
-    ptr = 0
+# LNK opcodes, with thanks to
+# https://github.com/grumpycoders/pcsx-redux/blob/main/tools/psyq-obj-parser/psyq-obj-parser.cc
+OP_END = 0
+OP_BYTES = 2
+OP_SWITCH = 6
+OP_ZEROES = 8
+OP_PATCH = 10
+OP_XDEF = 12
+OP_XREF = 14
+OP_SECTION = 16
+OP_LOCAL_SYMBOL = 18
+OP_FILENAME = 28
+OP_PROGRAMTYPE = 46
+OP_XBSS = 48
+OP_INC_SLD_LINENUM = 50
+OP_INC_SLD_LINENUM_BY_BYTE = 52
+OP_INC_SLD_LINENUM_BY_WORD = 54
+OP_SET_SLD_LINENUM = 56
+OP_SET_SLD_LINENUM_FILE = 58
+OP_END_SLD = 60
+OP_FUNCTION_START = 74
+OP_FUNCTION_END = 76
+OP_BLOCK_START = 78
+OP_BLOCK_END = 80
+OP_DEF = 82
+OP_DEF2 = 84
+
+# opcodes that carry nothing of interest here, and their fixed sizes
+SKIPPED_OPCODES = {
+    OP_PROGRAMTYPE: 1,
+    OP_INC_SLD_LINENUM: 2,
+    OP_INC_SLD_LINENUM_BY_BYTE: 3,
+    OP_INC_SLD_LINENUM_BY_WORD: 4,
+    OP_SET_SLD_LINENUM: 6,
+    OP_SET_SLD_LINENUM_FILE: 8,
+    OP_END_SLD: 2,
+    OP_FUNCTION_END: 10,
+    OP_BLOCK_START: 10,
+    OP_BLOCK_END: 10,
+}
 
-    signature = data[ptr : ptr + 3]
-    if signature != b"LNK":
-        raise Exception("Not a psyq object!")
-    ptr += 3
+PATCH_TYPES = {
+    8: "REL32_BE",
+    16: "REL32",
+    74: "REL26",
+    82: "HI16",
+    84: "LO16",
+    92: "REL26_BE",
+    96: "HI16_BE",
+    98: "LO16_BE",
+    100: "GPREL16",
+}
 
-    version = data[ptr]
-    if version != 2:
-        raise Exception("Unknown version")
+# expression opcodes
+EXPR_CONSTANT = 0
+EXPR_SYMBOL = 2
+EXPR_SECTION_BASE = 4
+EXPR_SECTION_START = 12
+EXPR_SECTION_END = 22
+EXPR_OPERATORS = {44: "+", 46: "-", 50: "/"}
+
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+SECTION_HEADER = struct.Struct("<HHB")  # index, group, alignment
+XDEF_HEADER = struct.Struct("<HHI")  # symbol, section, offset
+XBSS_HEADER = struct.Struct("<HHI")  # symbol, section, size
+LOCAL_HEADER = struct.Struct("<HI")  # section, offset
+PATCH_HEADER = struct.Struct("<BH")  # type, offset
+FUNCTION_HEADER = struct.Struct("<HIHIHIHII")
+DEF_HEADER = struct.Struct("<HIHHI")  # section, value, class, type, size
+LIB_MODULE_HEADER = struct.Struct("<8sIII")  # name, date, header size, size
+
+
+@dataclass
+class PsyqExpression:
+    """
+    A patch expression, kind is "constant", "symbol", "section_base",
+    "section_start", "section_end" or one of EXPR_OPERATORS' values
+    """
+
+    kind: str
+    value: int = 0  # the constant, symbol or section index
+    left: Optional["PsyqExpression"] = None
+    right: Optional["PsyqExpression"] = None
+
+    def __str__(self) -> str:
+        if self.left is not None:
+            return f"({self.left} {self.kind} {self.right})"
+        if self.kind == "constant":
+            return f"0x{self.value:X}"
+        return f"{self.kind}[{self.value}]"
+
+
+@dataclass
+class PsyqSection:
+    index: int
+    name: str
+    group: int = 0
+    alignment: int = 0
+    chunks: List[memoryview] = field(default_factory=list)
+    size: int = 0  # including ZEROES, XBSS symbols are allocated by the linker
+
+    @property
+    def data(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+@dataclass
+class PsyqSymbol:
+    name: str
+    kind: str  # "xdef", "xref", "xbss" or "local"
+    index: Optional[int] = None  # symbol number used by patches, not for locals
+    section: Optional[int] = None
+    offset: int = 0  # or size for xbss
+
+
+@dataclass
+class PsyqPatch:
+    section: int
+    offset: int  # from the start of the section
+    type: int  # see PATCH_TYPES
+    expression: PsyqExpression
+
+    @property
+    def type_name(self) -> str:
+        return PATCH_TYPES.get(self.type, str(self.type))
+
+
+@dataclass
+class PsyqObject:
+    sections: Dict[int, PsyqSection] = field(default_factory=dict)
+    symbols: List[PsyqSymbol] = field(default_factory=list)
+    patches: List[PsyqPatch] = field(default_factory=list)
+    filenames: Dict[int, str] = field(default_factory=dict)
+    functions: List[Tuple[str, int, int]] = field(default_factory=list)
+
+    def section(self, name: str) -> PsyqSection:
+        for section in self.sections.values():
+            if section.name == name:
+                return section
+        raise Exception(f"Didn't find a {name} section!")
+
+    def section_data(self) -> Dict[str, bytes]:
+        return {x.name: x.data for x in self.sections.values()}
+
+
+def _read_string(view: memoryview, ptr: int) -> Tuple[str, int]:
+    (length,) = U8.unpack_from(view, ptr)
+    ptr += 1
+    return (str(view[ptr : ptr + length], "latin-1"), ptr + length)
+
+
+def _read_expression(view: memoryview, ptr: int) -> Tuple[PsyqExpression, int]:
+    (op,) = U8.unpack_from(view, ptr)
     ptr += 1
+    if op == EXPR_CONSTANT:
+        (value,) = U32.unpack_from(view, ptr)
+        return (PsyqExpression("constant", value), ptr + 4)
+    if op in (EXPR_SYMBOL, EXPR_SECTION_BASE, EXPR_SECTION_START, EXPR_SECTION_END):
+        (value,) = U16.unpack_from(view, ptr)
+        kind = {
+            EXPR_SYMBOL: "symbol",
+            EXPR_SECTION_BASE: "section_base",
+            EXPR_SECTION_START: "section_start",
+            EXPR_SECTION_END: "section_end",
+        }[op]
+        return (PsyqExpression(kind, value), ptr + 2)
+    if op in EXPR_OPERATORS:
+        left, ptr = _read_expression(view, ptr)
+        right, ptr = _read_expression(view, ptr)
+        return (PsyqExpression(EXPR_OPERATORS[op], left=left, right=right), ptr)
+    raise Exception(f"Unknown expression opcode {op} at offset 0x{ptr - 1:X}")
+
+
+def parse_psyq_object(data: Union[bytes, memoryview]) -> PsyqObject:
+    """
+    Parses a PSY-Q LNK object, section payloads are views into data
+    """
+    view = memoryview(data)
+
+    if bytes(view[0:3]) != b"LNK":
+        raise Exception("Not a psyq object!")
+    if view[3] != 2:
+        raise Exception("Unknown version")
+    ptr = 4
 
-    sections = {}
-    current_section = None
+    obj = PsyqObject()
+    current: Optional[PsyqSection] = None
+    chunk_start = 0  # patch offsets are relative to the last BYTES record
 
-    while ptr < len(data):
-        opcode = data[ptr]
+    while ptr < len(view):
+        opcode = view[ptr]
         ptr += 1
 
-        if opcode == 46:  # "PROGRAMTYPE"
-            ptr += 1
+        if opcode == OP_END:
+            break
 
-        elif opcode == 16:  # "SECTION"
-            section_index = int.from_bytes(data[ptr : ptr + 2], byteorder="little")
+        elif opcode == OP_BYTES:
+            (size,) = U16.unpack_from(view, ptr)
             ptr += 2
+            if current is None:
+                raise Exception("BYTES before any SWITCH")
+            chunk_start = current.size
+            current.chunks.append(view[ptr : ptr + size])
+            current.size += size
+            ptr += size
 
-            # group = data[ptr:ptr + 2]
+        elif opcode == OP_SWITCH:
+            (index,) = U16.unpack_from(view, ptr)
             ptr += 2
+            current = obj.sections[index]
+            chunk_start = current.size
+
+        elif opcode == OP_ZEROES:
+            (size,) = U32.unpack_from(view, ptr)
+            ptr += 4
+            if current is None:
+                raise Exception("ZEROES before any SWITCH")
+            chunk_start = current.size
+            current.chunks.append(memoryview(bytes(size)))
+            current.size += size
+
+        elif opcode == OP_PATCH:
+            patch_type, offset = PATCH_HEADER.unpack_from(view, ptr)
+            ptr += PATCH_HEADER.size
+            expression, ptr = _read_expression(view, ptr)
+            if current is None:
+                raise Exception("PATCH before any SWITCH")
+            obj.patches.append(
+                PsyqPatch(current.index, chunk_start + offset, patch_type, expression)
+            )
 
-            # alignment = data[ptr]
-            ptr += 1
+        elif opcode == OP_XDEF:
+            symbol, section, offset = XDEF_HEADER.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + XDEF_HEADER.size)
+            obj.symbols.append(PsyqSymbol(name, "xdef", symbol, section, offset))
+
+        elif opcode == OP_XREF:
+            (symbol,) = U16.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + 2)
+            obj.symbols.append(PsyqSymbol(name, "xref", symbol))
+
+        elif opcode == OP_SECTION:
+            index, group, alignment = SECTION_HEADER.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + SECTION_HEADER.size)
+            obj.sections[index] = PsyqSection(index, name, group, alignment)
+
+        elif opcode == OP_LOCAL_SYMBOL:
+            section, offset = LOCAL_HEADER.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + LOCAL_HEADER.size)
+            obj.symbols.append(PsyqSymbol(name, "local", None, section, offset))
+
+        elif opcode == OP_FILENAME:
+            (index,) = U16.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + 2)
+            obj.filenames[index] = name
+
+        elif opcode == OP_XBSS:
+            symbol, section, size = XBSS_HEADER.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + XBSS_HEADER.size)
+            obj.symbols.append(PsyqSymbol(name, "xbss", symbol, section, size))
+
+        elif opcode == OP_FUNCTION_START:
+            section, offset, *_ = FUNCTION_HEADER.unpack_from(view, ptr)
+            name, ptr = _read_string(view, ptr + FUNCTION_HEADER.size)
+            obj.functions.append((name, section, offset))
+
+        elif opcode == OP_DEF:
+            _name, ptr = _read_string(view, ptr + DEF_HEADER.size)
+
+        elif opcode == OP_DEF2:
+            ptr += DEF_HEADER.size
+            (dims,) = U16.unpack_from(view, ptr)
+            ptr += 2 + 2 * dims
+            _tag, ptr = _read_string(view, ptr)
+            _name, ptr = _read_string(view, ptr)
+
+        elif opcode in SKIPPED_OPCODES:
+            ptr += SKIPPED_OPCODES[opcode]
 
-            string_length = data[ptr]
-            ptr += 1
+        else:
+            raise Exception(f"Unknown LNK opcode {opcode} at offset 0x{ptr - 1:X}")
 
-            section_name = data[ptr : ptr + string_length]
-            ptr += string_length
+    return obj
 
-            sections[section_index] = section_name.decode("utf")
 
-        elif opcode == 6:  # "SWITCH"
-            section_index = int.from_bytes(data[ptr : ptr + 2], byteorder="little")
-            ptr += 2
-            current_section = sections[section_index]
+@dataclass
+class PsyqLibraryModule:
+    name: str
+    date: int
+    exports: List[str]
+    offset: int  # of the LNK data within the library
+    size: int
 
-        elif opcode == 2:  # "BYTES"
-            size = int.from_bytes(data[ptr : ptr + 2], byteorder="little")
-            ptr += 2
 
-            payload = data[ptr : ptr + size]
+class PsyqLibrary:
+    """
+    Index of a PSY-Q LIB archive, only the module headers are read up front,
+    each module's object is parsed (and cached) when it is first accessed
+    """
+
+    def __init__(self, data: Union[bytes, memoryview]):
+        self.view = memoryview(data)
+        if bytes(self.view[0:3]) != b"LIB":
+            raise Exception("Not a psyq library!")
+        if self.view[3] != 1:
+            raise Exception("Unknown version")
+
+        self.modules: Dict[str, PsyqLibraryModule] = {}
+        self.exports: Dict[str, str] = {}  # symbol -> module name
+        self._objects: Dict[str, PsyqObject] = {}
+
+        ptr = 4
+        while ptr < len(self.view):
+            raw_name, date, header_size, size = LIB_MODULE_HEADER.unpack_from(
+                self.view, ptr
+            )
+            if size == 0:
+                break
+            name = str(raw_name, "latin-1").rstrip(" \0")
+
+            exports = []
+            export_ptr = ptr + LIB_MODULE_HEADER.size
+            while self.view[export_ptr] != 0:
+                export, export_ptr = _read_string(self.view, export_ptr)
+                exports.append(export)
+                self.exports.setdefault(export, name)
+
+            self.modules[name] = PsyqLibraryModule(
+                name, date, exports, ptr + header_size, size - header_size
+            )
             ptr += size
 
-            if current_section == ".text":
-                return payload
+    def __len__(self) -> int:
+        return len(self.modules)
 
-        elif opcode == 28:  #
-            unknown = int.from_bytes(
-                data[ptr : ptr + 2], byteorder="little"
-            )  # always 9?
-            ptr += 2
+    def __iter__(self):
+        return iter(self.modules)
 
-            strlen = data[ptr]
-            ptr += 1
+    def __getitem__(self, name: str) -> PsyqObject:
+        if name not in self._objects:
+            module = self.modules[name]
+            self._objects[name] = parse_psyq_object(
+                self.view[module.offset : module.offset + module.size]
+            )
+        return self._objects[name]
 
-            filename = data[ptr : ptr + strlen].decode("utf")
-            # print(f"filename: {filename}")
+    def module_for(self, symbol: str) -> PsyqObject:
+        return self[self.exports[symbol]]
 
-            ptr += strlen
 
-        else:
-            print(f"UNKNOWN OPCODE {opcode}")
-            break
+def read_text_section(data: bytes) -> bytes:
+    return parse_psyq_object(data).section(".text").data
 
-    raise Exception("Didn't find a .text section!")
 
+# set in each oracle pool worker so concurrent wine runs don't share a wineserver
+_WINE_PREFIX: Optional[str] = None
 
-def run_aspsx(source_asm: Path, version, data_limit="", extra_flags=""):
-    aspsx_version = version["aspsx_version"]
+
+def _link_psyq(scratch: Path, aspsx_version: str) -> None:
+    # ASPSX.EXE (and anything it needs) is linked rather than copied
     psyq_version = ASPSX_PSYQ_VERSION_LOOKUP[aspsx_version]
+    psyq_base = PSYQ_DIR / psyq_version
+    for path in psyq_base.iterdir():
+        (scratch / path.name).symlink_to(path.resolve())
 
-    psyq_base = Path(__file__).parent / Path(f"psyq/{psyq_version}")
 
-    aspsx_path = psyq_base / "ASPSX.EXE"
+def _wine_env() -> Optional[Dict[str, str]]:
+    if _WINE_PREFIX is None:
+        return None
+    return {**os.environ, "WINEPREFIX": _WINE_PREFIX}
 
-    object_file = source_asm.with_suffix(".obj")
-    object_file.unlink(missing_ok=True)
 
+def _find_object(object_file: Path) -> Optional[Path]:
     # dosemu creates a lowercase file!
-    object_file_name = psyq_base / object_file.name.lower()
-    object_file_name.unlink(missing_ok=True)
+    for path in (object_file, object_file.with_name(object_file.name.lower())):
+        if path.exists():
+            return path
+    return None
 
-    runner = ASPSX_RUNNER_LOOKUP[aspsx_version]
 
-    if runner == "wine":
-        cmd = [
-            "wine",
-            str(aspsx_path),
-            data_limit,
-            extra_flags,
-            "-o",
-            str(object_file),
-            str(source_asm),
-        ]
-    elif runner == "dosemu2":
-        shutil.copy(source_asm, psyq_base)
-        cmd = [
-            "dosemu",
-            # "-quiet",
-            "-dumb",
-            "-K",
-            f"{psyq_base}",
-            "-E",
-            f"ASPSX.EXE {data_limit} {extra_flags} -o {object_file.name} {source_asm.name}",
-        ]
+def text_words(text_data: bytes) -> List[str]:
+    if len(text_data) % 4 != 0:
+        raise Exception(".text length is not aligned to 4 bytes")
 
+    words = array("I", text_data)
+    if sys.byteorder != "little":
+        words.byteswap()
+    return [f"0x{x:08X}" for x in words]
+
+
+def decode_text(data: bytes) -> List[str]:
+    return text_words(read_text_section(data))
+
+
+def _run(cmd: List[str], aspsx_version: str, **kwargs) -> None:
     print(f"Executing \"{' '.join(cmd)}\"")
     proc = subprocess.run(
         cmd,
-        check=True,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
+        **kwargs,
     )
 
     if proc.returncode != 0:
@@ -171,25 +478,345 @@ def run_aspsx(source_asm: Path, version, data_limit="", extra_flags=""):
             f"Error running command: {' '.join(cmd)} for ASPSX {aspsx_version}."
         )
 
-    if runner == "wine":
-        if not object_file.exists():
+
+def run_aspsx(source_asm: Path, version, data_limit="", extra_flags=""):
+    """
+    Runs ASPSX on source_asm in a private scratch directory, so any number of
+    runs can happen at once, and returns the .text as instruction words
+    """
+    aspsx_version = version["aspsx_version"]
+    runner = ASPSX_RUNNER_LOOKUP[aspsx_version]
+
+    with tempfile.TemporaryDirectory(prefix="aspsx-") as tmp_dir:
+        scratch = Path(tmp_dir)
+        _link_psyq(scratch, aspsx_version)
+        shutil.copy(source_asm, scratch / source_asm.name)
+
+        object_file = scratch / source_asm.with_suffix(".obj").name
+
+        if runner == "wine":
+            cmd = [
+                "wine",
+                "ASPSX.EXE",
+                data_limit,
+                extra_flags,
+                "-o",
+                object_file.name,
+                source_asm.name,
+            ]
+        elif runner == "dosemu2":
+            cmd = [
+                "dosemu",
+                # "-quiet",
+                "-dumb",
+                "-K",
+                f"{scratch}",
+                "-E",
+                f"ASPSX.EXE {data_limit} {extra_flags} -o {object_file.name} {source_asm.name}",
+            ]
+
+        _run(cmd, aspsx_version, cwd=scratch, env=_wine_env())
+
+        found = _find_object(object_file)
+        if found is None:
             raise Exception(
                 f"No PSYQ object created for: {' '.join(cmd)} for ASPSX {aspsx_version}"
             )
-    elif runner == "dosemu2":
-        # print(f"Copying {object_file_name} to {object_file}")
-        if not object_file_name.exists():
-            raise Exception(
-                f"No PSYQ object created for: {' '.join(cmd)} for ASPSX {aspsx_version}"
+        return decode_text(found.read_bytes())
+
+
+def run_aspsx_batch(
+    sources: List[Path],
+    aspsx_version: str,
+    data_limit="",
+    extra_flags="",
+    decode: Callable[[bytes], List[str]] = decode_text,
+) -> Dict[Path, Union[List[str], Exception]]:
+    """
+    Assembles every source with a single emulator session: one DOS batch file
+    under dosemu, or one persistent wineserver driving each ASPSX.EXE run
+    under wine. Returns the decoded object (by default the instructions), or
+    why there isn't one, per source.
+    """
+    runner = ASPSX_RUNNER_LOOKUP[aspsx_version]
+    flags = " ".join(x for x in (data_limit, extra_flags) if x)
+
+    results: Dict[Path, Union[List[str], Exception]] = {}
+    with tempfile.TemporaryDirectory(prefix="aspsx-") as tmp_dir:
+        scratch = Path(tmp_dir)
+        _link_psyq(scratch, aspsx_version)
+
+        # 8.3 names that can't collide, whatever the sources are called
+        names = {}
+        for i, source_asm in enumerate(sources):
+            name = f"S{i:07d}"
+            shutil.copy(source_asm, scratch / f"{name}.S")
+            names[source_asm] = name
+
+        commands = [
+            f"ASPSX.EXE {flags} -o {name}.OBJ {name}.S" for name in names.values()
+        ]
+
+        if runner == "dosemu2":
+            (scratch / "BATCH.BAT").write_bytes(
+                "".join(f"{x}\r\n" for x in commands).encode("ascii")
             )
-        shutil.move(object_file_name, object_file)
+            _run(
+                ["dosemu", "-dumb", "-K", f"{scratch}", "-E", "BATCH.BAT"],
+                aspsx_version,
+                cwd=scratch,
+            )
+        elif runner == "wine":
+            env = _wine_env()
+            # keep the wineserver (and the prefix it has loaded) up between runs
+            _run(["wineserver", "-p"], aspsx_version, cwd=scratch, env=env)
+            try:
+                for source_asm, command in zip(names, commands):
+                    try:
+                        _run(
+                            ["wine", *command.split()],
+                            aspsx_version,
+                            cwd=scratch,
+                            env=env,
+                        )
+                    except Exception as err:
+                        results[source_asm] = err
+            finally:
+                subprocess.run(["wineserver", "-k"], cwd=scratch, env=env)
+
+        for source_asm, name in names.items():
+            if source_asm in results:
+                continue
+            found = _find_object(scratch / f"{name}.OBJ")
+            if found is None:
+                results[source_asm] = Exception(
+                    f"No PSYQ object created for {source_asm} with ASPSX {aspsx_version}"
+                )
+                continue
+            try:
+                results[source_asm] = decode(found.read_bytes())
+            except Exception as err:
+                results[source_asm] = err
+
+    return results
+
+
+@dataclass(frozen=True)
+class OracleJob:
+    source_asm: Path
+    aspsx_version: str
+    data_limit: str = ""
+    extra_flags: str = ""
+
+
+def init_oracle_worker() -> None:
+    global _WINE_PREFIX
+    _WINE_PREFIX = tempfile.mkdtemp(prefix="aspsx-wine-")
+    # removed when the pool shuts the worker down
+    multiprocessing.util.Finalize(
+        None, shutil.rmtree, args=(_WINE_PREFIX, True), exitpriority=0
+    )
 
-    text_data = read_text_section(object_file.read_bytes())
-    if len(text_data) % 4 != 0:
-        raise Exception(".text length is not aligned to 4 bytes")
 
-    hex_data = "".join([f"{x:02X}"[::-1] for x in text_data])
-    instructions = [
-        "0x" + hex_data[i : i + 8][::-1] for i in range(0, len(hex_data), 8)
-    ]
+def _run_oracle_job(job: OracleJob) -> List[str]:
+    return run_aspsx(
+        job.source_asm,
+        {"aspsx_version": job.aspsx_version},
+        job.data_limit,
+        job.extra_flags,
+    )
+
+
+def run_oracle_matrix(
+    jobs: Iterable[OracleJob], max_workers: Optional[int] = None
+) -> Iterator[Tuple[OracleJob, Union[List[str], Exception]]]:
+    """
+    Runs every job across a process pool, yielding each job with its
+    instructions (or the exception it raised) as soon as it completes. The
+    pool takes part in the make jobserver if there is one.
+    """
+    with job_slots(max_workers) as workers, ProcessPoolExecutor(
+        max_workers=workers, initializer=init_oracle_worker
+    ) as executor:
+        futures = {executor.submit(_run_oracle_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                yield (futures[future], future.result())
+            except Exception as err:
+                yield (futures[future], err)
+
+
+def _run_oracle_batch(jobs: List[OracleJob]) -> Dict[Path, Union[List[str], Exception]]:
+    job = jobs[0]
+    return run_aspsx_batch(
+        [x.source_asm for x in jobs],
+        job.aspsx_version,
+        job.data_limit,
+        job.extra_flags,
+    )
+
+
+def run_oracle_batches(
+    jobs: Iterable[OracleJob], max_workers: Optional[int] = None, batch_size=256
+) -> Iterator[Tuple[OracleJob, Union[List[str], Exception]]]:
+    """
+    Like run_oracle_matrix, but jobs with the same version and flags are
+    assembled batch_size at a time with run_aspsx_batch
+    """
+    groups: Dict[Tuple[str, str, str], List[OracleJob]] = {}
+    for job in jobs:
+        groups.setdefault(
+            (job.aspsx_version, job.data_limit, job.extra_flags), []
+        ).append(job)
+
+    batches = []
+    for group in groups.values():
+        for i in range(0, len(group), batch_size):
+            batches.append(group[i : i + batch_size])
+
+    with job_slots(max_workers) as workers, ProcessPoolExecutor(
+        max_workers=workers, initializer=init_oracle_worker
+    ) as executor:
+        futures = {
+            executor.submit(_run_oracle_batch, batch): batch for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = future.result()
+            except Exception as err:
+                results = {x.source_asm: err for x in batch}
+            for job in batch:
+                yield (job, results[job.source_asm])
+
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def oracle_key(source: bytes, aspsx_version: str, data_limit="", extra_flags="") -> str:
+    """
+    Content address of an ASPSX run, changes whenever the source or flags do
+    """
+    key = json.dumps(
+        [
+            hashlib.sha256(source).hexdigest(),
+            aspsx_version,
+            data_limit.strip(),
+            extra_flags.strip(),
+        ]
+    )
+    return hashlib.sha256(key.encode("utf")).hexdigest()
+
+
+class OracleStore:
+    """
+    Recorded ASPSX results, one JSON file per oracle_key
+    """
+
+    # keys recorded by this process, which ASPSX_RERECORD=1 doesn't re-run
+    recorded_keys: Set[str] = set()
+
+    def __init__(self, path: Path = FIXTURES_DIR):
+        self.path = path
+
+    def _fixture_path(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def get(self, key: str) -> Optional[List[str]]:
+        fixture_path = self._fixture_path(key)
+        if not fixture_path.exists():
+            return None
+        return json.loads(fixture_path.read_text())["instructions"]
+
+    def put(self, key: str, instructions: List[str], **metadata) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        fixture_path = self._fixture_path(key)
+        tmp_path = fixture_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({**metadata, "instructions": instructions}, indent=2) + "\n"
+        )
+        tmp_path.replace(fixture_path)
+        OracleStore.recorded_keys.add(key)
+
+
+def emulator_available(aspsx_version: str) -> bool:
+    psyq_version = ASPSX_PSYQ_VERSION_LOOKUP[aspsx_version]
+    aspsx_path = PSYQ_DIR / psyq_version / "ASPSX.EXE"
+    runner = ASPSX_RUNNER_LOOKUP[aspsx_version]
+    return aspsx_path.exists() and shutil.which(runner) is not None
+
+
+def aspsx_instructions(
+    source_asm: Path, version, data_limit="", extra_flags="", store=None
+):
+    """
+    Replays the recorded result of run_aspsx if there is one, otherwise runs
+    ASPSX (when it and its emulator are available) and records the result.
+    Set ASPSX_RERECORD=1 to re-run ASPSX even if a result was recorded (by
+    an earlier run).
+    """
+    store = store or OracleStore()
+    aspsx_version = version["aspsx_version"]
+    key = oracle_key(source_asm.read_bytes(), aspsx_version, data_limit, extra_flags)
+
+    # record_missing may have just re-recorded it
+    rerecord = (
+        os.environ.get("ASPSX_RERECORD") == "1" and key not in store.recorded_keys
+    )
+    instructions = store.get(key)
+    if instructions is not None and not (
+        rerecord and emulator_available(aspsx_version)
+    ):
+        return instructions
+
+    if not emulator_available(aspsx_version):
+        # a failure rather than a skip, otherwise a test without a recording
+        # would pass everywhere the emulator isn't installed
+        raise AssertionError(
+            f"No recorded result for {source_asm.name} with ASPSX {aspsx_version}, "
+            "and it can't be run here (record it with download.sh and the emulator)"
+        )
+
+    instructions = run_aspsx(source_asm, version, data_limit, extra_flags)
+    store.put(
+        key,
+        instructions,
+        source=source_asm.name,
+        aspsx_version=aspsx_version,
+        flags=[x for x in (data_limit, extra_flags) if x],
+    )
     return instructions
+
+
+def record_missing(jobs: Iterable[OracleJob], store=None) -> None:
+    """
+    Runs (in parallel) and records every job that aspsx_instructions would
+    otherwise have to run one at a time
+    """
+    store = store or OracleStore()
+    rerecord = os.environ.get("ASPSX_RERECORD") == "1"
+
+    keys = {}
+    for job in jobs:
+        if not emulator_available(job.aspsx_version):
+            continue
+        key = oracle_key(
+            job.source_asm.read_bytes(),
+            job.aspsx_version,
+            job.data_limit,
+            job.extra_flags,
+        )
+        if (rerecord and key not in store.recorded_keys) or store.get(key) is None:
+            keys[job] = key
+
+    for job, result in run_oracle_batches(keys):
+        if isinstance(result, Exception):
+            # aspsx_instructions will run it again and report the failure
+            continue
+        store.put(
+            keys[job],
+            result,
+            source=job.source_asm.name,
+            aspsx_version=job.aspsx_version,
+            flags=[x for x in (job.data_limit, job.extra_flags) if x],
+        )
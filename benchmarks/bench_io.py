@@ -0,0 +1,120 @@
+"""
+Compare the text-mode and --bytes-io input/output paths on a synthetic
+multi-megabyte input, e.g.
+
+    python3 benchmarks/bench_io.py --size-mb 16
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maspsx import MaspsxProcessor
+from maspsx.reader import decode_lines, encode_text, open_file_bytes
+
+FUNCTION_TEMPLATE = """\
+	.align	2
+	.globl	func_{n}
+	.ent	func_{n}
+func_{n}:
+	.frame	$sp,24,$31
+	.mask	0x80000000,-8
+	.fmask	0x00000000,0
+	addiu	$sp,$sp,-24
+	sw	$31,16($sp)
+	lw	$2,D_{n}
+	lw	$3,40000($4)
+	addu	$2,$2,$3
+	sw	$2,D_{n}+4
+	li	$4,0x12345
+	.set	noreorder
+	.set	nomacro
+	jal	other_func
+	move	$5,$2
+	.set	macro
+	.set	reorder
+
+	lw	$31,16($sp)
+	addiu	$sp,$sp,24
+	j	$31
+	.end	func_{n}
+	.comm	D_{n},8
+"""
+
+
+def generate_input(size_mb: int) -> str:
+    chunks = []
+    size = 0
+    n = 0
+    while size < size_mb * 1024 * 1024:
+        chunk = FUNCTION_TEMPLATE.format(n=n)
+        chunks.append(chunk)
+        size += len(chunk)
+        n += 1
+    return "".join(chunks)
+
+
+def run_text(path: Path) -> bytes:
+    with open(path, "r", encoding="utf") as f:
+        in_lines = f.readlines()
+    out_lines = MaspsxProcessor(in_lines, expand_li=True).process_lines()
+    out_text = "\n".join([""] + out_lines) + "\n"
+    return out_text.encode("utf")
+
+
+def run_bytes(path: Path) -> bytes:
+    with open_file_bytes(path) as data:
+        in_lines = decode_lines(data)
+    out_lines = MaspsxProcessor(in_lines, expand_li=True, stripped=True).process_lines()
+    out_text = "\n".join([""] + out_lines) + "\n"
+    return encode_text(out_text)
+
+
+def read_text(path: Path):
+    with open(path, "r", encoding="utf") as f:
+        return [x.strip() for x in f.readlines()]
+
+
+def read_bytes(path: Path):
+    with open_file_bytes(path) as data:
+        return decode_lines(data)
+
+
+def best_of(func, path: Path, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "input.s"
+        path.write_text(generate_input(args.size_mb))
+
+        assert run_text(path) == run_bytes(path), "outputs differ!"
+
+        print(f"input: {path.stat().st_size / (1024 * 1024):.1f} MiB")
+        for name, func in (
+            ("read (text)", read_text),
+            ("read (bytes)", read_bytes),
+            ("end-to-end (text)", run_text),
+            ("end-to-end (bytes)", run_bytes),
+        ):
+            print(f"{name:>20}: {best_of(func, path, args.repeat):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compare throughput and latency of the maspsx.server model against spawning
+maspsx.py per request (as decomp.me does), e.g.
+
+    python3 benchmarks/bench_server.py --requests 200 --concurrency 8
+
+Pass --gnu-as-path to include GNU as in both models, otherwise only maspsx
+processing is measured.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from maspsx.aio import AsyncMaspsx
+from maspsx.server import serve
+
+from bench_io import FUNCTION_TEMPLATE
+
+MASPSX_PY = Path(__file__).parent.parent / "maspsx.py"
+
+FLAGS = ["--aspsx-version=2.77", "--macro-inc", "-G8"]
+
+
+def percentile(timings: List[float], pct: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * pct / 100))]
+
+
+async def run_requests(
+    request: Callable[[], Awaitable[None]], count: int, concurrency: int
+) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            await request()
+            timings.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[timed() for _ in range(count)])
+    return timings
+
+
+async def bench_server(
+    text: str, gnu_as_path: Optional[str], count: int, concurrency: int
+) -> List[float]:
+    body = json.dumps(
+        {"input": text, "flags": FLAGS, "assemble": gnu_as_path is not None}
+    ).encode()
+
+    async with AsyncMaspsx(
+        max_concurrency=concurrency, as_path=gnu_as_path or "mipsel-linux-gnu-as"
+    ) as maspsx:
+        server = await serve(maspsx, host="127.0.0.1")
+        host, port = server.sockets[0].getsockname()[:2]
+
+        async def request():
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(
+                b"POST /compile HTTP/1.1\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            response = await reader.read()
+            writer.close()
+            assert response.startswith(b"HTTP/1.1 200"), response[:200]
+
+        async with server:
+            await request()  # warm up the process pool
+            return await run_requests(request, count, concurrency)
+
+
+async def bench_process(
+    text: str, gnu_as_path: Optional[str], count: int, concurrency: int
+) -> List[float]:
+    args = [sys.executable, str(MASPSX_PY), *FLAGS]
+    if gnu_as_path:
+        args += ["--run-assembler", f"--gnu-as-path={gnu_as_path}", "-o", "/dev/null"]
+
+    async def request():
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        await proc.communicate(text.encode("utf"))
+        assert proc.returncode == 0
+
+    return await run_requests(request, count, concurrency)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--functions", type=int, default=4)
+    parser.add_argument("--gnu-as-path", type=str)
+    args = parser.parse_args()
+
+    text = "".join(FUNCTION_TEMPLATE.format(n=n) for n in range(args.functions))
+
+    for name, bench in (
+        ("per-process", bench_process),
+        ("server", bench_server),
+    ):
+        start = time.perf_counter()
+        timings = asyncio.run(
+            bench(text, args.gnu_as_path, args.requests, args.concurrency)
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>12}: {args.requests / elapsed:8.1f} req/s, "
+            f"p50 {percentile(timings, 50) * 1000:7.1f}ms, "
+            f"p99 {percentile(timings, 99) * 1000:7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
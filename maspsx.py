@@ -1,26 +1,131 @@
 import argparse
+import os
 import shutil
-import subprocess
 import sys
 
-from typing import List
 from pathlib import Path
+from typing import List
 
 from maspsx import MaspsxProcessor
+from maspsx.assembler import output_path, run_assembler
+from maspsx.cache import (
+    DEFAULT_TIMEOUT,
+    FunctionCache,
+    ObjectCacheSink,
+    open_store,
+    process_cached_into,
+)
+from maspsx.compare import compare_files
+from maspsx.depfile import IncludeSink, write_depfile
+from maspsx.detect import detect_version, read_target
+from maspsx.encoder import NativeAssemblerSink
+from maspsx.ir import IrSink, serialize_records, write_jsonl
+from maspsx.jobserver import job_slots
+from maspsx.manifest import SymbolManifest, update_manifest
+from maspsx.options import add_option_arguments, options_from_args
+from maspsx.reader import (
+    BYTES_ENCODING,
+    decode_lines,
+    open_file_bytes,
+    read_stdin_bytes,
+)
+from maspsx.sinks import (
+    AssemblerSink,
+    DeferredSink,
+    LineSink,
+    StreamSink,
+    TeeSink,
+)
+from maspsx.sweep import process_versions
+from maspsx.versions import parse_version_list
+from maspsx.watch import WatchConfig, Watcher
+
+
+def check_gnu_as(gnu_as: str) -> None:
+    gnu_as_path = Path(gnu_as)
+    if not gnu_as_path.is_file() and not shutil.which(gnu_as):
+        sys.stderr.write(f"MASPSX: {gnu_as} not found")
+        sys.exit(1)
+
+
+def run_watch(args: argparse.Namespace, as_args: List[str]) -> None:
+    input_path = None
+    watch_paths = [Path(x) for x in args.watch_path]
+    if not args.build_command:
+        if not as_args:
+            sys.stderr.write(
+                "MASPSX: --watch requires an input file or --build-command\n"
+            )
+            sys.exit(1)
+        input_path = Path(as_args.pop())
+        watch_paths.append(input_path)
+    elif not watch_paths:
+        sys.stderr.write("MASPSX: --build-command requires --watch-path\n")
+        sys.exit(1)
+
+    symbol_manifest = None
+    if args.symbol_manifest:
+        symbol_manifest = Path(args.symbol_manifest)
+        watch_paths.append(symbol_manifest)
+
+    options, assembler_args = options_from_args(args, as_args)
+    if not args.native_assembler:
+        check_gnu_as(args.gnu_as_path)
+
+    watcher = Watcher(
+        WatchConfig(
+            watch_paths=watch_paths,
+            options=options,
+            as_path=args.gnu_as_path,
+            as_args=assembler_args,
+            object_path=Path(output_path(assembler_args)),
+            input_path=input_path,
+            build_command=args.build_command,
+            dump_text=Path(args.dump_text) if args.dump_text else None,
+            compare_to=Path(args.compare_to) if args.compare_to else None,
+            native=args.native_assembler,
+            symbol_manifest=symbol_manifest,
+        )
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--aspsx-version", type=str)
+    add_option_arguments(parser)
     parser.add_argument("--run-assembler", action="store_true")
     parser.add_argument("--gnu-as-path", default="mipsel-linux-gnu-as")
-    parser.add_argument("--dont-force-G0", action="store_true")
-    parser.add_argument("--expand-div", action="store_true")
-    parser.add_argument("--macro-inc", action="store_true")
-    parser.add_argument("--dont-expand-li", action="store_true")
+    parser.add_argument("--native-assembler", action="store_true")
+    parser.add_argument("--compare-to", type=str)
+    parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--watch-path", type=str, action="append", default=[])
+    parser.add_argument("--build-command", type=str)
+    parser.add_argument("--dump-text", type=str)
+    parser.add_argument(
+        "--cache-dir", type=str, default=os.environ.get("MASPSX_CACHE_DIR")
+    )
+    parser.add_argument(
+        "--cache-url", type=str, default=os.environ.get("MASPSX_CACHE_URL")
+    )
+    parser.add_argument("--cache-timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("-MD", action="store_true")
+    parser.add_argument("-MF", type=str)
+    parser.add_argument("-MT", type=str)
     parser.add_argument("--force-stdin", action="store_true")
-    parser.add_argument("--use-comm-section", action="store_true")
-    parser.add_argument("--use-comm-for-lcomm", action="store_true")
+    parser.add_argument("--symbol-manifest", type=str)
+    parser.add_argument("--update-symbol-manifest", action="store_true")
+    parser.add_argument("--symbol-manifest-owner", type=str)
+    parser.add_argument("--bytes-io", action="store_true")
+    parser.add_argument("--aspsx-versions", type=str)
+    parser.add_argument("--sweep-output-dir", type=str)
+    parser.add_argument("--detect-version", action="store_true")
+    parser.add_argument("--target", type=str)
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--emit-ir", type=str)
+    parser.add_argument("--ir-format", choices=("jsonl", "binary"), default="jsonl")
     # decomp.me debugging
     parser.add_argument("--print-output", action="store_true")
     parser.add_argument("--print-input", action="store_true")
@@ -40,10 +145,18 @@ def main() -> None:
             "MASPSX: --expand-li is enabled automatically if --aspsx-version is below 2.56\n"
         )
 
+    if args.watch:
+        run_watch(args, as_args)
+        return
+
     read_from_file = sys.stdin.isatty()
 
     if not read_from_file:
-        in_lines = sys.stdin.readlines()
+        if args.bytes_io:
+            in_bytes = read_stdin_bytes()
+            in_lines = decode_lines(in_bytes)
+        else:
+            in_lines = sys.stdin.readlines()
         if len(in_lines) == 0:
             if args.force_stdin:
                 sys.stderr.write("MASPSX: --force-stdin but no input from stdin!\n")
@@ -61,115 +174,219 @@ def main() -> None:
             sys.stderr.write("MASPSX: Error, no input file found!\n")
             sys.exit(1)
 
-        with open(input_file, "r", encoding="utf") as f:
-            in_lines = f.readlines()
+        if args.bytes_io:
+            with open_file_bytes(input_file) as data:
+                in_lines = decode_lines(data)
+                if args.print_input:
+                    in_bytes = bytes(data)
+        else:
+            with open(input_file, "r", encoding="utf") as f:
+                in_lines = f.readlines()
 
     if args.print_input:
-        sys.stderr.write("".join(in_lines))
-
-    preamble = [
-        '.include "macro.inc"' if args.macro_inc else "",
-    ]
-
-    sdata_limit = 0
-    filtered_as_args: List[str] = []
-    for arg in as_args:
-        # Can we stop gcc from passing us this flag?
-        if arg == "-KPIC":
-            continue
-
-        # GNU as does not support -mcpu flag
-        if arg.startswith("-mcpu="):
-            arg = arg.replace("-mcpu=", "-mtune=")
-
-        elif arg.startswith("-G") and len(arg) > 2:
-            sdata_limit = int(arg[2:])
-
-        filtered_as_args.append(arg)
-
-    div_uses_tge = False  # use tge instruction instead of break in divide
-    nop_at_expansion = False  # insert nop between v0/at?
-    nop_mflo_mfhi = True  # ensure 2 ops between mfhi/mflo and div/mult
-    sltu_at = True  # sltu uses at?
-    expand_li = True  # turn li into lui/ori
-    gp_allow_offset = False  # use gp for sym+offset?
-    gp_allow_la = False  # use gp for la
-    addiu_at = False  # use addiu when expanding lw to use $at
-
-    if args.aspsx_version:
-        aspsx_version = tuple(int(x) for x in args.aspsx_version.split("."))
-        if (1, 10) < aspsx_version < (2, 10):
-            div_uses_tge = True
-        if aspsx_version < (2, 30):
-            nop_at_expansion = True
-            nop_mflo_mfhi = False
-            addiu_at = True
-        if aspsx_version >= (2, 50):
-            expand_li = False
-        if aspsx_version >= (2, 60):
-            sltu_at = False
-        if aspsx_version >= (2, 70):
-            gp_allow_offset = True
-        if aspsx_version >= (2, 80):
-            gp_allow_la = True
-
-    if args.dont_expand_li and expand_li:
-        expand_li = False
+        if args.bytes_io:
+            sys.stderr.flush()
+            sys.stderr.buffer.write(in_bytes)
+        else:
+            sys.stderr.write("".join(in_lines))
+
+    options, assembler_args = options_from_args(args, as_args)
+    preamble = options.preamble
+
+    symbol_manifest = None
+    if args.symbol_manifest:
+        symbol_manifest = SymbolManifest.open(args.symbol_manifest)
+    elif args.update_symbol_manifest:
+        sys.stderr.write(
+            "MASPSX: --update-symbol-manifest requires --symbol-manifest\n"
+        )
+        sys.exit(1)
+
+    processor_kwargs = dict(
+        **options.base_kwargs(),
+        symbol_manifest=symbol_manifest,
+    )
+    out_encoding = BYTES_ENCODING if args.bytes_io else "utf"
+
+    if args.detect_version:
+        if not args.target:
+            sys.stderr.write("MASPSX: --detect-version requires --target\n")
+            sys.exit(1)
+        check_gnu_as(args.gnu_as_path)
+
+        def assemble_text(text: str) -> bytes:
+            return run_assembler(
+                text, args.gnu_as_path, assembler_args, encoding=out_encoding
+            )
+
+        try:
+            target = read_target(Path(args.target), args.gnu_as_path, assembler_args)
+            with job_slots(args.jobs) as jobs:
+                results = detect_version(
+                    in_lines,
+                    target,
+                    parse_version_list(args.aspsx_versions or "all"),
+                    assemble_text,
+                    jobs=jobs,
+                    preamble=preamble,
+                    dont_expand_li=args.dont_expand_li,
+                    **processor_kwargs,
+                )
+        except Exception as err:
+            sys.stderr.write(f"MASPSX: An exception occurred: {err}\n")
+            sys.exit(1)
+
+        for result in results:
+            versions = " ".join(result.versions)
+            if result.matches:
+                sys.stdout.write(f"MATCH: {versions}\n")
+            else:
+                sys.stdout.write(f"{versions}: {result.difference}\n")
+        sys.exit(0 if any(x.matches for x in results) else 1)
+
+    if args.aspsx_versions:
+        try:
+            variants = process_versions(
+                in_lines,
+                parse_version_list(args.aspsx_versions),
+                preamble=preamble,
+                dont_expand_li=args.dont_expand_li,
+                **processor_kwargs,
+            )
+        except Exception as err:
+            sys.stderr.write(f"MASPSX: An exception occurred: {err}\n")
+            sys.exit(1)
+
+        for i, variant in enumerate(variants):
+            report = f"variant {i}: {' '.join(variant.versions)}"
+            if args.sweep_output_dir:
+                variant_path = Path(args.sweep_output_dir) / f"{variant.versions[0]}.s"
+                variant_path.parent.mkdir(parents=True, exist_ok=True)
+                variant_path.write_text(variant.text, encoding=out_encoding)
+                report += f" -> {variant_path}"
+            sys.stdout.write(f"{report}\n")
+        return
 
     maspsx_processor = MaspsxProcessor(
         in_lines,
-        sdata_limit=sdata_limit,
-        expand_div=args.expand_div,
-        expand_li=expand_li,
-        nop_at_expansion=nop_at_expansion,
-        nop_mflo_mfhi=nop_mflo_mfhi,
-        sltu_at=sltu_at,
-        addiu_at=addiu_at,
-        div_uses_tge=div_uses_tge,
-        gp_allow_offset=gp_allow_offset,
-        gp_allow_la=gp_allow_la,
-        use_comm_section=args.use_comm_section,
-        use_comm_for_lcomm=args.use_comm_for_lcomm,
+        symbol_manifest=symbol_manifest,
+        stripped=args.bytes_io,
+        **options.processor_kwargs(),
     )
-    try:
-        out_lines = maspsx_processor.process_lines()
-    except Exception as err:
-        sys.stderr.write(f"MASPSX: An exception occurred: {err}\n")
-        sys.exit(1)
 
-    out_text = "\n".join(preamble + out_lines)
-
-    # avoid "Warning: end of file not at end of a line; newline inserted"
-    out_text += "\n"
+    if args.compare_to and not args.run_assembler:
+        sys.stderr.write("MASPSX: --compare-to requires --run-assembler\n")
+        sys.exit(1)
 
-    if args.print_output:
-        sys.stderr.write(out_text)
+    store = open_store(args.cache_dir, args.cache_url, args.cache_timeout)
 
+    sink: LineSink
     if args.run_assembler:
-        gnu_as_path = Path(args.gnu_as_path)
-        if not gnu_as_path.is_file() and not shutil.which(args.gnu_as_path):
-            sys.stderr.write(f"MASPSX: {args.gnu_as_path} not found")
-            sys.exit(1)
+        check_gnu_as(args.gnu_as_path)
 
         cmd = [
             args.gnu_as_path,
-            *filtered_as_args,
+            *assembler_args,
             "-",  # read from stdin
         ]
-        if not args.dont_force_G0:
-            cmd.insert(-1, "-G0")
-
-        with subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE
-        ) as process:
-            out_bytes = out_text.encode("utf")
-            stdout, stderr = process.communicate(input=out_bytes)
-            if len(stdout):
-                sys.stdout.write(stdout.decode("utf"))
-            if len(stderr):
-                sys.stderr.write(stderr.decode("utf"))
+
+        def make_sink() -> LineSink:
+            if args.native_assembler:
+                return NativeAssemblerSink(cmd, encoding=out_encoding)
+            return AssemblerSink(cmd, encoding=out_encoding)
+
+        if store:
+            sink = ObjectCacheSink(store, cmd, make_sink, args.native_assembler)
+        else:
+            sink = make_sink()
+    elif args.bytes_io:
+        sink = DeferredSink(StreamSink(sys.stdout.buffer, encoding=out_encoding))
     else:
-        sys.stdout.write(out_text)
+        sink = DeferredSink(StreamSink(sys.stdout))
+
+    if args.print_output:
+        if args.bytes_io:
+            # the output bytes, rather than latin-1 decoded text
+            sys.stderr.flush()
+            sink = TeeSink(sink, StreamSink(sys.stderr.buffer, encoding=out_encoding))
+        else:
+            sink = TeeSink(sink, StreamSink(sys.stderr))
+
+    include_sink = IncludeSink() if args.MD else None
+    if include_sink:
+        sink = TeeSink(sink, include_sink)
+
+    # every line is newline-terminated which avoids
+    # "Warning: end of file not at end of a line; newline inserted"
+    sink.extend(preamble)
+
+    ir_sink = IrSink(maspsx_processor) if args.emit_ir else None
+    try:
+        if ir_sink:
+            # IR records need every line to be processed, so no caching
+            maspsx_processor.process_lines_into(TeeSink(sink, ir_sink))
+        elif store:
+            process_cached_into(maspsx_processor, FunctionCache(store), sink)
+        else:
+            maspsx_processor.process_lines_into(sink)
+    except Exception as err:
+        while isinstance(sink, TeeSink):
+            sink, *_ = sink.sinks
+        if isinstance(sink, (AssemblerSink, NativeAssemblerSink, ObjectCacheSink)):
+            sink.abort()
+        sys.stderr.write(f"MASPSX: An exception occurred: {err}\n")
+        sys.exit(1)
+    sink.close()
+    if store:
+        # wait for any background writes
+        store.close()
+
+    if ir_sink:
+        if args.ir_format == "binary":
+            Path(args.emit_ir).write_bytes(serialize_records(ir_sink.records))
+        else:
+            with open(args.emit_ir, "w", encoding="utf") as f:
+                write_jsonl(ir_sink.records, f)
+
+    if args.update_symbol_manifest:
+        # the entries this TU wrote last time are replaced, which needs
+        # something that identifies the TU
+        owner = args.symbol_manifest_owner
+        if owner is None and args.run_assembler:
+            owner = output_path(assembler_args)
+        elif owner is None and read_from_file:
+            owner = input_file
+        update_manifest(
+            args.symbol_manifest, maspsx_processor.manifest_entries(), owner
+        )
+
+    if include_sink:
+        object_path = output_path(assembler_args)
+        write_depfile(
+            Path(args.MF or Path(object_path).with_suffix(".d")),
+            args.MT or object_path,
+            include_sink.includes,
+            assembler_args,
+        )
+
+    if args.compare_to:
+        while isinstance(sink, TeeSink):
+            sink, *_ = sink.sinks
+        if (
+            isinstance(sink, (AssemblerSink, NativeAssemblerSink, ObjectCacheSink))
+            and sink.returncode
+        ):
+            sys.exit(1)
+        try:
+            results = compare_files(
+                Path(output_path(assembler_args)), Path(args.compare_to)
+            )
+        except Exception as err:
+            sys.stderr.write(f"MASPSX: An exception occurred: {err}\n")
+            sys.exit(1)
+        for result in results:
+            sys.stdout.write(f"{result}\n")
+        sys.exit(0 if all(x.matches for x in results) else 1)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 import struct
 import re
 
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .manifest import ManifestEntry, SymbolManifest
+from .sinks import OutputSink
 
 branch_mnemonics = {
     "beq",
@@ -376,11 +380,39 @@ def load_immediate_double(line: str):
     return res
 
 
+def split_symbol_offset(operand: str) -> Tuple[str, bool]:
+    # e.g. savedInfoTracker+4
+    if operand.count("+") == 1:
+        symbol, _ = operand.split("+")
+        return (symbol, True)
+    return (operand, False)
+
+
+@dataclass(frozen=True)
+class SymbolInfo:
+    name: str
+    section: str  # "sdata", "sbss" or "bss"
+    size: int
+    is_common: bool
+    # whether 'sym', 'sym+offset' and 'la $reg,sym' become %gp_rel(...)($gp)
+    gp_rel: bool
+    gp_rel_offset: bool
+    gp_rel_la: bool
+
+    def uses_gp(self, has_offset=False, is_la=False) -> bool:
+        if is_la and not self.gp_rel_la:
+            return False
+        if has_offset:
+            return self.gp_rel_offset
+        return self.gp_rel
+
+
 class MaspsxProcessor:
     is_reorder = True
     skip_instructions = 0
     file_num = 1
     line_index = 0
+    in_include_asm_hack = False
 
     def __init__(
         self,
@@ -397,8 +429,12 @@ class MaspsxProcessor:
         gp_allow_la=False,
         use_comm_section=False,
         use_comm_for_lcomm=False,
+        symbol_manifest: Optional[SymbolManifest] = None,
+        stripped=False,
     ):
-        self.lines = [x.strip() for x in lines]
+        # lines from split_text/decode_lines are already stripped, and are
+        # used as-is rather than copied
+        self.lines = lines if stripped else [x.strip() for x in lines]
 
         self.sdata_limit = sdata_limit
 
@@ -423,6 +459,102 @@ class MaspsxProcessor:
         self.sdata_entries: dict[str, int] = {}
 
         self.comm_symbols: set[str] = set()
+        self.global_symbols: set[str] = set()
+
+        self.symbols: Dict[str, SymbolInfo] = {}
+
+        # symbols declared by other TUs, looked up lazily from the manifest
+        self.symbol_manifest = symbol_manifest
+        self.extern_symbols: Dict[str, Optional[SymbolInfo]] = {}
+
+        self.preprocessed_sdata_limit: Optional[int] = None
+
+    def _make_symbol_info(
+        self, symbol: str, section: str, size: int, is_common: bool
+    ) -> SymbolInfo:
+        gp_rel = section != "bss"
+        return SymbolInfo(
+            name=symbol,
+            section=section,
+            size=size,
+            is_common=is_common,
+            gp_rel=gp_rel,
+            gp_rel_offset=gp_rel and (self.gp_allow_offset or not is_common),
+            gp_rel_la=gp_rel and self.gp_allow_la,
+        )
+
+    def build_symbol_table(self) -> Dict[str, SymbolInfo]:
+        symbols = {}
+        for section, entries in (
+            ("bss", self.bss_entries),
+            ("sbss", self.sbss_entries),
+            ("sdata", self.sdata_entries),
+        ):
+            for symbol, size in entries.items():
+                symbols[symbol] = self._make_symbol_info(
+                    symbol, section, size, symbol in self.comm_symbols
+                )
+        return symbols
+
+    def _get_extern_symbol(self, symbol: str) -> Optional[SymbolInfo]:
+        if self.symbol_manifest is None or self.sdata_limit == 0:
+            return None
+
+        if symbol not in self.extern_symbols:
+            entry = self.symbol_manifest.lookup(symbol)
+            if entry is None or (entry.section != "sdata" and not entry.is_common):
+                # .lcomm symbols (from older manifests) are local to their TU
+                self.extern_symbols[symbol] = None
+            else:
+                section = entry.section
+                if section != "sdata":
+                    # placed by size, so use our -G rather than the declaring TU's
+                    section = "sbss" if entry.size <= self.sdata_limit else "bss"
+                self.extern_symbols[symbol] = self._make_symbol_info(
+                    symbol, section, entry.size, entry.is_common
+                )
+        return self.extern_symbols[symbol]
+
+    def get_symbol(self, symbol: str) -> Optional[SymbolInfo]:
+        info = self.symbols.get(symbol)
+        if info is None:
+            info = self._get_extern_symbol(symbol)
+        return info
+
+    def manifest_entries(self) -> Dict[str, ManifestEntry]:
+        """
+        Returns the global symbols declared by this TU, for use with
+        update_manifest(). Static (.lcomm and non-.globl .sdata) symbols can't
+        be referred to by other TUs, so are left out.
+        """
+        res = {}
+        for x in self.symbols.values():
+            is_common = x.is_common
+            if x.section == "sdata":
+                if x.name not in self.global_symbols:
+                    continue
+            elif not is_common:
+                if not self.use_comm_for_lcomm:
+                    continue
+                # written out as .comm, which makes it global
+                is_common = True
+            res[x.name] = ManifestEntry(
+                name=x.name, section=x.section, size=x.size, is_common=is_common
+            )
+        return res
+
+    def gp_rel_symbols(self) -> List[SymbolInfo]:
+        """
+        Returns the symbols that will be accessed via $gp for the current -G value
+        """
+        return [x for x in self.symbols.values() if x.gp_rel]
+
+    def _symbol_uses_gp(self, operand: str, is_la=False) -> bool:
+        symbol, has_offset = split_symbol_offset(operand)
+        info = self.get_symbol(symbol)
+        if info is None:
+            return False
+        return info.uses_gp(has_offset=has_offset, is_la=is_la)
 
     def preprocess_lines(self) -> None:
         in_sdata = False
@@ -437,6 +569,7 @@ class MaspsxProcessor:
                 continue
 
             if line.startswith(".globl"):
+                self.global_symbols.add(line.split()[1])
                 continue
 
             if line.startswith(".text"):
@@ -519,39 +652,92 @@ class MaspsxProcessor:
                             )
                         self.sdata_entries[current_symbol] += size
 
-    def process_lines(self):
+        self.symbols = self.build_symbol_table()
+
+    def process_lines(self) -> List[str]:
+        res: List[str] = []
+        self.process_lines_into(res)
+        return res
+
+    def process_records(self) -> List["IrRecord"]:
+        """
+        Like process_lines, but returns structured records (see maspsx.ir)
+        """
+        sink = IrSink(self)
+        self.process_lines_into(sink)
+        return sink.records
+
+    def process_lines_into(self, res: OutputSink) -> None:
+        self.begin_processing()
+        self.process_range_into(0, len(self.lines), res)
+        self.finish_processing_into(res)
+
+    def begin_processing(self) -> None:
         self.is_reorder = True
         self.skip_instructions = 0
         self.file_num = 1
+        self.in_include_asm_hack = False
+
+        self.extern_symbols = {}
+
+        # section contents only depend on the input and -G, so they can be
+        # reused when the same lines are reprocessed with different flags
+        if self.preprocessed_sdata_limit != self.sdata_limit:
+            self.bss_entries = {}
+            self.sbss_entries = {}
+            self.sdata_entries = {}
+            self.comm_symbols = set()
 
-        self.bss_entries = {}
-        self.sbss_entries = {}
-        self.sdata_entries = {}
+            self.preprocess_lines()
+            self.preprocessed_sdata_limit = self.sdata_limit
+        else:
+            self.symbols = self.build_symbol_table()
+
+    def get_state(self) -> Tuple[bool, int, int, bool]:
+        """
+        Returns the state carried from one line to the next
+        """
+        return (
+            self.is_reorder,
+            self.skip_instructions,
+            self.file_num,
+            self.in_include_asm_hack,
+        )
 
-        self.preprocess_lines()
+    def set_state(self, state: Tuple[bool, int, int, bool]) -> None:
+        (
+            self.is_reorder,
+            self.skip_instructions,
+            self.file_num,
+            self.in_include_asm_hack,
+        ) = state
 
-        res = []
-        in_include_asm_hack = False
-        for i, line in enumerate(self.lines):
+    def process_range_into(self, start: int, end: int, res: OutputSink) -> None:
+        for i in range(start, end):
+            line = self.lines[i]
             self.line_index = i
 
             if ".ent\t__maspsx_include_asm_hack" in line:
-                in_include_asm_hack = True
+                self.in_include_asm_hack = True
 
-            if in_include_asm_hack:
+            if self.in_include_asm_hack:
                 if "# maspsx-keep" in line:
-                    res += [line]
+                    res.append(line)
                 else:
-                    res += [f"# {line} # DEBUG: skipped due to include asm hack"]
+                    res.append(f"# {line} # DEBUG: skipped due to include asm hack")
                 if ".end\t__maspsx_include_asm_hack" in line:
-                    in_include_asm_hack = False
+                    self.in_include_asm_hack = False
                 continue
 
             if is_instruction(line) and self.skip_instructions > 0:
                 self.skip_instructions -= 1
-                res += [f"# {line}  # DEBUG: skipped"]
+                res.append(f"# {line}  # DEBUG: skipped")
             else:
-                res += self.process_line(line)
+                self.process_line_into(line, res)
+
+    def finish_processing_into(self, res: OutputSink) -> None:
+        # nothing below comes from a specific input line
+        self.line_index = len(self.lines)
 
         for section, entries in [
             ("sbss", self.sbss_entries),
@@ -581,14 +767,8 @@ class MaspsxProcessor:
                     res.append(
                         f"\t.globl {symbol}",
                     )
-                res.extend(
-                    [
-                        f"{symbol}:",
-                        f"\t.space {size}",
-                    ]
-                )
-
-        return res
+                res.append(f"{symbol}:")
+                res.append(f"\t.space {size}")
 
     def get_next_instruction(
         self, skip=0, ignore_nop=False, ignore_set=False, ignore_label=False
@@ -625,16 +805,7 @@ class MaspsxProcessor:
                     _,
                 ) = parse_load_or_store(" ".join(rest))
 
-                if operand.count("+") == 1:
-                    symbol, _ = operand.split("+")
-                    gp_allowed = self.gp_allow_offset or symbol not in self.comm_symbols
-                else:
-                    symbol = operand
-                    gp_allowed = True
-
-                if gp_allowed and (
-                    symbol in self.sbss_entries or symbol in self.sdata_entries
-                ):
+                if self._symbol_uses_gp(operand):
                     return True
 
         return False
@@ -823,14 +994,18 @@ class MaspsxProcessor:
 
         return res
 
-    def process_line(self, line: str):
-        res = []
+    def process_line(self, line: str) -> List[str]:
+        res: List[str] = []
+        self.process_line_into(line, res)
+        return res
 
+    def process_line_into(self, line: str, res: OutputSink) -> None:
         if len(line) == 0:
-            return [line]
+            res.append(line)
+            return
 
         if line.startswith("#"):
-            return []
+            return
 
         if line.startswith("."):
             if (
@@ -872,10 +1047,11 @@ class MaspsxProcessor:
             else:
                 res.append(line)
 
-            return res
+            return
 
         if line.startswith("$L"):
-            return [line]
+            res.append(line)
+            return
 
         actual_r_dest = None
         is_macro = ";" in line
@@ -912,19 +1088,8 @@ class MaspsxProcessor:
 
             elif is_addend and r_source is None:
                 # e.g. lb	$s0,D_800E52E0
-                if operand.count("+") == 1:
-                    symbol, offset = operand.split("+")
-                    gp_rel = f"%gp_rel({symbol}+{offset})($gp)"
-                    gp_allowed = self.gp_allow_offset or symbol not in self.comm_symbols
-                else:
-                    symbol = operand
-                    gp_rel = f"%gp_rel({symbol})($gp)"
-                    gp_allowed = True
-
-                if gp_allowed and (
-                    symbol in self.sdata_entries or symbol in self.sbss_entries
-                ):
-                    res.append(f"{op}\t{r_dest},{gp_rel}")
+                if self._symbol_uses_gp(operand):
+                    res.append(f"{op}\t{r_dest},%gp_rel({operand})($gp)")
                 else:
                     res.append(line)
 
@@ -1000,22 +1165,8 @@ class MaspsxProcessor:
 
             if is_addend and r_source is None:
                 # e.g. sw	$v0,D_800E52E0
-                if operand.count("+") == 1:
-                    symbol, offset = operand.split("+")
-                    gp_rel = f"%gp_rel({symbol}+{offset})($gp)"
-                    gp_allowed = self.gp_allow_offset or symbol not in self.comm_symbols
-                else:
-                    symbol = operand
-                    gp_rel = f"%gp_rel({symbol})($gp)"
-                    gp_allowed = True
-
-                if op == "la" and not self.gp_allow_la:
-                    gp_allowed = False
-
-                if gp_allowed and (
-                    symbol in self.sdata_entries or symbol in self.sbss_entries
-                ):
-                    res.append(f"{op}\t{r_dest},{gp_rel}")
+                if self._symbol_uses_gp(operand, is_la=op == "la"):
+                    res.append(f"{op}\t{r_dest},%gp_rel({operand})($gp)")
                 else:
                     res.append(line)
             elif is_addend and r_source:
@@ -1068,19 +1219,19 @@ class MaspsxProcessor:
         elif op == "li":
             # TODO: handle non-soft floats?
             if self.expand_li:
-                res += expand_load_immediate(line)
+                res.extend(expand_load_immediate(line))
             else:
                 res.append(line)
 
         elif op == "li.s":
-            res += load_immediate_single(line)
+            res.extend(load_immediate_single(line))
 
         elif op == "li.d":
-            res += load_immediate_double(line)
+            res.extend(load_immediate_double(line))
 
         elif op in ("mflo", "mfhi"):
             res.append(line)
-            res += self._handle_mflo_mfhi()
+            res.extend(self._handle_mflo_mfhi())
 
         elif op == "break":
             # turn 'break 7' into 'break 0x0,0x7'
@@ -1092,7 +1243,8 @@ class MaspsxProcessor:
             r_dest, r_source, r_operand = rest[0].split(",")
             if r_dest in ("$zero", "$0"):
                 # e.g. div $zero, $v0, $a0
-                return [line]
+                res.append(line)
+                return
 
             move_from = "mfhi" if op == "rem" else "mflo"
             if self.expand_div:
@@ -1129,7 +1281,7 @@ class MaspsxProcessor:
 
             extra_nops = self._handle_mflo_mfhi(r_source=r_dest)
             if len(extra_nops) > 0:
-                res += extra_nops
+                res.extend(extra_nops)
             else:
                 next_instruction = self.get_next_instruction(
                     skip=0, ignore_set=True, ignore_label=True
@@ -1143,7 +1295,8 @@ class MaspsxProcessor:
             r_dest, r_source, r_operand = rest[0].split(",")
             if r_dest in ("$zero", "$0"):
                 # e.g. divu $zero, $v1, $a2
-                return [line]
+                res.append(line)
+                return
 
             move_from = "mfhi" if op == "remu" else "mflo"
             if self.expand_div:
@@ -1173,7 +1326,7 @@ class MaspsxProcessor:
 
             extra_nops = self._handle_mflo_mfhi(r_source=r_dest)
             if len(extra_nops) > 0:
-                res += extra_nops
+                res.extend(extra_nops)
             else:
                 next_instruction = self.get_next_instruction(
                     skip=0, ignore_set=True, ignore_label=True
@@ -1201,4 +1354,8 @@ class MaspsxProcessor:
         else:
             res.append(line)
 
-        return res
+
+# public API, imported last as it depends on MaspsxProcessor
+from .options import MaspsxOptions
+from .api import assemble, create_processor, process
+from .ir import IrRecord, IrSink
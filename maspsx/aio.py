@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import tempfile
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from maspsx.api import DEFAULT_OPTIONS, process
+from maspsx.assembler import strip_output_args
+from maspsx.jobserver import job_slots
+from maspsx.options import MaspsxOptions
+
+
+@dataclass
+class CompileResult:
+    output: str
+    object: Optional[bytes] = None  # None if not assembled, or as failed
+    stderr: str = ""
+    returncode: Optional[int] = None
+
+
+class AsyncMaspsx:
+    """
+    asyncio front end for maspsx, processing happens in an executor and GNU as
+    is run as an asyncio subprocess. At most max_concurrency requests are
+    worked on at once, each one is given timeout seconds once it starts.
+    Under a make jobserver max_concurrency is limited to the tokens that are
+    free, which are held until close(). GNU as is run in cwd, which is where
+    .include/.incbin are resolved.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        executor: Optional[Executor] = None,
+        as_path: str = "mipsel-linux-gnu-as",
+        cwd: Optional[str] = None,
+    ):
+        self._slots = ExitStack()
+        self.max_concurrency = self._slots.enter_context(job_slots(max_concurrency))
+        self.timeout = timeout
+        self.as_path = as_path
+        self.cwd = cwd
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = executor
+        self._owns_executor = executor is None
+
+    @property
+    def executor(self) -> Executor:
+        # processing is CPU bound, so default to a process per concurrent request,
+        # spawned rather than forked so they don't inherit any open client sockets
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def process(self, text: str, options: MaspsxOptions = DEFAULT_OPTIONS) -> str:
+        async with self.semaphore:
+            return await asyncio.wait_for(self._process(text, options), self.timeout)
+
+    async def assemble(self, text: str, as_args: Iterable[str] = ()) -> CompileResult:
+        """
+        as_args are passed to GNU as verbatim, see options.parse_flags
+        """
+        async with self.semaphore:
+            return await asyncio.wait_for(
+                self._assemble(text, list(as_args)), self.timeout
+            )
+
+    async def compile(
+        self,
+        text: str,
+        options: MaspsxOptions = DEFAULT_OPTIONS,
+        as_args: Iterable[str] = (),
+        assemble: bool = True,
+    ) -> CompileResult:
+        """
+        Process text and (optionally) assemble the result, a failure to
+        assemble is reported via returncode/stderr rather than raised
+        """
+        async with self.semaphore:
+            return await asyncio.wait_for(
+                self._compile(text, options, list(as_args), assemble), self.timeout
+            )
+
+    async def close(self) -> None:
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots.close()
+
+    async def __aenter__(self) -> "AsyncMaspsx":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _process(self, text: str, options: MaspsxOptions) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, process, text, options)
+
+    async def _compile(
+        self, text: str, options: MaspsxOptions, as_args: list, assemble: bool
+    ) -> CompileResult:
+        output = await self._process(text, options)
+        if not assemble:
+            return CompileResult(output=output)
+        result = await self._assemble(output, as_args)
+        result.output = output
+        return result
+
+    async def _assemble(self, text: str, as_args: list) -> CompileResult:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            object_path = Path(tmp_dir) / "out.o"
+            proc = await asyncio.create_subprocess_exec(
+                self.as_path,
+                *strip_output_args(as_args),
+                "-o",
+                str(object_path),
+                "-",  # read from stdin
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=self.cwd,
+            )
+            try:
+                stdout, _ = await proc.communicate(text.encode("utf"))
+            except asyncio.CancelledError:
+                # timed out (or the caller went away), don't leave as running
+                proc.kill()
+                await proc.wait()
+                raise
+
+            result = CompileResult(
+                output=text,
+                stderr=stdout.decode("utf", errors="replace"),
+                returncode=proc.returncode,
+            )
+            if proc.returncode == 0:
+                result.object = object_path.read_bytes()
+            return result
@@ -0,0 +1,73 @@
+from typing import Iterable, Optional, Union
+
+from maspsx import MaspsxProcessor
+from maspsx.assembler import run_assembler, strip_output_args
+from maspsx.encoder import UnsupportedAssembly, assemble_native
+from maspsx.manifest import SymbolManifest
+from maspsx.options import MaspsxOptions, filter_as_args
+from maspsx.reader import split_text
+from maspsx.sinks import BufferSink
+
+DEFAULT_OPTIONS = MaspsxOptions()
+
+
+def create_processor(
+    text_or_lines: Union[str, Iterable[str]],
+    options: MaspsxOptions = DEFAULT_OPTIONS,
+    symbol_manifest: Optional[SymbolManifest] = None,
+    stripped: bool = False,
+) -> MaspsxProcessor:
+    if isinstance(text_or_lines, str):
+        lines = split_text(text_or_lines)
+        stripped = True
+    elif stripped and isinstance(text_or_lines, list):
+        lines = text_or_lines
+    else:
+        lines = list(text_or_lines)
+
+    return MaspsxProcessor(
+        lines,
+        symbol_manifest=symbol_manifest,
+        stripped=stripped,
+        **options.processor_kwargs(),
+    )
+
+
+def process(
+    text_or_lines: Union[str, Iterable[str]],
+    options: MaspsxOptions = DEFAULT_OPTIONS,
+    symbol_manifest: Optional[SymbolManifest] = None,
+) -> str:
+    """
+    Process gcc output and return the text that would be passed to GNU as,
+    identical to what maspsx.py writes to stdout
+    """
+    maspsx_processor = create_processor(text_or_lines, options, symbol_manifest)
+
+    sink = BufferSink()
+    sink.extend(options.preamble)
+    maspsx_processor.process_lines_into(sink)
+    return sink.getvalue()
+
+
+def assemble(
+    text: str,
+    as_path: str = "mipsel-linux-gnu-as",
+    args: Iterable[str] = (),
+    force_G0: bool = True,
+    native: bool = False,
+) -> bytes:
+    """
+    Assemble maspsx output with GNU as and return the object file, args are
+    filtered the same way as maspsx.py filters them. If native is set, the
+    built-in encoder is tried first.
+    """
+    as_args, _ = filter_as_args(list(args))
+    if force_G0:
+        as_args.append("-G0")
+    if native:
+        try:
+            return assemble_native(text, strip_output_args(as_args))
+        except UnsupportedAssembly:
+            pass
+    return run_assembler(text, as_path, as_args)
@@ -0,0 +1,64 @@
+import subprocess
+import tempfile
+
+from pathlib import Path
+from typing import List
+
+
+def strip_output_args(as_args: List[str]) -> List[str]:
+    """
+    Remove any '-o file' from the assembler args
+    """
+    res = []
+    skip = False
+    for arg in as_args:
+        if skip:
+            skip = False
+            continue
+        if arg == "-o":
+            skip = True
+            continue
+        if arg.startswith("-o") and len(arg) > 2:
+            continue
+        res.append(arg)
+    return res
+
+
+def output_path(as_args: List[str]) -> str:
+    """
+    The object file GNU as would write given these args
+    """
+    for i, arg in enumerate(as_args):
+        if arg == "-o" and i + 1 < len(as_args):
+            return as_args[i + 1]
+        if arg.startswith("-o") and len(arg) > 2:
+            return arg[2:]
+    return "a.out"
+
+
+def run_assembler(
+    text: str, as_path: str, as_args: List[str], encoding: str = "utf"
+) -> bytes:
+    """
+    Assemble text and return the resulting object file
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        object_path = Path(tmp_dir) / "out.o"
+        cmd = [
+            as_path,
+            *strip_output_args(as_args),
+            "-o",
+            str(object_path),
+            "-",  # read from stdin
+        ]
+        proc = subprocess.run(
+            cmd,
+            input=text.encode(encoding),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if proc.returncode != 0:
+            raise Exception(
+                f"Error running command: {' '.join(cmd)}: {proc.stderr.decode('utf')}"
+            )
+        return object_path.read_bytes()
@@ -0,0 +1,441 @@
+import dataclasses
+import hashlib
+import http.client
+import inspect
+import json
+import os
+import re
+import shutil
+import tempfile
+import urllib.request
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from maspsx import MaspsxProcessor
+from maspsx.assembler import output_path, strip_output_args
+from maspsx.depfile import find_dependencies, find_includes, include_dirs
+from maspsx.session import Region, lookahead, split_regions
+from maspsx.sinks import LineSink, NullSink, OutputSink
+
+# bump if the format of cached entries changes
+CACHE_FORMAT = 1
+
+# seconds to wait for a shared cache before doing the work locally
+DEFAULT_TIMEOUT = 0.5
+
+# anything that could be a symbol, e.g. D_800A0000, $LC0, smallVar+4
+IDENTIFIER_RE = re.compile(r"[A-Za-z_.$][A-Za-z0-9_.$]*")
+
+# MaspsxProcessor kwargs, which all affect its output
+PROCESSOR_FLAGS = [
+    x
+    for x in inspect.signature(MaspsxProcessor).parameters
+    if x not in ("lines", "symbol_manifest", "stripped")
+]
+
+
+@lru_cache(maxsize=None)
+def code_digest() -> str:
+    """
+    Changes whenever maspsx itself does, so that a new version never uses
+    output cached by an old one
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class CacheBackend:
+    """
+    Somewhere to keep cached values (bytes) by key, get returns None on a miss
+    """
+
+    # whether keys can usefully be fetched ahead of time
+    supports_prefetch = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put(self, key: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    def prefetch(self, keys: Iterable[str]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class DirectoryStore(CacheBackend):
+    """
+    Stores values by key in a directory, two levels deep like git
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def _path(self, key: str) -> Path:
+        return self.path / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # concurrent builds may write the same entry, readers must never see
+        # a partial one
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class HttpStore(CacheBackend):
+    """
+    A shared cache, GET/PUT <url>/<key> (see maspsx.cache_server). Any error
+    is treated as a miss, the cache is never required for a build to work.
+    """
+
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with urllib.request.urlopen(
+                f"{self.url}/{key}", timeout=self.timeout
+            ) as response:
+                return response.read()
+        except (OSError, http.client.HTTPException):
+            # including 404 (HTTPError) and timeouts
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        request = urllib.request.Request(
+            f"{self.url}/{key}",
+            data=value,
+            method="PUT",
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except (OSError, http.client.HTTPException):
+            pass
+
+
+class TieredStore(CacheBackend):
+    """
+    A local store in front of a remote one. Remote reads happen in the
+    background (see prefetch) and are given at most timeout seconds before
+    being treated as a miss, remote writes happen in the background too.
+    """
+
+    def __init__(
+        self,
+        local: Optional[CacheBackend],
+        remote: CacheBackend,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_workers: int = 8,
+    ):
+        self.local = local
+        self.remote = remote
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending: Dict[str, Future] = {}
+        self.supports_prefetch = True
+
+    def prefetch(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            if key in self.pending:
+                continue
+            if self.local is not None and self.local.get(key) is not None:
+                continue
+            self.pending[key] = self.executor.submit(self.remote.get, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                return value
+
+        future = self.pending.pop(key, None)
+        if future is None:
+            future = self.executor.submit(self.remote.get, key)
+        try:
+            value = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # quicker to do the work ourselves
+            return None
+        if value is not None and self.local is not None:
+            self.local.put(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if self.local is not None:
+            self.local.put(key, value)
+        self.executor.submit(self.remote.put, key, value)
+
+    def close(self) -> None:
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        # writes are bounded by the remote's own timeout
+        self.executor.shutdown(wait=True)
+
+
+def open_store(
+    cache_dir: Optional[str] = None,
+    cache_url: Optional[str] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> Optional[CacheBackend]:
+    local = DirectoryStore(Path(cache_dir)) if cache_dir else None
+    if cache_url:
+        return TieredStore(local, HttpStore(cache_url, timeout), timeout)
+    return local
+
+
+@dataclass
+class CachedFunction:
+    lines: List[str]
+    exit_state: Tuple[bool, int, int, bool]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps([self.lines, self.exit_state]).encode("utf")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedFunction":
+        lines, exit_state = json.loads(data)
+        return cls(lines, tuple(exit_state))
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+
+def referenced_symbols(processor: MaspsxProcessor, lines: List[str]) -> List[tuple]:
+    """
+    The symbol table entries (local, or from the symbol manifest) that the
+    lines refer to
+    """
+    res = {}
+    for line in lines:
+        for name in IDENTIFIER_RE.findall(line.split("#")[0]):
+            if name not in res:
+                info = processor.get_symbol(name)
+                if info is not None:
+                    res[name] = dataclasses.astuple(info)
+    return sorted(res.values())
+
+
+def function_key(processor: MaspsxProcessor, region: Region) -> str:
+    """
+    Everything the processed output of the function depends on: its text,
+    the flags, the state carried in from the previous line, the lines that
+    follow it and only the symbols it refers to
+    """
+    lines = processor.lines[region.start : region.end]
+    uses_line_numbers = processor.expand_div and any(
+        x.split(None, 1)[0] in ("div", "rem") for x in lines if x
+    )
+    key = json.dumps(
+        [
+            CACHE_FORMAT,
+            code_digest(),
+            {x: getattr(processor, x) for x in PROCESSOR_FLAGS},
+            lines,
+            processor.get_state(),
+            lookahead(processor.lines, region.end),
+            referenced_symbols(processor, lines),
+            # expanded div labels are numbered by line index
+            region.start if uses_line_numbers else None,
+        ]
+    )
+    return hashlib.sha256(key.encode("utf")).hexdigest()
+
+
+class FunctionCache:
+    """
+    Processed output of each .ent ... .end function, keyed by function_key
+    """
+
+    def __init__(self, store: CacheBackend):
+        self.store = store
+
+    def get(self, key: str) -> Optional[CachedFunction]:
+        data = self.store.get(key)
+        if data is None:
+            return None
+        try:
+            return CachedFunction.from_bytes(data)
+        except ValueError:
+            # corrupt, treat as a miss and overwrite it
+            return None
+
+    def put(self, key: str, value: CachedFunction) -> None:
+        self.store.put(key, value.to_bytes())
+
+    def prefetch(self, processor: MaspsxProcessor, regions: List[Region]) -> None:
+        """
+        Starts fetching every function, assuming that each one leaves the state
+        as it found it (usually true, a wrong guess is just a wasted fetch)
+        """
+        keys = []
+        for region in regions:
+            if region.function is None:
+                processor.process_range_into(region.start, region.end, NullSink())
+            else:
+                keys.append(function_key(processor, region))
+        self.store.prefetch(keys)
+        processor.begin_processing()
+
+
+def process_cached_into(
+    processor: MaspsxProcessor, cache: FunctionCache, res: OutputSink
+) -> CacheStats:
+    """
+    Equivalent to processor.process_lines_into(res), but functions found in
+    the cache are spliced in rather than processed
+    """
+    stats = CacheStats()
+    processor.begin_processing()
+    regions = split_regions(processor.lines)
+    if cache.store.supports_prefetch:
+        cache.prefetch(processor, regions)
+
+    for region in regions:
+        if region.function is None:
+            processor.process_range_into(region.start, region.end, res)
+            continue
+
+        key = function_key(processor, region)
+        cached = cache.get(key)
+        if cached is not None:
+            res.extend(cached.lines)
+            processor.set_state(cached.exit_state)
+            stats.hits += 1
+        else:
+            out_lines: List[str] = []
+            processor.process_range_into(region.start, region.end, out_lines)
+            res.extend(out_lines)
+            cache.put(key, CachedFunction(out_lines, processor.get_state()))
+            stats.misses += 1
+    processor.finish_processing_into(res)
+    return stats
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def assembler_digest(cmd: List[str], native: bool) -> str:
+    if native:
+        return code_digest()
+    as_path = shutil.which(cmd[0]) or cmd[0]
+    return file_digest(os.path.realpath(as_path))
+
+
+def include_digests(text: str, as_args: List[str]) -> List[Tuple[str, str]]:
+    """
+    The files that the text .include/.incbin's (and what those include),
+    with their contents' digests
+    """
+    includes = find_includes(text.splitlines())
+    if not includes:
+        return []
+    dependencies = find_dependencies(includes, include_dirs(as_args))
+    return [(os.fspath(x), file_digest(os.fspath(x))) for x in dependencies]
+
+
+def object_key(text: str, cmd: List[str], native: bool = False) -> str:
+    """
+    The assembled object depends on the text, any files it includes, the args
+    and the assembler itself (by contents, so that machines with the same one
+    share entries)
+    """
+    as_args = strip_output_args([x for x in cmd[1:] if x != "-"])
+    key = json.dumps(
+        [
+            CACHE_FORMAT,
+            "object",
+            hashlib.sha256(text.encode("utf", "surrogateescape")).hexdigest(),
+            include_digests(text, as_args),
+            as_args,
+            assembler_digest(cmd, native),
+        ]
+    )
+    return hashlib.sha256(key.encode("utf")).hexdigest()
+
+
+class ObjectCacheSink(LineSink):
+    """
+    Collects lines and, on close, either writes the cached object for them or
+    assembles them with the sink make_sink returns and caches the result
+    """
+
+    def __init__(
+        self,
+        store: CacheBackend,
+        cmd: List[str],
+        make_sink: Callable[[], LineSink],
+        native: bool = False,
+    ):
+        self.store = store
+        self.cmd = cmd
+        self.make_sink = make_sink
+        self.native = native
+        self.lines: List[str] = []
+        self.returncode: Optional[int] = None
+        self.hit = False
+
+    def append(self, line: str) -> None:
+        self.lines.append(line)
+
+    def extend(self, lines: Iterable[str]) -> None:
+        self.lines.extend(lines)
+
+    def close(self) -> None:
+        if self.returncode is not None:
+            return
+        object_path = Path(output_path([x for x in self.cmd[1:] if x != "-"]))
+        key = object_key("".join(f"{x}\n" for x in self.lines), self.cmd, self.native)
+
+        cached = self.store.get(key)
+        if cached is not None:
+            fd, tmp_path = tempfile.mkstemp(dir=object_path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(cached)
+            os.replace(tmp_path, object_path)
+            self.hit = True
+            self.returncode = 0
+            return
+
+        sink = self.make_sink()
+        sink.extend(self.lines)
+        sink.close()
+        self.returncode = getattr(sink, "returncode", 0)
+        if self.returncode == 0:
+            self.store.put(key, object_path.read_bytes())
+
+    def abort(self) -> None:
+        self.returncode = -1
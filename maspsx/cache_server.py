@@ -0,0 +1,111 @@
+"""
+Reference shared cache server for --cache-url, e.g.
+
+    python3 -m maspsx.cache_server --listen 0.0.0.0:8701 --dir /var/cache/maspsx
+    python3 maspsx.py --cache-url=http://build-server:8701 ...
+
+GET /<key> responds with the cached value (or 404), PUT /<key> stores the body.
+Entries are never evicted, clear out the directory to reclaim space.
+"""
+
+import argparse
+import asyncio
+import re
+import sys
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+from maspsx.cache import DirectoryStore
+from maspsx.server import REASONS, read_request
+
+KEY_RE = re.compile(r"^/([0-9a-f]{64})$")
+
+
+async def write_response(
+    writer: asyncio.StreamWriter, status: int, body: bytes = b"", head=False
+):
+    writer.write(
+        (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode("latin-1")
+        + (b"" if head else body)
+    )
+    await writer.drain()
+
+
+def handle(
+    store: DirectoryStore, method: str, path: str, body: bytes
+) -> Tuple[int, bytes]:
+    match = KEY_RE.match(path)
+    if not match:
+        return (404, b"")
+    key = match.group(1)
+
+    if method in ("GET", "HEAD"):
+        value = store.get(key)
+        return (404, b"") if value is None else (200, value)
+    if method == "PUT":
+        store.put(key, body)
+        return (200, b"")
+    return (405, b"")
+
+
+def make_handler(store: DirectoryStore):
+    async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                request = await read_request(reader)
+            except OverflowError:
+                await write_response(writer, 413)
+                return
+            except (ValueError, asyncio.IncompleteReadError):
+                await write_response(writer, 400)
+                return
+            if request is None:
+                return
+
+            method, path, body = request
+            status, response = handle(store, method, path, body)
+            await write_response(writer, status, response, head=method == "HEAD")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handler
+
+
+async def serve(
+    store: DirectoryStore, host: Optional[str] = None, port: int = 0
+) -> asyncio.AbstractServer:
+    return await asyncio.start_server(make_handler(store), host=host, port=port)
+
+
+async def run(args: argparse.Namespace) -> None:
+    host, _, port = args.listen.rpartition(":")
+    server = await serve(DirectoryStore(Path(args.dir)), host or None, int(port))
+    address = ":".join(str(x) for x in server.sockets[0].getsockname()[:2])
+    sys.stderr.write(f"MASPSX: cache listening on {address}\n")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listen", default="127.0.0.1:8701", help="host:port")
+    parser.add_argument("--dir", required=True, help="where to keep entries")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from maspsx.elf import (
+    R_MIPS_26,
+    R_MIPS_32,
+    STT_FUNC,
+    STT_NOTYPE,
+    ElfReader,
+)
+
+# the bits of a word that the linker fills in, which differ between objects
+# even when the code matches (e.g. %hi/%lo of a local symbol vs a section)
+RELOCATION_MASKS = {
+    R_MIPS_32: 0xFFFFFFFF,
+    R_MIPS_26: 0x03FFFFFF,
+}
+DEFAULT_RELOCATION_MASK = 0x0000FFFF  # R_MIPS_HI16, R_MIPS_LO16, R_MIPS_GPREL16
+
+
+@dataclass
+class Difference:
+    offset: int
+    ours: Optional[int]  # None if our .text is shorter
+    target: Optional[int]  # None if the target .text is shorter
+
+    def __str__(self) -> str:
+        ours = "(end)" if self.ours is None else f"0x{self.ours:08X}"
+        target = "(end)" if self.target is None else f"0x{self.target:08X}"
+        return f"first difference at 0x{self.offset:X}: {ours} != {target}"
+
+
+@dataclass
+class FunctionResult:
+    name: str
+    difference: Optional[Difference]
+    missing: Optional[str] = None  # "ours" or "target" if only in one object
+
+    @property
+    def matches(self) -> bool:
+        return self.difference is None and self.missing is None
+
+    def __str__(self) -> str:
+        if self.missing:
+            return f"{self.name}: not in {self.missing} object"
+        if self.difference:
+            return f"{self.name}: {self.difference}"
+        return f"MATCH: {self.name}"
+
+
+def relocation_masks(reader: ElfReader, section: str = ".text") -> Dict[int, int]:
+    """
+    Returns the bits filled in by relocations, by word index
+    """
+    masks: Dict[int, int] = {}
+    for offset, _, reloc_type in reader.relocations(section):
+        mask = RELOCATION_MASKS.get(reloc_type, DEFAULT_RELOCATION_MASK)
+        masks[offset // 4] = masks.get(offset // 4, 0) | mask
+    return masks
+
+
+def apply_masks(words: List[int], masks: Dict[int, int]) -> List[int]:
+    res = list(words)
+    for index, mask in masks.items():
+        if index < len(res):
+            res[index] &= ~mask & 0xFFFFFFFF
+    return res
+
+
+def masked_words(reader: ElfReader, section: str = ".text") -> List[int]:
+    return apply_masks(reader.words(section), relocation_masks(reader, section))
+
+
+def function_ranges(
+    reader: ElfReader, section: str = ".text"
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Returns the (start, end) word indices of every function in the section.
+    Symbols without a size (e.g. in objects converted from PSY-Q) run until
+    the next symbol or the end of the section.
+    """
+    index = reader.sections.get(section)
+    size = len(reader.section_data(section)) // 4
+    symbols = [
+        x
+        for x in reader.symbols
+        if x.shndx == index
+        and x.name
+        and x.type in (STT_FUNC, STT_NOTYPE)
+        and not x.name.startswith("$")
+    ]
+    starts = sorted({x.value // 4 for x in symbols} | {size})
+
+    ranges = {}
+    for symbol in symbols:
+        start = symbol.value // 4
+        if symbol.size:
+            end = start + symbol.size // 4
+        else:
+            end = next(x for x in starts if x > start) if start < size else size
+        ranges.setdefault(symbol.name, (start, min(end, size)))
+    return ranges
+
+
+def find_function_difference(
+    ours: List[int], target: List[int]
+) -> Optional[Difference]:
+    for i, (our_word, target_word) in enumerate(zip(ours, target)):
+        if our_word != target_word:
+            return Difference(i * 4, our_word, target_word)
+
+    # GNU as pads .text with zeros (nops), ASPSX doesn't
+    if any(ours[len(target) :]):
+        return Difference(len(target) * 4, ours[len(target)], None)
+    if any(target[len(ours) :]):
+        return Difference(len(ours) * 4, None, target[len(ours)])
+    return None
+
+
+def compare_objects(
+    ours: ElfReader, target: ElfReader, section: str = ".text"
+) -> List[FunctionResult]:
+    """
+    Compares the section function by function, ignoring relocated fields, in
+    the order the functions appear in our object
+    """
+    our_words = masked_words(ours, section)
+    target_words = masked_words(target, section)
+    our_ranges = function_ranges(ours, section)
+    target_ranges = function_ranges(target, section)
+
+    results = []
+    for name, (start, end) in sorted(our_ranges.items(), key=lambda x: x[1]):
+        if name not in target_ranges:
+            results.append(FunctionResult(name, None, missing="target"))
+            continue
+        target_start, target_end = target_ranges[name]
+        difference = find_function_difference(
+            our_words[start:end], target_words[target_start:target_end]
+        )
+        results.append(FunctionResult(name, difference))
+
+    for name in sorted(target_ranges.keys() - our_ranges.keys()):
+        results.append(FunctionResult(name, None, missing="ours"))
+    return results
+
+
+def compare_files(ours: Path, target: Path) -> List[FunctionResult]:
+    with ElfReader.open(ours) as our_reader, ElfReader.open(target) as target_reader:
+        return compare_objects(our_reader, target_reader)
@@ -0,0 +1,110 @@
+import os
+import re
+
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from maspsx.sinks import LineSink
+
+# e.g. .include "macro.inc" or .include "asm/nonmatchings/main/func.s" # maspsx-keep
+INCLUDE_RE = re.compile(r'^\s*\.(include|incbin)\s+"([^"]+)"')
+
+
+def find_includes(lines: Iterable[str]) -> List[Tuple[str, str]]:
+    """
+    Returns the (directive, file) of every .include/.incbin, in order
+    """
+    res = []
+    for line in lines:
+        match = INCLUDE_RE.match(line)
+        if match:
+            res.append((match.group(1), match.group(2)))
+    return res
+
+
+class IncludeSink(LineSink):
+    """
+    Records what the output includes, as it's produced
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def append(self, line: str) -> None:
+        if ".inc" in line:
+            self.lines.append(line)
+
+    @property
+    def includes(self) -> List[Tuple[str, str]]:
+        return find_includes(self.lines)
+
+
+def include_dirs(as_args: List[str]) -> List[Path]:
+    """
+    The -I directories GNU as will search, in order
+    """
+    res = []
+    for i, arg in enumerate(as_args):
+        if arg == "-I" and i + 1 < len(as_args):
+            res.append(Path(as_args[i + 1]))
+        elif arg.startswith("-I") and len(arg) > 2:
+            res.append(Path(arg[2:]))
+    return res
+
+
+def resolve_include(name: str, search_dirs: List[Path]) -> Optional[Path]:
+    # like GNU as, the current directory comes first
+    path = Path(name)
+    if path.is_absolute() or path.is_file():
+        return path if path.is_file() else None
+    for directory in search_dirs:
+        candidate = directory / path
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def find_dependencies(
+    includes: List[Tuple[str, str]], search_dirs: List[Path]
+) -> List[Path]:
+    """
+    Resolves includes (and whatever .include'd files include in turn),
+    anything that can't be found is left out as GNU as will report it
+    """
+    res: List[Path] = []
+    seen: Set[Path] = set()
+    pending = list(includes)
+    while pending:
+        directive, name = pending.pop(0)
+        path = resolve_include(name, search_dirs)
+        if path is None or path in seen:
+            continue
+        seen.add(path)
+        res.append(path)
+        if directive == "include":
+            text = path.read_text(encoding="latin-1")
+            pending += find_includes(text.splitlines())
+    return res
+
+
+def escape_make(path: str) -> str:
+    res = path.replace("$", "$$").replace("#", "\\#")
+    return re.sub(r"(\\*) ", lambda m: "\\" * (2 * len(m.group(1)) + 1) + " ", res)
+
+
+def format_depfile(target: str, dependencies: Iterable[Path]) -> str:
+    """
+    Make syntax, which ninja understands too
+    """
+    res = f"{escape_make(target)}:"
+    for dependency in dependencies:
+        res += f" \\\n  {escape_make(os.fspath(dependency))}"
+    return res + "\n"
+
+
+def write_depfile(
+    path: Path, target: str, includes: List[Tuple[str, str]], as_args: List[str]
+) -> None:
+    dependencies = find_dependencies(includes, include_dirs(as_args))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(format_depfile(target, dependencies), encoding="utf")
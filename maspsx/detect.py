@@ -0,0 +1,101 @@
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from maspsx.assembler import run_assembler
+from maspsx.compare import (
+    Difference,
+    apply_masks,
+    find_function_difference,
+    relocation_masks,
+)
+from maspsx.elf import ElfReader, is_elf
+from maspsx.sweep import process_versions
+
+
+@dataclass
+class VersionResult:
+    versions: List[str]
+    difference: Optional[Difference]
+
+    @property
+    def matches(self) -> bool:
+        return self.difference is None
+
+
+def to_words(text: bytes) -> List[int]:
+    count = len(text) // 4
+    return list(struct.unpack_from(f"<{count}I", text))
+
+
+def text_words(data: bytes) -> Tuple[List[int], Dict[int, int]]:
+    """
+    Returns the .text words of an ELF object (or raw bytes), and the bits of
+    them that are filled in by relocations
+    """
+    if is_elf(data):
+        reader = ElfReader(data)
+        return reader.words(".text"), relocation_masks(reader)
+    return to_words(data), {}
+
+
+def find_first_difference(ours: bytes, target: bytes) -> Optional[Difference]:
+    """
+    Compares the .text of two ELF objects (or raw bytes), ignoring relocated
+    fields and trailing padding. A linked target has no relocations, so the
+    fields relocated in ours are ignored in both.
+    """
+    our_words, our_masks = text_words(ours)
+    target_words, target_masks = text_words(target)
+    masks = dict(target_masks)
+    for index, mask in our_masks.items():
+        masks[index] = masks.get(index, 0) | mask
+    return find_function_difference(
+        apply_masks(our_words, masks), apply_masks(target_words, masks)
+    )
+
+
+def read_target(path: Path, as_path: str, as_args: List[str]) -> bytes:
+    """
+    Target may be an ELF object, an assembly file (e.g. from splat), or raw bytes
+    """
+    if path.suffix in (".s", ".S"):
+        return run_assembler(path.read_text(encoding="utf"), as_path, as_args)
+    return path.read_bytes()
+
+
+def read_target_text(path: Path, as_path: str, as_args: List[str]) -> bytes:
+    data = read_target(path, as_path, as_args)
+    if is_elf(data):
+        return bytes(ElfReader(data).section_data(".text"))
+    return data
+
+
+def detect_version(
+    lines: List[str],
+    target: bytes,
+    versions: List[str],
+    assemble: Callable[[str], bytes],
+    jobs: Optional[int] = None,
+    **kwargs,
+) -> List[VersionResult]:
+    """
+    Assemble each distinct version variant (in parallel) and compare the
+    resulting .text against the target. assemble should return an ELF object
+    (or .text bytes), as should target.
+    """
+    variants = process_versions(lines, versions, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        texts = list(pool.map(assemble, [x.text for x in variants]))
+
+    return [
+        VersionResult(
+            versions=variant.versions,
+            difference=find_first_difference(text, target),
+        )
+        for variant, text in zip(variants, texts)
+    ]
@@ -0,0 +1,188 @@
+import argparse
+import codecs
+import os
+import subprocess
+
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional
+
+from maspsx.api import create_processor
+from maspsx.options import MaspsxOptions, add_option_arguments, options_from_args
+from maspsx.reader import BYTES_ENCODING
+from maspsx.sinks import AssemblerSink
+
+# flags that take a separate argument, and where they go
+CPP_ARG_FLAGS = ("-I", "-D", "-U", "-include", "-imacros", "-isystem", "-idirafter")
+CPP_FLAGS = ("-nostdinc", "-undef", "-trigraphs", "-P", "-C")
+
+READ_SIZE = 1 << 16
+
+
+@dataclass
+class Invocation:
+    """
+    A gcc-style command line split into what each stage of the pipeline gets
+    """
+
+    source: str
+    output: str
+    cpp_args: List[str] = field(default_factory=list)
+    cc1_args: List[str] = field(default_factory=list)
+    as_args: List[str] = field(default_factory=list)
+    options: MaspsxOptions = MaspsxOptions()
+    cpp_path: str = "cpp"
+    cc1_path: str = "cc1"
+    as_path: str = "mipsel-linux-gnu-as"
+
+    @property
+    def cpp_cmd(self) -> List[str]:
+        return [self.cpp_path, *self.cpp_args, self.source]
+
+    @property
+    def cc1_cmd(self) -> List[str]:
+        return [self.cc1_path, *self.cc1_args]
+
+    @property
+    def as_cmd(self) -> List[str]:
+        return [self.as_path, *self.as_args, "-o", self.output, "-"]
+
+
+def as_debug_flag(arg: str) -> str:
+    # as only knows the level, e.g. -gcoff2 (for cc1) is -g2
+    level = arg[-1] if arg[-1].isdigit() else ""
+    return f"-g{level}"
+
+
+def parse_invocation(argv: List[str]) -> Invocation:
+    """
+    -I/-D/-U/-include and -Wp, go to cpp. -G, -mcpu, -O and -g go to both
+    cc1 and as (filtered the same way maspsx.py filters its as args), -Wa,
+    goes to as and anything else (-f, -m, -W, -quiet etc.) to cc1. maspsx's
+    own flags (e.g. --aspsx-version) are accepted as well.
+    """
+    parser = argparse.ArgumentParser(prog="maspsx-cc", add_help=False)
+    add_option_arguments(parser)
+    parser.add_argument("--cpp-path", default="cpp")
+    parser.add_argument("--cc1-path", default="cc1")
+    parser.add_argument("--gnu-as-path", default="mipsel-linux-gnu-as")
+    parser.add_argument("-o", dest="output")
+    parser.add_argument("-c", action="store_true")
+    args, rest = parser.parse_known_args(argv)
+
+    cpp_args: List[str] = []
+    cc1_args: List[str] = []
+    as_args: List[str] = []
+    sources: List[str] = []
+
+    i = 0
+    while i < len(rest):
+        arg = rest[i]
+        i += 1
+        if arg in CPP_ARG_FLAGS:
+            if i == len(rest):
+                raise ValueError(f"missing argument to {arg}")
+            cpp_args += [arg, rest[i]]
+            i += 1
+        elif arg.startswith(("-I", "-D", "-U")) or arg in CPP_FLAGS:
+            cpp_args.append(arg)
+        elif arg.startswith("-Wp,"):
+            cpp_args += arg.split(",")[1:]
+        elif arg.startswith("-Wa,"):
+            as_args += arg.split(",")[1:]
+        elif arg.startswith(("-G", "-mcpu=", "-O")):
+            cc1_args.append(arg)
+            as_args.append(arg)
+        elif arg.startswith("-g"):
+            cc1_args.append(arg)
+            as_args.append(as_debug_flag(arg))
+        elif arg.startswith("-") and arg != "-":
+            cc1_args.append(arg)
+        else:
+            sources.append(arg)
+
+    if len(sources) != 1:
+        raise ValueError("exactly one source file is required")
+    if not args.output:
+        raise ValueError("-o is required")
+
+    if "-quiet" not in cc1_args and "-v" not in cc1_args:
+        cc1_args.append("-quiet")
+
+    options, as_args = options_from_args(args, as_args)
+    return Invocation(
+        source=sources[0],
+        output=args.output,
+        cpp_args=cpp_args,
+        cc1_args=cc1_args,
+        as_args=as_args,
+        options=options,
+        cpp_path=args.cpp_path,
+        cc1_path=args.cc1_path,
+        as_path=args.gnu_as_path,
+    )
+
+
+def read_lines(stream: BinaryIO) -> List[str]:
+    """
+    Reads all of the stream into stripped lines, decoding each chunk as it
+    arrives so that cc1 is never blocked on a full pipe. Nothing is processed
+    until cc1 has finished, as the processor needs the whole TU first (e.g. gcc
+    writes .comm declarations after the functions that use them).
+    """
+    decoder = codecs.getincrementaldecoder(BYTES_ENCODING)()
+    lines: List[str] = []
+    partial = ""
+    while True:
+        chunk = stream.read1(READ_SIZE)  # type: ignore[attr-defined]
+        text = partial + decoder.decode(chunk, final=not chunk)
+        *complete, partial = text.split("\n")
+        lines += [x.strip() for x in complete]
+        if not chunk:
+            break
+    if partial:
+        lines.append(partial.strip())
+    return lines
+
+
+def compile_source(invocation: Invocation) -> int:
+    """
+    Runs cpp | cc1 | maspsx | as, returns the first non-zero exit status (if
+    any), in which case the output object is removed
+    """
+    cpp = subprocess.Popen(invocation.cpp_cmd, stdout=subprocess.PIPE)
+    cc1: Optional[subprocess.Popen] = None
+    sink: Optional[AssemblerSink] = None
+    try:
+        cc1 = subprocess.Popen(
+            invocation.cc1_cmd, stdin=cpp.stdout, stdout=subprocess.PIPE
+        )
+        assert cpp.stdout is not None and cc1.stdout is not None
+        # cc1 gets EOF (or SIGPIPE) when cpp exits, not when we do
+        cpp.stdout.close()
+
+        with cc1.stdout:
+            lines = read_lines(cc1.stdout)
+        cpp_returncode, cc1_returncode = cpp.wait(), cc1.wait()
+        returncode = cpp_returncode or cc1_returncode
+        if returncode:
+            return returncode
+
+        processor = create_processor(lines, invocation.options, stripped=True)
+        sink = AssemblerSink(invocation.as_cmd, encoding=BYTES_ENCODING)
+        sink.extend(invocation.options.preamble)
+        processor.process_lines_into(sink)
+        sink.close()
+        returncode = sink.returncode or 0
+    except BaseException:
+        for process in (cpp, cc1):
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+        if sink is not None:
+            sink.abort()
+        returncode = 1
+        raise
+    finally:
+        if returncode and os.path.exists(invocation.output):
+            os.remove(invocation.output)
+    return returncode
@@ -0,0 +1,382 @@
+import mmap
+import os
+import struct
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ELF_MAGIC = b"\x7fELF"
+
+ELF32_HEADER = struct.Struct("<16sHHIIIIIHHHHHH")
+ELF32_SECTION_HEADER = struct.Struct("<IIIIIIIIII")
+
+SHT_NOBITS = 8
+
+
+def is_elf(data: bytes) -> bool:
+    return data[:4] == ELF_MAGIC
+
+
+ELF32_SYMBOL = struct.Struct("<IIIBBH")
+ELF32_REL = struct.Struct("<II")
+
+ET_REL = 1
+EM_MIPS = 8
+
+EF_MIPS_NOREORDER = 0x1
+EF_MIPS_ABI_O32 = 0x1000
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_REL = 9
+SHT_MIPS_REGINFO = 0x70000006
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_MIPS_GPREL = 0x10000000
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_SECTION = 3
+
+SHN_UNDEF = 0
+SHN_COMMON = 0xFFF2
+
+COMMON_SECTION = "*COM*"  # ElfSymbol.section for common symbols, value is the alignment
+
+R_MIPS_32 = 2
+R_MIPS_26 = 4
+R_MIPS_HI16 = 5
+R_MIPS_LO16 = 6
+R_MIPS_GPREL16 = 7
+
+
+@dataclass
+class ElfSection:
+    name: str
+    sh_type: int
+    flags: int
+    data: bytes = b""
+    size: int = 0  # only used for SHT_NOBITS
+    addralign: int = 1
+    entsize: int = 0
+
+
+@dataclass
+class ElfSymbol:
+    name: str
+    value: int = 0
+    size: int = 0
+    bind: int = STB_LOCAL
+    type: int = STT_NOTYPE
+    section: Optional[str] = None  # None for undefined, or COMMON_SECTION
+
+
+@dataclass
+class ElfRelocation:
+    offset: int
+    symbol: str  # a symbol name, or a section name for STT_SECTION symbols
+    type: int
+
+
+class StringTable:
+    def __init__(self):
+        self.data = bytearray(b"\0")
+        self.offsets: Dict[str, int] = {"": 0}
+
+    def add(self, value: str) -> int:
+        if value not in self.offsets:
+            self.offsets[value] = len(self.data)
+            self.data += value.encode("utf") + b"\0"
+        return self.offsets[value]
+
+
+def write_elf_relocatable(
+    sections: List[ElfSection],
+    symbols: List[ElfSymbol],
+    relocations: Dict[str, List[ElfRelocation]],
+    e_flags: int = 0,
+    e_machine: int = EM_MIPS,
+) -> bytes:
+    """
+    Write a 32-bit little-endian ELF relocatable object. A section symbol is
+    created for every section, relocations against a section name use it.
+    """
+    headers: List[Tuple[ElfSection, int, int]] = []  # section, link, info
+    section_indices: Dict[str, int] = {}
+    for section in sections:
+        section_indices[section.name] = len(headers) + 1
+        headers.append((section, 0, 0))
+
+    # locals (including section symbols) must come first
+    all_symbols = [ElfSymbol("")]
+    all_symbols += [ElfSymbol("", type=STT_SECTION, section=x.name) for x in sections]
+    all_symbols += [x for x in symbols if x.bind == STB_LOCAL]
+    first_global = len(all_symbols)
+    all_symbols += [x for x in symbols if x.bind != STB_LOCAL]
+
+    symbol_indices = {}
+    for i, symbol in enumerate(all_symbols):
+        if symbol.type == STT_SECTION:
+            symbol_indices[symbol.section] = i
+        elif symbol.name:
+            symbol_indices[symbol.name] = i
+
+    section_indices[COMMON_SECTION] = SHN_COMMON
+
+    strtab = StringTable()
+    symtab = bytearray(len(all_symbols) * ELF32_SYMBOL.size)
+    for i, symbol in enumerate(all_symbols):
+        ELF32_SYMBOL.pack_into(
+            symtab,
+            i * ELF32_SYMBOL.size,
+            strtab.add(symbol.name),
+            symbol.value,
+            symbol.size,
+            (symbol.bind << 4) | symbol.type,
+            0,
+            section_indices[symbol.section] if symbol.section else SHN_UNDEF,
+        )
+
+    symtab_index = len(headers) + 1
+    headers.append(
+        (
+            ElfSection(
+                ".symtab", SHT_SYMTAB, 0, bytes(symtab), addralign=4, entsize=16
+            ),
+            symtab_index + 1,
+            first_global,
+        )
+    )
+    headers.append((ElfSection(".strtab", SHT_STRTAB, 0, bytes(strtab.data)), 0, 0))
+
+    for name, relocs in relocations.items():
+        if not relocs:
+            continue
+        data = bytearray(len(relocs) * ELF32_REL.size)
+        for i, x in enumerate(relocs):
+            ELF32_REL.pack_into(
+                data,
+                i * ELF32_REL.size,
+                x.offset,
+                (symbol_indices[x.symbol] << 8) | x.type,
+            )
+        data = bytes(data)
+        headers.append(
+            (
+                ElfSection(f".rel{name}", SHT_REL, 0, data, addralign=4, entsize=8),
+                symtab_index,
+                section_indices[name],
+            )
+        )
+
+    shstrtab = StringTable()
+    for section, _, _ in headers:
+        shstrtab.add(section.name)
+    shstrtab_name = shstrtab.add(".shstrtab")
+    headers.append((ElfSection(".shstrtab", SHT_STRTAB, 0, b""), 0, 0))
+    shstrtab_data = bytes(shstrtab.data)
+
+    data = bytearray(ELF32_HEADER.size)
+    section_headers = bytearray(ELF32_SECTION_HEADER.size)
+    for section, link, info in headers:
+        contents = shstrtab_data if section.name == ".shstrtab" else section.data
+        if section.sh_type == SHT_NOBITS:
+            offset, size = len(data), section.size
+        else:
+            data += bytes(-len(data) % section.addralign)
+            offset, size = len(data), len(contents)
+            data += contents
+        section_headers += ELF32_SECTION_HEADER.pack(
+            (
+                shstrtab_name
+                if section.name == ".shstrtab"
+                else shstrtab.add(section.name)
+            ),
+            section.sh_type,
+            section.flags,
+            0,  # sh_addr
+            offset,
+            size,
+            link,
+            info,
+            section.addralign,
+            section.entsize,
+        )
+
+    data += bytes(-len(data) % 4)
+    e_shoff = len(data)
+    data += section_headers
+
+    ELF32_HEADER.pack_into(
+        data,
+        0,
+        ELF_MAGIC + bytes([1, 1, 1]) + bytes(9),  # 32-bit, little-endian, v1
+        ET_REL,
+        e_machine,
+        1,  # e_version
+        0,  # e_entry
+        0,  # e_phoff
+        e_shoff,
+        e_flags,
+        ELF32_HEADER.size,
+        0,  # e_phentsize
+        0,  # e_phnum
+        ELF32_SECTION_HEADER.size,
+        len(headers) + 1,
+        len(headers),  # .shstrtab is last
+    )
+    return bytes(data)
+
+
+@dataclass
+class ElfSectionHeader:
+    name: str
+    sh_type: int
+    offset: int
+    size: int
+    link: int
+    info: int
+
+
+@dataclass
+class ElfSymbolEntry:
+    name: str
+    value: int
+    size: int
+    bind: int
+    type: int
+    shndx: int
+
+
+class ElfReader:
+    """
+    Indexes the sections, symbols and relocations of a 32-bit little-endian
+    ELF object without copying it, data may be bytes, a memoryview or an mmap
+    """
+
+    def __init__(self, data):
+        # anything with .find() for reading strings, i.e. not a memoryview
+        self.raw = bytes(data) if isinstance(data, memoryview) else data
+        self.data = memoryview(self.raw)
+        if bytes(self.data[:4]) != ELF_MAGIC:
+            raise Exception("Not an ELF object!")
+        if self.data[4] != 1 or self.data[5] != 1:
+            raise Exception("Only 32-bit little-endian ELF objects are supported")
+
+        header = ELF32_HEADER.unpack_from(self.data, 0)
+        e_shoff, e_shentsize, e_shnum, e_shstrndx = (
+            header[6],
+            header[11],
+            header[12],
+            header[13],
+        )
+        raw = [
+            ELF32_SECTION_HEADER.unpack_from(self.data, e_shoff + i * e_shentsize)
+            for i in range(e_shnum)
+        ]
+        shstrtab_offset = raw[e_shstrndx][4] if e_shnum else 0
+
+        self.headers: List[ElfSectionHeader] = []
+        self.sections: Dict[str, int] = {}
+        for i, (sh_name, sh_type, _, _, offset, size, link, info, *_) in enumerate(raw):
+            name = self._string(shstrtab_offset + sh_name) if i else ""
+            self.headers.append(
+                ElfSectionHeader(name, sh_type, offset, size, link, info)
+            )
+            if i and name not in self.sections:
+                self.sections[name] = i
+
+        self._symbols: Optional[List[ElfSymbolEntry]] = None
+
+    @classmethod
+    @contextmanager
+    def open(cls, path: Path) -> Iterator["ElfReader"]:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise Exception(f"{path} is empty!")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                reader = cls(data)
+                try:
+                    yield reader
+                finally:
+                    # the mmap can't be closed while views of it exist
+                    reader.data.release()
+
+    def _string(self, offset: int) -> str:
+        return bytes(self.data[offset : self.raw.find(b"\0", offset)]).decode("utf")
+
+    def _header_data(self, header: ElfSectionHeader) -> memoryview:
+        if header.sh_type == SHT_NOBITS:
+            return memoryview(bytes(header.size))
+        return self.data[header.offset : header.offset + header.size]
+
+    def section_data(self, name: str) -> memoryview:
+        if name not in self.sections:
+            raise Exception(f"Didn't find a {name} section!")
+        return self._header_data(self.headers[self.sections[name]])
+
+    def words(self, name: str = ".text") -> List[int]:
+        data = self.section_data(name)
+        return list(struct.unpack_from(f"<{len(data) // 4}I", data))
+
+    @property
+    def symbols(self) -> List[ElfSymbolEntry]:
+        if self._symbols is None:
+            self._symbols = []
+            for header in self.headers:
+                if header.sh_type != SHT_SYMTAB:
+                    continue
+                strtab_offset = self.headers[header.link].offset
+                for i in range(header.size // ELF32_SYMBOL.size):
+                    name, value, size, info, _, shndx = ELF32_SYMBOL.unpack_from(
+                        self.data, header.offset + i * ELF32_SYMBOL.size
+                    )
+                    self._symbols.append(
+                        ElfSymbolEntry(
+                            self._string(strtab_offset + name),
+                            value,
+                            size,
+                            info >> 4,
+                            info & 0xF,
+                            shndx,
+                        )
+                    )
+        return self._symbols
+
+    def relocations(self, name: str) -> List[Tuple[int, int, int]]:
+        """
+        Returns (offset, symbol index, type) for every relocation against the
+        section
+        """
+        index = self.sections.get(name)
+        res = []
+        for header in self.headers:
+            if header.sh_type != SHT_REL or header.info != index:
+                continue
+            for offset, info in ELF32_REL.iter_unpack(
+                self.data[header.offset : header.offset + header.size]
+            ):
+                res.append((offset, info >> 8, info & 0xFF))
+        return res
+
+
+def read_elf_sections(data: bytes) -> Dict[str, bytes]:
+    """
+    Returns the contents of every section in a 32-bit little-endian ELF object
+    """
+    reader = ElfReader(data)
+    return {x.name: bytes(reader._header_data(x)) for x in reader.headers[1:]}
+
+
+def read_elf_section(data: bytes, name: str) -> bytes:
+    return bytes(ElfReader(data).section_data(name))
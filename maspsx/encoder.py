@@ -0,0 +1,1199 @@
+"""
+A native assembler for the subset of MIPS I that maspsx emits, writing the same
+section contents as GNU as (with -G0, non-PIC, under .set noreorder) so that
+--run-assembler doesn't need to spawn mipsel-linux-gnu-as for every TU.
+
+Anything outside of that subset raises UnsupportedAssembly and the caller is
+expected to fall back to GNU as.
+"""
+
+import re
+import struct
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from maspsx.assembler import output_path, strip_output_args
+from maspsx.elf import (
+    EF_MIPS_ABI_O32,
+    EF_MIPS_NOREORDER,
+    R_MIPS_26,
+    R_MIPS_32,
+    R_MIPS_GPREL16,
+    R_MIPS_HI16,
+    R_MIPS_LO16,
+    SHF_ALLOC,
+    SHF_EXECINSTR,
+    SHF_MIPS_GPREL,
+    SHF_WRITE,
+    SHT_MIPS_REGINFO,
+    SHT_NOBITS,
+    SHT_PROGBITS,
+    STB_GLOBAL,
+    STB_LOCAL,
+    STB_WEAK,
+    STT_FUNC,
+    STT_NOTYPE,
+    STT_OBJECT,
+    ElfRelocation,
+    ElfSection,
+    ElfSymbol,
+    write_elf_relocatable,
+)
+from maspsx.ir import parse_statement, split_comment
+from maspsx.sinks import AssemblerSink, LineSink
+
+# name: (sh_type, flags, default alignment as a power of 2)
+SECTIONS = {
+    ".text": (SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, 4),
+    ".data": (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE, 4),
+    ".bss": (SHT_NOBITS, SHF_ALLOC | SHF_WRITE, 4),
+    ".rodata": (SHT_PROGBITS, SHF_ALLOC, 0),
+    ".sdata": (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE | SHF_MIPS_GPREL, 0),
+    ".sbss": (SHT_NOBITS, SHF_ALLOC | SHF_WRITE | SHF_MIPS_GPREL, 0),
+}
+SECTION_DIRECTIVES = {
+    ".text": ".text",
+    ".data": ".data",
+    ".bss": ".bss",
+    ".rdata": ".rodata",
+    ".sdata": ".sdata",
+}
+
+# GNU as args that don't change the output (-G is handled separately)
+IGNORED_ARGS = ("-EL", "-march=r3000", "-mips1", "-no-pad-sections")
+IGNORED_ARG_PREFIXES = ("-mtune=", "-I", "-O")
+
+REGISTER_NAMES = {
+    "zero": 0,
+    "at": 1,
+    "v0": 2,
+    "v1": 3,
+    "a0": 4,
+    "a1": 5,
+    "a2": 6,
+    "a3": 7,
+    **{f"t{i}": 8 + i for i in range(8)},
+    **{f"s{i}": 16 + i for i in range(8)},
+    "t8": 24,
+    "t9": 25,
+    "k0": 26,
+    "k1": 27,
+    "gp": 28,
+    "sp": 29,
+    "fp": 30,
+    "s8": 30,
+    "ra": 31,
+}
+ZERO = 0
+AT = 1
+
+LABEL_PREFIX_RE = re.compile(r"^([A-Za-z_.$][A-Za-z0-9_.$]*):\s+(\S.*)$")
+
+# op: (opcode, funct), "rd,rs,rt"
+R3_OPS = {
+    "add": 0x20,
+    "addu": 0x21,
+    "sub": 0x22,
+    "subu": 0x23,
+    "and": 0x24,
+    "or": 0x25,
+    "xor": 0x26,
+    "nor": 0x27,
+    "slt": 0x2A,
+    "sltu": 0x2B,
+}
+# "rd,rt,rs" variable shifts, and "rd,rt,shamt" shifts
+SHIFT_V_OPS = {"sllv": 0x04, "srlv": 0x06, "srav": 0x07}
+SHIFT_OPS = {"sll": (0x00, "sllv"), "srl": (0x02, "srlv"), "sra": (0x03, "srav")}
+# "rs,rt"
+MULT_DIV_OPS = {"mult": 0x18, "multu": 0x19, "div": 0x1A, "divu": 0x1B}
+TRAP_OPS = {
+    "tge": 0x30,
+    "tgeu": 0x31,
+    "tlt": 0x32,
+    "tltu": 0x33,
+    "teq": 0x34,
+    "tne": 0x36,
+}
+# "rt,rs,imm" and whether the immediate is zero-extended
+I_OPS = {
+    "addi": (0x08, False),
+    "addiu": (0x09, False),
+    "slti": (0x0A, False),
+    "sltiu": (0x0B, False),
+    "andi": (0x0C, True),
+    "ori": (0x0D, True),
+    "xori": (0x0E, True),
+}
+# register-register op -> immediate op (used by GNU as when passed a constant)
+IMMEDIATE_FORMS = {
+    "add": "addi",
+    "addu": "addiu",
+    "slt": "slti",
+    "sltu": "sltiu",
+    "and": "andi",
+    "or": "ori",
+    "xor": "xori",
+}
+LOAD_OPS = {
+    "lb": 0x20,
+    "lh": 0x21,
+    "lwl": 0x22,
+    "lw": 0x23,
+    "lbu": 0x24,
+    "lhu": 0x25,
+    "lwr": 0x26,
+}
+STORE_OPS = {"sb": 0x28, "sh": 0x29, "swl": 0x2A, "sw": 0x2B, "swr": 0x2E}
+COP2_MEM_OPS = {"lwc2": 0x32, "swc2": 0x3A}
+# "rs,rt,label" / "rs,label"
+BRANCH_OPS = {"beq": 0x04, "bne": 0x05}
+BRANCH_Z_OPS = {
+    "blez": (0x06, 0),
+    "bgtz": (0x07, 0),
+    "bltz": (0x01, 0x00),
+    "bgez": (0x01, 0x01),
+    "bltzal": (0x01, 0x10),
+    "bgezal": (0x01, 0x11),
+}
+COP_MOVE_OPS = {
+    "mfc0": (0x10, 0x0),
+    "mtc0": (0x10, 0x4),
+    "mfc2": (0x12, 0x0),
+    "cfc2": (0x12, 0x2),
+    "mtc2": (0x12, 0x4),
+    "ctc2": (0x12, 0x6),
+}
+
+
+class UnsupportedAssembly(Exception):
+    pass
+
+
+@dataclass
+class Value:
+    """
+    The result of an expression, sym + addend, optionally wrapped in a relocation
+    operator (%hi, %lo or %gp_rel)
+    """
+
+    addend: int = 0
+    symbol: Optional[str] = None
+    operator: Optional[str] = None
+
+    @property
+    def is_constant(self) -> bool:
+        return self.symbol is None and self.operator is None
+
+
+TOKEN_RE = re.compile(
+    r"\s*(?:(0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)|([A-Za-z_.$][A-Za-z0-9_.$]*)|(<<|>>|[-+*/%&|^~()]))"
+)
+
+
+class ExpressionParser:
+    """
+    Recursive descent parser for the constant expressions that gcc and maspsx emit
+    """
+
+    PRECEDENCE = [("|",), ("^",), ("&",), ("<<", ">>"), ("+", "-"), ("*", "/", "%")]
+
+    def __init__(self, text: str):
+        self.tokens: List[Tuple[str, str]] = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                raise UnsupportedAssembly(f"Unable to parse expression: {text}")
+            number, name, operator = match.groups()
+            if number is not None:
+                self.tokens.append(("number", number))
+            elif name is not None:
+                self.tokens.append(("name", name))
+            else:
+                self.tokens.append(("op", operator))
+            pos = match.end()
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+        self.pos = 0
+        self.text = text
+
+    def parse(self) -> Value:
+        value = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise UnsupportedAssembly(f"Unable to parse expression: {self.text}")
+        return value
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def binary(self, level: int) -> Value:
+        if level == len(self.PRECEDENCE):
+            return self.unary()
+        lhs = self.binary(level + 1)
+        while True:
+            token = self.peek()
+            if (
+                token is None
+                or token[0] != "op"
+                or token[1] not in self.PRECEDENCE[level]
+            ):
+                return lhs
+            self.pos += 1
+            lhs = apply_operator(token[1], lhs, self.binary(level + 1))
+
+    def unary(self) -> Value:
+        token = self.peek()
+        if token is None:
+            raise UnsupportedAssembly(f"Unable to parse expression: {self.text}")
+        self.pos += 1
+        kind, value = token
+        if kind == "number":
+            if value[:2] in ("0x", "0X"):
+                return Value(int(value, 16))
+            if value[:2] in ("0b", "0B"):
+                return Value(int(value[2:], 2))
+            if len(value) > 1 and value[0] == "0":
+                return Value(int(value, 8))
+            return Value(int(value))
+        if kind == "name":
+            return Value(symbol=value)
+        if value == "(":
+            inner = self.binary(0)
+            if self.peek() != ("op", ")"):
+                raise UnsupportedAssembly(f"Unbalanced parentheses: {self.text}")
+            self.pos += 1
+            return inner
+        if value in ("-", "~", "+"):
+            operand = self.unary()
+            if value == "+":
+                return operand
+            if not operand.is_constant:
+                raise UnsupportedAssembly(f"Unsupported expression: {self.text}")
+            return Value(-operand.addend if value == "-" else ~operand.addend)
+        raise UnsupportedAssembly(f"Unable to parse expression: {self.text}")
+
+
+def apply_operator(operator: str, lhs: Value, rhs: Value) -> Value:
+    if operator == "+" and (lhs.is_constant or rhs.is_constant):
+        return Value(lhs.addend + rhs.addend, lhs.symbol or rhs.symbol)
+    if operator == "-" and rhs.is_constant:
+        return Value(lhs.addend - rhs.addend, lhs.symbol)
+    if not (lhs.is_constant and rhs.is_constant):
+        raise UnsupportedAssembly("Unsupported symbolic expression")
+
+    a, b = lhs.addend, rhs.addend
+    if operator in ("/", "%"):
+        if b == 0:
+            raise UnsupportedAssembly("Division by zero")
+        # C semantics, truncate towards zero
+        quotient = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)
+        return Value(quotient if operator == "/" else a - quotient * b)
+    return Value(
+        {
+            "+": lambda: a + b,
+            "-": lambda: a - b,
+            "*": lambda: a * b,
+            "<<": lambda: a << b,
+            ">>": lambda: a >> b,
+            "&": lambda: a & b,
+            "|": lambda: a | b,
+            "^": lambda: a ^ b,
+        }[operator]()
+    )
+
+
+def parse_expression(text: str) -> Value:
+    text = text.strip()
+    match = re.match(r"^%(hi|lo|gp_rel)\((.*)\)$", text)
+    if match:
+        value = ExpressionParser(match.group(2)).parse()
+        value.operator = match.group(1)
+        return value
+    if "%" in text.replace(" % ", ""):
+        raise UnsupportedAssembly(f"Unsupported relocation operator: {text}")
+    return ExpressionParser(text).parse()
+
+
+def parse_register(text: str) -> int:
+    text = text.strip()
+    if not text.startswith("$"):
+        raise UnsupportedAssembly(f"Expected a register: {text}")
+    name = text[1:]
+    if name.isdigit() and int(name) < 32:
+        return int(name)
+    if name in REGISTER_NAMES:
+        return REGISTER_NAMES[name]
+    raise UnsupportedAssembly(f"Unknown register: {text}")
+
+
+def is_register(text: str) -> bool:
+    try:
+        parse_register(text)
+    except UnsupportedAssembly:
+        return False
+    return True
+
+
+def parse_memory_operand(text: str) -> Tuple[Value, Optional[int]]:
+    """
+    e.g. "%lo(sym)($at)", "4($sp)", "($2)", "sym+4"
+    """
+    text = text.strip()
+    match = re.match(r"^(.*)\((\$[A-Za-z0-9]+)\)$", text)
+    if match and is_register(match.group(2)):
+        offset = match.group(1).strip()
+        return (
+            parse_expression(offset) if offset else Value(0),
+            parse_register(match.group(2)),
+        )
+    return (parse_expression(text), None)
+
+
+def parse_string(text: str) -> bytes:
+    text = text.strip()
+    if len(text) < 2 or text[0] != '"' or text[-1] != '"':
+        raise UnsupportedAssembly(f"Expected a string: {text}")
+    res = bytearray()
+    i = 1
+    while i < len(text) - 1:
+        c = text[i]
+        if c != "\\":
+            res += c.encode("latin-1")
+            i += 1
+            continue
+        i += 1
+        c = text[i]
+        if c in "01234567":
+            digits = re.match(r"[0-7]{1,3}", text[i:]).group(0)
+            res.append(int(digits, 8) & 0xFF)
+            i += len(digits)
+        elif c in "xX":
+            digits = re.match(r"[0-9a-fA-F]*", text[i + 1 :]).group(0)
+            if not digits:
+                raise UnsupportedAssembly(f"Bad escape in string: {text}")
+            res.append(int(digits, 16) & 0xFF)
+            i += 1 + len(digits)
+        else:
+            escapes = {"n": 10, "t": 9, "r": 13, "b": 8, "f": 12, "\\": 92, '"': 34}
+            if c not in escapes:
+                raise UnsupportedAssembly(f"Unsupported escape in string: {text}")
+            res.append(escapes[c])
+            i += 1
+    return bytes(res)
+
+
+def is_local_label(name: str) -> bool:
+    # labels that GNU as doesn't put in the symbol table
+    return name.startswith("$") or name.startswith(".L")
+
+
+def fits_signed_16(value: int) -> bool:
+    return -0x8000 <= value < 0x8000
+
+
+def fits_unsigned_16(value: int) -> bool:
+    return 0 <= value < 0x10000
+
+
+@dataclass
+class Fixup:
+    section: str
+    offset: int
+    type: int  # R_MIPS_*, or None for a branch to a local label
+    symbol: str
+    addend: int
+
+
+@dataclass
+class Section:
+    name: str
+    data: bytearray = field(default_factory=bytearray)
+    size: int = 0  # for SHT_NOBITS
+    alignment: int = 0  # as a power of 2
+
+    @property
+    def is_nobits(self) -> bool:
+        return SECTIONS[self.name][0] == SHT_NOBITS
+
+    @property
+    def offset(self) -> int:
+        return self.size if self.is_nobits else len(self.data)
+
+
+class NativeAssembler:
+    """
+    Encodes maspsx output into an ELF object, see assemble_native
+    """
+
+    def __init__(self, pad_sections=True):
+        self.pad_sections = pad_sections
+
+        self.sections: Dict[str, Section] = {}
+        self.section = self._get_section(".text")
+        self._get_section(".data")
+        self._get_section(".bss")
+
+        self.labels: Dict[str, Tuple[str, int]] = {}
+        self.globals: Set[str] = set()
+        self.weak: Set[str] = set()
+        self.symbol_types: Dict[str, int] = {}
+        self.symbol_sizes: Dict[str, int] = {}
+        self.function_starts: Dict[str, int] = {}
+
+        self.fixups: List[Fixup] = []
+        self.branches: List[Tuple[str, int, str]] = []
+        self.pending_labels: List[str] = []
+
+        self.is_reorder = True
+        self.any_noreorder = False
+        self.auto_align = True
+        self.gprmask = 0
+
+    def _get_section(self, name: str) -> Section:
+        if name not in SECTIONS:
+            raise UnsupportedAssembly(f"Unsupported section: {name}")
+        if name not in self.sections:
+            self.sections[name] = Section(name, alignment=SECTIONS[name][2])
+        return self.sections[name]
+
+    # output
+
+    def _emit_bytes(self, data: bytes) -> None:
+        self.pending_labels = []
+        if self.section.is_nobits:
+            if any(data):
+                raise UnsupportedAssembly(f"Data in {self.section.name}")
+            self.section.size += len(data)
+        else:
+            self.section.data += data
+
+    def _align(self, power: int) -> None:
+        padding = -self.section.offset % (1 << power)
+        if padding:
+            labels = self.pending_labels
+            self._emit_bytes(bytes(padding))
+            # GNU as moves labels immediately before an auto-aligned .word etc.
+            for label in labels:
+                self.labels[label] = (self.section.name, self.section.offset)
+        self.section.alignment = max(self.section.alignment, power)
+
+    def _emit(self, word: int, *regs: int) -> None:
+        if self.is_reorder:
+            raise UnsupportedAssembly("Instructions outside of .set noreorder")
+        if self.section.name != ".text":
+            raise UnsupportedAssembly(f"Instructions in {self.section.name}")
+        for reg in regs:
+            self.gprmask |= 1 << reg
+        self._emit_bytes(struct.pack("<I", word))
+
+    def _fixup(self, value: Value, type: int, offset: Optional[int] = None) -> None:
+        if value.symbol is None:
+            raise UnsupportedAssembly("Relocation without a symbol")
+        self.fixups.append(
+            Fixup(
+                self.section.name,
+                self.section.offset if offset is None else offset,
+                type,
+                value.symbol,
+                value.addend,
+            )
+        )
+
+    # instructions
+
+    def _immediate(
+        self, value: Value, signed: bool, op: str
+    ) -> Tuple[int, Optional[int]]:
+        """
+        Returns the 16-bit immediate and the relocation it needs (if any)
+        """
+        if value.operator is None:
+            if value.symbol is not None:
+                raise UnsupportedAssembly(f"{op} with a symbolic immediate")
+            if signed and not fits_signed_16(value.addend):
+                raise UnsupportedAssembly(f"{op} immediate out of range")
+            if not signed and not fits_unsigned_16(value.addend):
+                raise UnsupportedAssembly(f"{op} immediate out of range")
+            return (value.addend & 0xFFFF, None)
+
+        if value.symbol is None:
+            # e.g. %hi(40000)
+            if value.operator == "hi":
+                return (((value.addend + 0x8000) >> 16) & 0xFFFF, None)
+            if value.operator == "lo":
+                return (value.addend & 0xFFFF, None)
+            raise UnsupportedAssembly(f"%{value.operator} of a constant")
+
+        return (
+            0,
+            {"hi": R_MIPS_HI16, "lo": R_MIPS_LO16, "gp_rel": R_MIPS_GPREL16}[
+                value.operator
+            ],
+        )
+
+    def _i_type(self, opcode: int, rs: int, rt: int, value: Value, signed=True, op=""):
+        imm, reloc = self._immediate(value, signed, op)
+        if reloc is not None:
+            self._fixup(value, reloc)
+        self._emit((opcode << 26) | (rs << 21) | (rt << 16) | imm, rs, rt)
+
+    def _r_type(self, rs: int, rt: int, rd: int, shamt: int, funct: int):
+        self._emit(
+            (rs << 21) | (rt << 16) | (rd << 11) | (shamt << 6) | funct, rs, rt, rd
+        )
+
+    def _load_constant(self, reg: int, value: int) -> None:
+        # same choices as GNU as's load_register, 32-bit values are sign-extended
+        if 0x80000000 <= value < 0x100000000:
+            value -= 0x100000000
+        if fits_signed_16(value):
+            self._i_type(0x09, ZERO, reg, Value(value))
+        elif fits_unsigned_16(value):
+            self._i_type(0x0D, ZERO, reg, Value(value), signed=False)
+        elif -0x80000000 <= value < 0x80000000:
+            value &= 0xFFFFFFFF
+            self._i_type(0x0F, ZERO, reg, Value(value >> 16), signed=False)
+            if value & 0xFFFF:
+                self._i_type(0x0D, reg, reg, Value(value & 0xFFFF), signed=False)
+        else:
+            raise UnsupportedAssembly(f"li of {value} does not fit in 32 bits")
+
+    def _branch(self, word: int, target: str, *regs: int) -> None:
+        value = parse_expression(target)
+        if value.symbol is None or value.operator is not None or value.addend:
+            raise UnsupportedAssembly(f"Unsupported branch target: {target}")
+        self.branches.append((self.section.name, self.section.offset, value.symbol))
+        self._emit(word, *regs)
+
+    def _memory(self, opcode: int, rt: int, operand: str, is_load: bool, op: str):
+        value, base = parse_memory_operand(operand)
+        if base is not None:
+            self._i_type(opcode, base, rt, value, op=op)
+            return
+
+        if value.operator is not None:
+            raise UnsupportedAssembly(f"{op} {operand} without a base register")
+
+        # GNU as macro, loads (other than lwl/lwr which merge into the
+        # destination) use the destination as the temporary register
+        tmp = rt if is_load and rt != ZERO and op not in ("lwl", "lwr") else AT
+        if value.symbol is None:
+            if fits_signed_16(value.addend):
+                self._i_type(opcode, ZERO, rt, value, op=op)
+                return
+            if not -0x80000000 <= value.addend < 0x100000000:
+                raise UnsupportedAssembly(f"{op} address out of range")
+            self._i_type(0x0F, ZERO, tmp, Value(value.addend, operator="hi"))
+            self._i_type(opcode, tmp, rt, Value(value.addend, operator="lo"), op=op)
+            return
+
+        self._i_type(0x0F, ZERO, tmp, Value(value.addend, value.symbol, "hi"))
+        self._i_type(opcode, tmp, rt, Value(value.addend, value.symbol, "lo"), op=op)
+
+    def instruction(self, op: str, operands: List[str]) -> None:
+        n = len(operands)
+
+        if op == "nop" and n == 0:
+            self._emit(0)
+
+        elif op in R3_OPS and n in (2, 3):
+            if n == 2:
+                operands = [operands[0], *operands]
+            rd, rs = parse_register(operands[0]), parse_register(operands[1])
+            if is_register(operands[2]):
+                self._r_type(rs, parse_register(operands[2]), rd, 0, R3_OPS[op])
+                return
+            value = parse_expression(operands[2])
+            if op == "subu" and value.is_constant and fits_signed_16(-value.addend):
+                self._i_type(0x09, rs, rd, Value(-value.addend))
+            elif op in IMMEDIATE_FORMS:
+                opcode, unsigned = I_OPS[IMMEDIATE_FORMS[op]]
+                self._i_type(opcode, rs, rd, value, signed=not unsigned, op=op)
+            else:
+                raise UnsupportedAssembly(f"{op} with an immediate")
+
+        elif op in I_OPS and n in (2, 3):
+            if n == 2:
+                operands = [operands[0], *operands]
+            opcode, unsigned = I_OPS[op]
+            rt, rs = parse_register(operands[0]), parse_register(operands[1])
+            self._i_type(
+                opcode,
+                rs,
+                rt,
+                parse_expression(operands[2]),
+                signed=not unsigned,
+                op=op,
+            )
+
+        elif op == "lui" and n == 2:
+            value = parse_expression(operands[1])
+            if value.operator not in (None, "hi"):
+                raise UnsupportedAssembly(f"lui with %{value.operator}")
+            self._i_type(
+                0x0F, ZERO, parse_register(operands[0]), value, signed=False, op=op
+            )
+
+        elif op in SHIFT_OPS and n == 3:
+            funct, variable = SHIFT_OPS[op]
+            rd, rt = parse_register(operands[0]), parse_register(operands[1])
+            if is_register(operands[2]):
+                self._r_type(
+                    parse_register(operands[2]), rt, rd, 0, SHIFT_V_OPS[variable]
+                )
+                return
+            value = parse_expression(operands[2])
+            if not value.is_constant or not 0 <= value.addend < 32:
+                raise UnsupportedAssembly(f"{op} shift amount out of range")
+            self._r_type(0, rt, rd, value.addend, funct)
+
+        elif op in SHIFT_V_OPS and n == 3:
+            rd, rt, rs = (parse_register(x) for x in operands)
+            self._r_type(rs, rt, rd, 0, SHIFT_V_OPS[op])
+
+        elif op in MULT_DIV_OPS and n in (2, 3):
+            if op in ("div", "divu"):
+                # only the explicit "div $zero,..." form, anything else is a macro
+                if n != 3 or parse_register(operands[0]) != ZERO:
+                    raise UnsupportedAssembly(f"{op} macro")
+                operands = operands[1:]
+            elif n != 2:
+                raise UnsupportedAssembly(f"{op} macro")
+            rs, rt = (parse_register(x) for x in operands)
+            self._r_type(rs, rt, 0, 0, MULT_DIV_OPS[op])
+
+        elif op in ("mfhi", "mflo") and n == 1:
+            self._r_type(
+                0, 0, parse_register(operands[0]), 0, 0x10 if op == "mfhi" else 0x12
+            )
+
+        elif op in ("mthi", "mtlo") and n == 1:
+            self._r_type(
+                parse_register(operands[0]), 0, 0, 0, 0x11 if op == "mthi" else 0x13
+            )
+
+        elif op in TRAP_OPS and n in (2, 3):
+            rs, rt = parse_register(operands[0]), parse_register(operands[1])
+            code = self._constant(operands[2]) if n == 3 else 0
+            if not 0 <= code < 0x400:
+                raise UnsupportedAssembly(f"{op} code out of range")
+            self._emit((rs << 21) | (rt << 16) | (code << 6) | TRAP_OPS[op], rs, rt)
+
+        elif op == "break" and n <= 2:
+            codes = [self._constant(x) for x in operands] + [0, 0]
+            if not (0 <= codes[0] < 0x400 and 0 <= codes[1] < 0x400):
+                raise UnsupportedAssembly("break code out of range")
+            self._emit((codes[0] << 16) | (codes[1] << 6) | 0x0D)
+
+        elif op == "syscall" and n <= 1:
+            code = self._constant(operands[0]) if n else 0
+            if not 0 <= code < 0x100000:
+                raise UnsupportedAssembly("syscall code out of range")
+            self._emit((code << 6) | 0x0C)
+
+        elif op in ("j", "jal") and n == 1:
+            if is_register(operands[0]):
+                reg = parse_register(operands[0])
+                if op == "j":
+                    self._r_type(reg, 0, 0, 0, 0x08)  # jr
+                else:
+                    self._r_type(reg, 0, 31, 0, 0x09)  # jalr $31,reg
+                return
+            value = parse_expression(operands[0])
+            if value.operator is not None or value.symbol is None:
+                raise UnsupportedAssembly(f"Unsupported jump target: {operands[0]}")
+            self._fixup(value, R_MIPS_26)
+            self._emit(0x02 << 26 if op == "j" else 0x03 << 26)
+
+        elif op == "jr" and n == 1:
+            self._r_type(parse_register(operands[0]), 0, 0, 0, 0x08)
+
+        elif op == "jalr" and n in (1, 2):
+            rd = parse_register(operands[0]) if n == 2 else 31
+            self._r_type(parse_register(operands[-1]), 0, rd, 0, 0x09)
+
+        elif op in BRANCH_OPS and n == 3:
+            rs = parse_register(operands[0])
+            if is_register(operands[1]):
+                rt = parse_register(operands[1])
+            elif operands[1].strip() == "0":
+                rt = ZERO
+            else:
+                raise UnsupportedAssembly(f"{op} with an immediate")
+            self._branch(
+                (BRANCH_OPS[op] << 26) | (rs << 21) | (rt << 16), operands[2], rs, rt
+            )
+
+        elif op in ("beqz", "bnez") and n == 2:
+            rs = parse_register(operands[0])
+            opcode = BRANCH_OPS["beq" if op == "beqz" else "bne"]
+            self._branch((opcode << 26) | (rs << 21), operands[1], rs)
+
+        elif op in BRANCH_Z_OPS and n == 2:
+            opcode, rt = BRANCH_Z_OPS[op]
+            rs = parse_register(operands[0])
+            self._branch((opcode << 26) | (rs << 21) | (rt << 16), operands[1], rs)
+
+        elif op == "b" and n == 1:
+            self._branch(BRANCH_OPS["beq"] << 26, operands[0])
+
+        elif op == "bal" and n == 1:
+            self._branch((0x01 << 26) | (0x11 << 16), operands[0])
+
+        elif op in LOAD_OPS and n == 2:
+            self._memory(
+                LOAD_OPS[op], parse_register(operands[0]), operands[1], True, op
+            )
+
+        elif op in STORE_OPS and n == 2:
+            self._memory(
+                STORE_OPS[op], parse_register(operands[0]), operands[1], False, op
+            )
+
+        elif op in COP2_MEM_OPS and n == 2:
+            value, base = parse_memory_operand(operands[1])
+            if base is None:
+                raise UnsupportedAssembly(f"{op} without a base register")
+            self._i_type(
+                COP2_MEM_OPS[op], base, self._cop_register(operands[0]), value, op=op
+            )
+
+        elif op in COP_MOVE_OPS and n == 2:
+            opcode, rs = COP_MOVE_OPS[op]
+            rt, rd = parse_register(operands[0]), self._cop_register(operands[1])
+            self._emit((opcode << 26) | (rs << 21) | (rt << 16) | (rd << 11), rt)
+
+        elif op == "rfe" and n == 0:
+            self._emit(0x42000010)
+
+        elif op == "li" and n == 2:
+            value = parse_expression(operands[1])
+            if not value.is_constant:
+                raise UnsupportedAssembly("li with a symbol")
+            self._load_constant(parse_register(operands[0]), value.addend)
+
+        elif op == "la" and n == 2:
+            rt = parse_register(operands[0])
+            value, base = parse_memory_operand(operands[1])
+            if base is not None:
+                if value.symbol is not None and value.operator != "gp_rel":
+                    raise UnsupportedAssembly("la of sym($reg)")
+                self._i_type(0x09, base, rt, value, op=op)
+            elif value.is_constant:
+                self._load_constant(rt, value.addend)
+            elif value.operator is None:
+                self._i_type(0x0F, ZERO, rt, Value(value.addend, value.symbol, "hi"))
+                self._i_type(0x09, rt, rt, Value(value.addend, value.symbol, "lo"))
+            else:
+                raise UnsupportedAssembly(f"la of {operands[1]}")
+
+        elif op == "move" and n == 2:
+            rd, rs = (parse_register(x) for x in operands)
+            self._r_type(rs, ZERO, rd, 0, R3_OPS["addu"])
+
+        elif op in ("neg", "negu") and n in (1, 2):
+            rd, rt = parse_register(operands[0]), parse_register(operands[-1])
+            self._r_type(ZERO, rt, rd, 0, R3_OPS["sub" if op == "neg" else "subu"])
+
+        elif op == "not" and n in (1, 2):
+            rd, rs = parse_register(operands[0]), parse_register(operands[-1])
+            self._r_type(rs, ZERO, rd, 0, R3_OPS["nor"])
+
+        else:
+            raise UnsupportedAssembly(
+                f"Unsupported instruction: {op} {','.join(operands)}"
+            )
+
+    def _constant(self, text: str) -> int:
+        value = parse_expression(text)
+        if not value.is_constant:
+            raise UnsupportedAssembly(f"Expected a constant: {text}")
+        return value.addend
+
+    def _cop_register(self, text: str) -> int:
+        text = text.strip()
+        if text.startswith("$") and text[1:].isdigit() and int(text[1:]) < 32:
+            return int(text[1:])
+        raise UnsupportedAssembly(f"Unsupported coprocessor register: {text}")
+
+    # directives
+
+    def directive(self, op: str, operands: List[str]) -> None:
+        if op in SECTION_DIRECTIVES and not operands:
+            self._change_section(SECTION_DIRECTIVES[op])
+
+        elif op == ".section" and operands:
+            self._change_section(operands[0].strip())
+
+        elif op == ".align" and len(operands) == 1:
+            power = self._constant(operands[0])
+            if power:
+                self._align(power)
+                self.auto_align = True
+            else:
+                self.auto_align = False
+
+        elif op in (".globl", ".global"):
+            self.globals.update(x.strip() for x in operands)
+
+        elif op == ".weak":
+            self.weak.update(x.strip() for x in operands)
+
+        elif op == ".set" and len(operands) == 1:
+            option = operands[0].strip()
+            if option == "noreorder":
+                self.is_reorder = False
+                self.any_noreorder = True
+            elif option == "reorder":
+                self.is_reorder = True
+            elif option not in (
+                "at",
+                "noat",
+                "macro",
+                "nomacro",
+                "volatile",
+                "novolatile",
+            ):
+                raise UnsupportedAssembly(f"Unsupported .set {option}")
+
+        elif op == ".ent" and operands:
+            name = operands[0].strip()
+            self.symbol_types[name] = STT_FUNC
+            self.function_starts[name] = self.section.offset
+
+        elif op == ".end" and operands:
+            name = operands[0].strip()
+            if name in self.function_starts:
+                self.symbol_sizes[name] = (
+                    self.section.offset - self.function_starts[name]
+                )
+
+        elif op == ".type" and len(operands) == 2:
+            kind = operands[1].strip().lstrip("@%")
+            self.symbol_types[operands[0].strip()] = {
+                "function": STT_FUNC,
+                "object": STT_OBJECT,
+            }.get(kind, STT_NOTYPE)
+
+        elif op == ".size" and len(operands) == 2:
+            size = parse_expression(operands[1])
+            if size.is_constant:
+                self.symbol_sizes[operands[0].strip()] = size.addend
+
+        elif op in (".frame", ".mask", ".fmask", ".file", ".extern", ".local"):
+            # only affect .pdr, debug info, or -G
+            pass
+
+        elif op in (".word", ".4byte", ".int", ".long"):
+            self._data(operands, 4)
+
+        elif op in (".half", ".short", ".2byte"):
+            self._data(operands, 2)
+
+        elif op == ".byte":
+            self._data(operands, 1)
+
+        elif op in (".space", ".skip") and len(operands) in (1, 2):
+            size = self._constant(operands[0])
+            fill = self._constant(operands[1]) if len(operands) == 2 else 0
+            if size < 0:
+                raise UnsupportedAssembly(f"{op} of {size} bytes")
+            self._emit_bytes(bytes([fill & 0xFF]) * size)
+
+        elif op in (".ascii", ".asciz", ".asciiz", ".string"):
+            terminator = b"" if op == ".ascii" else b"\0"
+            for operand in operands:
+                self._emit_bytes(parse_string(operand) + terminator)
+
+        else:
+            raise UnsupportedAssembly(f"Unsupported directive: {op}")
+
+    def _change_section(self, name: str) -> None:
+        self.section = self._get_section(name)
+        self.pending_labels = []
+        self.auto_align = True
+
+    def _data(self, operands: List[str], size: int) -> None:
+        if self.auto_align and size > 1:
+            self._align(size.bit_length() - 1)
+        fmt = {1: "<B", 2: "<H", 4: "<I"}[size]
+        for operand in operands:
+            value = parse_expression(operand)
+            if value.operator is not None:
+                raise UnsupportedAssembly(f"Relocation operator in data: {operand}")
+            if value.symbol is not None:
+                if size != 4:
+                    raise UnsupportedAssembly(
+                        f"Symbol in a {size} byte value: {operand}"
+                    )
+                self._fixup(value, R_MIPS_32)
+            self._emit_bytes(struct.pack(fmt, value.addend & ((1 << (size * 8)) - 1)))
+
+    def label(self, name: str) -> None:
+        if name in self.labels:
+            raise UnsupportedAssembly(f"Label {name} redefined")
+        if name[0].isdigit():
+            raise UnsupportedAssembly(f"Numeric label {name}")
+        self.labels[name] = (self.section.name, self.section.offset)
+        self.pending_labels.append(name)
+
+    def statement(self, text: str) -> None:
+        match = LABEL_PREFIX_RE.match(text)
+        if match:
+            # e.g. "jtbl: .word $L2"
+            self.label(match.group(1))
+            text = match.group(2)
+        kind, op, operands = parse_statement(text)
+        if kind == "label":
+            self.label(op)
+        elif kind == "directive":
+            self.directive(op, operands)
+        else:
+            self.instruction(op, operands)
+
+    def assemble_lines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            text = split_comment(line)
+            if not text:
+                continue
+            for statement in text.split(";"):
+                statement = statement.strip()
+                if statement:
+                    self.statement(statement)
+
+    # finalising
+
+    def _is_local(self, symbol: str) -> bool:
+        return symbol in self.labels and symbol not in self.globals | self.weak
+
+    def _patch(self, section: Section, offset: int, mask: int, value: int) -> None:
+        (word,) = struct.unpack_from("<I", section.data, offset)
+        struct.pack_into("<I", section.data, offset, (word & ~mask) | (value & mask))
+
+    def _resolve(self) -> Dict[str, List[ElfRelocation]]:
+        for section_name, offset, target in self.branches:
+            if target not in self.labels or not self._is_local(target):
+                raise UnsupportedAssembly(f"Branch to non-local symbol {target}")
+            target_section, target_offset = self.labels[target]
+            if target_section != section_name:
+                raise UnsupportedAssembly(f"Branch to {target} in another section")
+            delta = (target_offset - (offset + 4)) >> 2
+            if not fits_signed_16(delta):
+                raise UnsupportedAssembly(f"Branch to {target} out of range")
+            self._patch(self.sections[section_name], offset, 0xFFFF, delta)
+
+        fixups = self._order_fixups(self.fixups)
+
+        relocations: Dict[str, List[ElfRelocation]] = {x: [] for x in self.sections}
+        for fixup in fixups:
+            section = self.sections[fixup.section]
+            if is_local_label(fixup.symbol) and fixup.symbol not in self.labels:
+                raise UnsupportedAssembly(f"Undefined local label {fixup.symbol}")
+
+            if self._is_local(fixup.symbol):
+                # relocate against the section symbol, with the offset in place
+                reloc_symbol, symbol_offset = self.labels[fixup.symbol]
+            else:
+                reloc_symbol, symbol_offset = fixup.symbol, 0
+            value = fixup.addend + symbol_offset
+
+            if fixup.type == R_MIPS_HI16:
+                self._patch(section, fixup.offset, 0xFFFF, (value + 0x8000) >> 16)
+            elif fixup.type in (R_MIPS_LO16, R_MIPS_GPREL16):
+                self._patch(section, fixup.offset, 0xFFFF, value)
+            elif fixup.type == R_MIPS_26:
+                self._patch(section, fixup.offset, 0x3FFFFFF, value >> 2)
+            else:
+                self._patch(section, fixup.offset, 0xFFFFFFFF, value)
+
+            relocations[fixup.section].append(
+                ElfRelocation(fixup.offset, reloc_symbol, fixup.type)
+            )
+        return relocations
+
+    @staticmethod
+    def _order_fixups(fixups: List[Fixup]) -> List[Fixup]:
+        # like GNU as, move each %hi to just before its matching %lo
+        res = list(fixups)
+        i = 0
+        while i < len(res):
+            fixup = res[i]
+            if fixup.type == R_MIPS_HI16:
+                key = (fixup.section, fixup.symbol, fixup.addend)
+                following = res[i + 1] if i + 1 < len(res) else None
+                if not (
+                    following
+                    and following.type == R_MIPS_LO16
+                    and (following.section, following.symbol, following.addend) == key
+                ):
+                    for j in range(i + 1, len(res)):
+                        other = res[j]
+                        if (
+                            other.type == R_MIPS_LO16
+                            and (
+                                other.section,
+                                other.symbol,
+                                other.addend,
+                            )
+                            == key
+                        ):
+                            res.insert(j - 1, res.pop(i))
+                            break
+                    else:
+                        i += 1
+                        continue
+                    continue
+            i += 1
+        return res
+
+    def to_elf(self) -> bytes:
+        relocations = self._resolve()
+
+        elf_sections = []
+        for section in self.sections.values():
+            sh_type, flags, _ = SECTIONS[section.name]
+            align = 1 << section.alignment
+            if self.pad_sections:
+                padding = -section.offset % (1 << min(section.alignment, 4))
+                if section.is_nobits:
+                    section.size += padding
+                else:
+                    section.data += bytes(padding)
+            elf_sections.append(
+                ElfSection(
+                    section.name,
+                    sh_type,
+                    flags,
+                    bytes(section.data),
+                    size=section.size,
+                    addralign=align,
+                )
+            )
+
+        elf_sections.append(
+            ElfSection(
+                ".reginfo",
+                SHT_MIPS_REGINFO,
+                SHF_ALLOC,
+                struct.pack("<6I", self.gprmask & ~1, 0, 0, 0, 0, 0),
+                addralign=4,
+                entsize=24,
+            )
+        )
+
+        symbols = []
+        referenced = {x.symbol for x in self.fixups}
+        for name, (section, offset) in self.labels.items():
+            if is_local_label(name) and name not in self.globals:
+                continue
+            if name in self.weak:
+                bind = STB_WEAK
+            elif name in self.globals:
+                bind = STB_GLOBAL
+            else:
+                bind = STB_LOCAL
+            symbols.append(
+                ElfSymbol(
+                    name,
+                    offset,
+                    self.symbol_sizes.get(name, 0),
+                    bind,
+                    self.symbol_types.get(name, STT_NOTYPE),
+                    section,
+                )
+            )
+        for name in sorted((referenced | self.globals | self.weak) - set(self.labels)):
+            symbols.append(
+                ElfSymbol(name, bind=STB_WEAK if name in self.weak else STB_GLOBAL)
+            )
+
+        e_flags = EF_MIPS_ABI_O32 | (EF_MIPS_NOREORDER if self.any_noreorder else 0)
+        return write_elf_relocatable(
+            elf_sections, symbols, relocations, e_flags=e_flags
+        )
+
+
+def check_as_args(as_args: Iterable[str]) -> bool:
+    """
+    Returns whether the sections should be padded, raises UnsupportedAssembly
+    for anything that would make GNU as behave differently
+    """
+    pad_sections = True
+    gp_size = "0"
+    args = iter(as_args)
+    for arg in args:
+        if arg == "-no-pad-sections":
+            pad_sections = False
+        if arg == "-G":
+            gp_size = next(args, "")
+            continue
+        if arg.startswith("-G"):
+            # the last -G wins, e.g. a project's -G8 followed by maspsx's -G0
+            gp_size = arg[2:]
+            continue
+        if arg in IGNORED_ARGS or arg.startswith(IGNORED_ARG_PREFIXES):
+            continue
+        raise UnsupportedAssembly(f"Unsupported assembler argument: {arg}")
+    if gp_size != "0":
+        raise UnsupportedAssembly(f"Unsupported assembler argument: -G{gp_size}")
+    return pad_sections
+
+
+def assemble_native(
+    text_or_lines: Union[str, Iterable[str]], as_args: Iterable[str] = ()
+) -> bytes:
+    """
+    Assemble maspsx output into an ELF object, as_args are the args that would
+    be passed to GNU as (without -o)
+    """
+    assembler = NativeAssembler(pad_sections=check_as_args(as_args))
+    if isinstance(text_or_lines, str):
+        text_or_lines = text_or_lines.splitlines()
+    assembler.assemble_lines(text_or_lines)
+    return assembler.to_elf()
+
+
+class NativeAssemblerSink(LineSink):
+    """
+    Collects lines and assembles them natively on close, falling back to running
+    cmd (a GNU as command line reading from stdin) if they can't be
+    """
+
+    def __init__(self, cmd: List[str], encoding: str = "utf"):
+        self.cmd = cmd
+        self.encoding = encoding
+        self.lines: List[str] = []
+        self.returncode: Optional[int] = None
+        self.used_fallback = False
+
+    def append(self, line: str) -> None:
+        self.lines.append(line)
+
+    def extend(self, lines: Iterable[str]) -> None:
+        self.lines.extend(lines)
+
+    def close(self) -> None:
+        if self.returncode is not None:
+            return
+
+        as_args = [x for x in self.cmd[1:] if x != "-"]
+        try:
+            obj = assemble_native(self.lines, strip_output_args(as_args))
+        except UnsupportedAssembly:
+            self.used_fallback = True
+            fallback = AssemblerSink(self.cmd, encoding=self.encoding)
+            fallback.extend(self.lines)
+            fallback.close()
+            self.returncode = fallback.returncode
+            return
+
+        Path(output_path(as_args)).write_bytes(obj)
+        self.returncode = 0
+
+    def abort(self) -> None:
+        self.lines = []
+        self.returncode = -1
@@ -0,0 +1,295 @@
+import json
+import struct
+
+from dataclasses import asdict, dataclass, field
+from typing import IO, Dict, Iterable, List, Optional, Set, Tuple
+
+from maspsx import (
+    MaspsxProcessor,
+    expand_load_immediate,
+    expand_move,
+    is_instruction,
+    is_label,
+)
+
+IR_MAGIC = b"MSPXIR\0\0"
+IR_HEADER = struct.Struct("<8sII")  # magic, number of strings, number of records
+IR_RECORD = struct.Struct("<iiIIBBH")
+IR_STRING_LENGTH = struct.Struct("<I")
+
+NO_INDEX = -1
+
+KINDS = ("instruction", "directive", "label")
+
+FLAG_INSERTED = 1
+FLAG_REWRITTEN = 2
+
+
+@dataclass
+class IrRecord:
+    kind: str  # one of KINDS
+    op: str  # mnemonic, directive or label name
+    operands: List[str] = field(default_factory=list)
+    line_index: Optional[int] = None  # input line this came from, if any
+    function: Optional[str] = None
+    inserted: bool = False  # e.g. nops, .set noat
+    rewritten: bool = False  # derived from line_index, but not verbatim
+
+    @property
+    def text(self) -> str:
+        if self.kind == "label":
+            return f"{self.op}:"
+        if self.operands:
+            return f"{self.op}\t{','.join(self.operands)}"
+        return self.op
+
+
+def split_comment(line: str) -> str:
+    """
+    Strip any trailing comment, ignoring '#' within quotes
+    """
+    in_quotes = False
+    escaped = False
+    for i, c in enumerate(line):
+        if escaped:
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c == '"':
+            in_quotes = not in_quotes
+        elif c == "#" and not in_quotes:
+            return line[:i].strip()
+    return line.strip()
+
+
+def split_operands(rest: str) -> List[str]:
+    operands = []
+    current = ""
+    in_quotes = False
+    escaped = False
+    for c in rest:
+        if escaped:
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c == '"':
+            in_quotes = not in_quotes
+        elif c == "," and not in_quotes:
+            operands.append(current.strip())
+            current = ""
+            continue
+        current += c
+    if current.strip():
+        operands.append(current.strip())
+    return operands
+
+
+def parse_statement(text: str) -> Tuple[str, str, List[str]]:
+    """
+    Returns the kind, op and operands of a single (comment-free) statement
+    """
+    if text.endswith(":") and (is_label(text) or " " not in text):
+        return ("label", text[:-1], [])
+    op, _, rest = text.replace("\t", " ", 1).partition(" ")
+    kind = "directive" if op.startswith(".") else "instruction"
+    return (kind, op, split_operands(rest))
+
+
+def source_forms(line: str) -> List[str]:
+    """
+    The statements that processing the input line can write verbatim (or
+    nearly so, e.g. move -> addu)
+    """
+    text = split_comment(line)
+    res = [x.strip() for x in text.split(";")]
+    res.append(expand_move(text))
+    if text.startswith("li\t"):
+        try:
+            res += expand_load_immediate(text)
+        except AssertionError:
+            pass
+    return res
+
+
+class IrSink:
+    """
+    Collects IrRecords from a MaspsxProcessor, attributing each output statement
+    to the input line (and function) that was being processed when it was
+    written, or to the later line it was taken from (see _lookahead_index)
+    """
+
+    def __init__(self, processor: MaspsxProcessor):
+        self.processor = processor
+        self.records: List[IrRecord] = []
+        self.function: Optional[str] = None
+        self.last_line_index: Optional[int] = None
+        self.claimed: Set[int] = set()
+        self.claimed_by: Optional[int] = None
+
+    def _lookahead_index(self, line_index: int, statement: str) -> Optional[int]:
+        # handlers can write the next few instructions early (e.g. to move
+        # them between a mflo/mfhi and a mult/div), those are then skipped
+        if line_index != self.claimed_by:
+            self.claimed = set()
+            self.claimed_by = line_index
+
+        lines = self.processor.lines
+        remaining = self.processor.skip_instructions
+        i = line_index + 1
+        while remaining > 0 and i < len(lines):
+            if is_instruction(lines[i]):
+                remaining -= 1
+                if i not in self.claimed and statement in source_forms(lines[i]):
+                    self.claimed.add(i)
+                    return i
+            i += 1
+        return None
+
+    def append(self, line: str) -> None:
+        text = split_comment(line)
+        if not text:
+            return
+
+        current_index: Optional[int] = self.processor.line_index
+        if not 0 <= current_index < len(self.processor.lines):
+            current_index = None
+
+        for statement in text.split(";"):
+            statement = statement.strip()
+            if not statement:
+                continue
+            kind, op, operands = parse_statement(statement)
+
+            line_index = current_index
+            if line_index is not None:
+                line_index = self._lookahead_index(line_index, statement) or line_index
+
+            source = None
+            if line_index is not None:
+                source = split_comment(self.processor.lines[line_index])
+            source_statements = [x.strip() for x in source.split(";")] if source else []
+
+            if kind == "directive" and op == ".ent" and operands:
+                self.function = operands[0]
+
+            first = line_index != self.last_line_index
+            self.last_line_index = line_index
+
+            inserted = rewritten = False
+            if line_index is None:
+                inserted = True
+            elif statement in source_statements:
+                pass
+            elif kind == "instruction":
+                # e.g. nops after loads or branches, vs lui/ori from li
+                inserted = op == "nop"
+                rewritten = not inserted
+            else:
+                # e.g. .data -> .section .data, vs .set noat around an expansion
+                rewritten = first and source is not None and source[0] in ".$L"
+                inserted = not rewritten
+
+            self.records.append(
+                IrRecord(
+                    kind=kind,
+                    op=op,
+                    operands=operands,
+                    line_index=line_index,
+                    function=self.function,
+                    inserted=inserted,
+                    rewritten=rewritten,
+                )
+            )
+
+            if kind == "directive" and op == ".end":
+                self.function = None
+
+    def extend(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.append(line)
+
+
+def write_jsonl(records: Iterable[IrRecord], stream: IO[str]) -> None:
+    for record in records:
+        stream.write(json.dumps(asdict(record), separators=(",", ":")))
+        stream.write("\n")
+
+
+def read_jsonl(stream: IO[str]) -> List[IrRecord]:
+    return [IrRecord(**json.loads(line)) for line in stream if line.strip()]
+
+
+def serialize_records(records: List[IrRecord]) -> bytes:
+    """
+    Compact binary form: header, string table, then fixed-size records each
+    followed by their operands as string table indices
+    """
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    body = bytearray()
+    for record in records:
+        flags = (FLAG_INSERTED if record.inserted else 0) | (
+            FLAG_REWRITTEN if record.rewritten else 0
+        )
+        body += IR_RECORD.pack(
+            NO_INDEX if record.line_index is None else record.line_index,
+            NO_INDEX if record.function is None else intern(record.function),
+            intern(record.op),
+            len(record.operands),
+            KINDS.index(record.kind),
+            flags,
+            0,  # padding
+        )
+        for operand in record.operands:
+            body += IR_STRING_LENGTH.pack(intern(operand))
+
+    data = bytearray(IR_HEADER.pack(IR_MAGIC, len(strings), len(records)))
+    for value in strings:
+        encoded = value.encode("utf")
+        data += IR_STRING_LENGTH.pack(len(encoded))
+        data += encoded
+    data += body
+    return bytes(data)
+
+
+def deserialize_records(data: bytes) -> List[IrRecord]:
+    magic, num_strings, num_records = IR_HEADER.unpack_from(data, 0)
+    if magic != IR_MAGIC:
+        raise Exception("Not a maspsx IR file!")
+    offset = IR_HEADER.size
+
+    strings = []
+    for _ in range(num_strings):
+        (length,) = IR_STRING_LENGTH.unpack_from(data, offset)
+        offset += IR_STRING_LENGTH.size
+        strings.append(str(data[offset : offset + length], "utf"))
+        offset += length
+
+    records = []
+    for _ in range(num_records):
+        line_index, function, op, num_operands, kind, flags, _ = IR_RECORD.unpack_from(
+            data, offset
+        )
+        offset += IR_RECORD.size
+        operands = []
+        for _ in range(num_operands):
+            (operand,) = IR_STRING_LENGTH.unpack_from(data, offset)
+            offset += IR_STRING_LENGTH.size
+            operands.append(strings[operand])
+        records.append(
+            IrRecord(
+                kind=KINDS[kind],
+                op=strings[op],
+                operands=operands,
+                line_index=None if line_index == NO_INDEX else line_index,
+                function=None if function == NO_INDEX else strings[function],
+                inserted=bool(flags & FLAG_INSERTED),
+                rewritten=bool(flags & FLAG_REWRITTEN),
+            )
+        )
+    return records
@@ -0,0 +1,146 @@
+import atexit
+import os
+import re
+import select
+
+from contextlib import contextmanager
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+# --jobserver-fds is what GNU make < 4.2 passes
+JOBSERVER_AUTH_RE = re.compile(r"--jobserver-(?:auth|fds)=(\S+)")
+
+
+def parse_makeflags(makeflags: str) -> Optional[Tuple[str, ...]]:
+    """
+    Returns ("fifo", path) or ("fds", read_fd, write_fd) for the jobserver
+    described by MAKEFLAGS, or None. If there are several the last one wins
+    (as it does for make).
+    """
+    if not makeflags:
+        return None
+    # single letter flags come first, "n" means this is a dry run
+    first, *_ = makeflags.split()
+    if not first.startswith("-") and "n" in first:
+        return None
+
+    matches = JOBSERVER_AUTH_RE.findall(makeflags)
+    if not matches:
+        return None
+    auth = matches[-1]
+    if auth.startswith("fifo:"):
+        return ("fifo", auth[len("fifo:") :])
+    read_fd, _, write_fd = auth.partition(",")
+    if not (read_fd.isdigit() and write_fd.isdigit()):
+        return None
+    return ("fds", read_fd, write_fd)
+
+
+def _reopen(fd: int, flags: int) -> int:
+    # a pipe's O_NONBLOCK is shared with make and every other client unless
+    # we have our own open file description of it
+    return os.open(f"/proc/self/fd/{fd}", flags)
+
+
+class JobServer:
+    """
+    A GNU make jobserver client. This process already holds the implicit
+    token make gave it, a token must be acquired for every *extra* worker.
+    Tokens are only ever taken when they are available right away.
+    """
+
+    def __init__(self, read_fd: int, write_fd: int, owns_fds: bool = False):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.owns_fds = owns_fds
+        self.tokens: List[bytes] = []
+        atexit.register(self.release_all)
+
+    @classmethod
+    def from_environ(
+        cls, environ: Mapping[str, str] = os.environ
+    ) -> Optional["JobServer"]:
+        auth = parse_makeflags(environ.get("MAKEFLAGS", ""))
+        if auth is None:
+            return None
+        try:
+            if auth[0] == "fifo":
+                fd = os.open(auth[1], os.O_RDWR | os.O_NONBLOCK)
+                return cls(fd, fd, owns_fds=True)
+
+            read_fd, write_fd = int(auth[1]), int(auth[2])
+            # make only passes the fds down to recipes marked with +
+            os.fstat(read_fd)
+            os.fstat(write_fd)
+            try:
+                return cls(
+                    _reopen(read_fd, os.O_RDONLY | os.O_NONBLOCK),
+                    _reopen(write_fd, os.O_WRONLY),
+                    owns_fds=True,
+                )
+            except OSError:
+                return cls(read_fd, write_fd)
+        except OSError:
+            return None
+
+    def try_acquire(self) -> bool:
+        if not self.owns_fds:
+            ready, _, _ = select.select([self.read_fd], [], [], 0)
+            if not ready:
+                return False
+        try:
+            token = os.read(self.read_fd, 1)
+        except (BlockingIOError, InterruptedError):
+            return False
+        if not token:
+            return False
+        self.tokens.append(token)
+        return True
+
+    def release(self) -> None:
+        # make may use the token value to report failures, so give back
+        # exactly what was taken
+        token = self.tokens.pop()
+        while True:
+            try:
+                os.write(self.write_fd, token)
+                return
+            except InterruptedError:
+                continue
+
+    def release_all(self) -> None:
+        while self.tokens:
+            self.release()
+
+    def close(self) -> None:
+        self.release_all()
+        atexit.unregister(self.release_all)
+        if self.owns_fds:
+            os.close(self.read_fd)
+            if self.write_fd != self.read_fd:
+                os.close(self.write_fd)
+            self.owns_fds = False
+
+
+@contextmanager
+def job_slots(
+    limit: Optional[int] = None, environ: Mapping[str, str] = os.environ
+) -> Iterator[int]:
+    """
+    Yields how many workers to run. Under a make jobserver this is 1 plus
+    however many spare tokens there are (up to limit), the tokens are given
+    back on exit, even if an exception is raised. Otherwise it's limit, which
+    defaults to the number of CPUs.
+    """
+    limit = limit or os.cpu_count() or 1
+    jobserver = JobServer.from_environ(environ)
+    if jobserver is None:
+        yield limit
+        return
+
+    try:
+        workers = 1
+        while workers < limit and jobserver.try_acquire():
+            workers += 1
+        yield workers
+    finally:
+        jobserver.close()
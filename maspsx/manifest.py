@@ -0,0 +1,202 @@
+import mmap
+import os
+import struct
+import tempfile
+
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+# Layout (all little-endian):
+#   header:  magic, version, entry count, string table offset
+#   index:   one fixed-size entry per symbol and owner, sorted by name then owner
+#   strings: concatenated symbol and owner names
+MANIFEST_MAGIC = b"MSPXSYMS"
+MANIFEST_VERSION = 2
+
+HEADER = struct.Struct("<8sIII")
+# name offset, name length, section, flags, size, owner offset, owner length
+ENTRY = struct.Struct("<IHBBIIH")
+
+SECTIONS = ("sdata", "sbss", "bss")
+FLAG_COMMON = 1
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    name: str
+    section: str
+    size: int
+    is_common: bool
+    owner: str = ""  # the TU that declared it, e.g. its object path
+
+
+class SymbolManifest:
+    """
+    Read-only view of a symbol manifest, entries are looked up directly from the
+    mmap'd file so the same manifest can be shared between many processors
+    """
+
+    def __init__(self, data: Union[bytes, mmap.mmap] = b""):
+        self._data = data
+        self._count = 0
+        self._strings = 0
+        if len(data) == 0:
+            return
+
+        magic, version, count, strings = HEADER.unpack_from(data, 0)
+        if magic != MANIFEST_MAGIC:
+            raise Exception("Not a maspsx symbol manifest!")
+        if version != MANIFEST_VERSION:
+            raise Exception(f"Unsupported symbol manifest version: {version}")
+        self._count = count
+        self._strings = strings
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "SymbolManifest":
+        path = Path(path)
+        if not path.exists() or path.stat().st_size == 0:
+            return cls()
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data)
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, name: str) -> bool:
+        return self.lookup(name) is not None
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return self._data[start : start + length].decode("utf")
+
+    def _entry(self, index: int) -> ManifestEntry:
+        name_offset, name_len, section, flags, size, owner_offset, owner_len = (
+            ENTRY.unpack_from(self._data, HEADER.size + index * ENTRY.size)
+        )
+        return ManifestEntry(
+            name=self._string(name_offset, name_len),
+            section=SECTIONS[section],
+            size=size,
+            is_common=bool(flags & FLAG_COMMON),
+            owner=self._string(owner_offset, owner_len),
+        )
+
+    def _name(self, index: int) -> bytes:
+        name_offset, name_len, *_ = ENTRY.unpack_from(
+            self._data, HEADER.size + index * ENTRY.size
+        )
+        start = self._strings + name_offset
+        return self._data[start : start + name_len]
+
+    def lookup(self, name: str) -> Optional[ManifestEntry]:
+        needle = name.encode("utf")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._name(lo) == needle:
+            return self._entry(lo)
+        return None
+
+    def entries(self) -> Iterator[ManifestEntry]:
+        for i in range(self._count):
+            yield self._entry(i)
+
+
+def serialize_manifest(entries: Iterable[ManifestEntry]) -> bytes:
+    """
+    Entries are unique by name and owner, the same (e.g. .comm) symbol can be
+    declared by many TUs
+    """
+    ordered = sorted(
+        entries, key=lambda x: (x.name.encode("utf"), x.owner.encode("utf"))
+    )
+
+    index = bytearray()
+    strings = bytearray()
+    offsets: Dict[bytes, int] = {}
+
+    def add_string(value: str) -> Tuple[int, int]:
+        data = value.encode("utf")
+        if data not in offsets:
+            offsets[data] = len(strings)
+            strings.extend(data)
+        return (offsets[data], len(data))
+
+    for entry in ordered:
+        index += ENTRY.pack(
+            *add_string(entry.name),
+            SECTIONS.index(entry.section),
+            FLAG_COMMON if entry.is_common else 0,
+            entry.size,
+            *add_string(entry.owner),
+        )
+
+    header = HEADER.pack(
+        MANIFEST_MAGIC, MANIFEST_VERSION, len(ordered), HEADER.size + len(index)
+    )
+    return header + bytes(index) + bytes(strings)
+
+
+def update_manifest(
+    path: Union[str, Path],
+    entries: Dict[str, ManifestEntry],
+    owner: Optional[str] = None,
+) -> None:
+    """
+    Merge entries into the manifest at path. With an owner (the TU the entries
+    are from) every entry that TU wrote before is replaced, so symbols that
+    were removed, renamed or resized don't linger. The new manifest is written
+    to a temporary file and renamed into place, so existing readers keep their
+    view.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path.with_name(path.name + ".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        existing = SymbolManifest.open(path)
+        merged = {(x.name, x.owner): x for x in existing.entries()}
+        existing.close()
+
+        new = {
+            (x.name, owner or ""): replace(x, owner=owner or "")
+            for x in entries.values()
+        }
+        if owner is not None:
+            previous = {k: v for k, v in merged.items() if k[1] == owner}
+            if previous == new:
+                return
+            for key in previous:
+                del merged[key]
+        elif all(merged.get(key) == entry for key, entry in new.items()):
+            return
+
+        merged.update(new)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(serialize_manifest(merged.values()))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,128 @@
+import argparse
+
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from maspsx.versions import get_version_flags
+
+
+def filter_as_args(as_args: List[str]) -> Tuple[List[str], int]:
+    """
+    Returns the args that should be passed on to GNU as, and the -G value
+    """
+    sdata_limit = 0
+    filtered_as_args: List[str] = []
+    for arg in as_args:
+        # Can we stop gcc from passing us this flag?
+        if arg == "-KPIC":
+            continue
+
+        # GNU as does not support -mcpu flag
+        if arg.startswith("-mcpu="):
+            arg = arg.replace("-mcpu=", "-mtune=")
+
+        elif arg.startswith("-G") and len(arg) > 2:
+            sdata_limit = int(arg[2:])
+
+        filtered_as_args.append(arg)
+
+    return (filtered_as_args, sdata_limit)
+
+
+@dataclass(frozen=True)
+class MaspsxOptions:
+    """
+    Everything that affects maspsx output, equivalent to the command line flags
+    """
+
+    aspsx_version: Optional[str] = None
+    sdata_limit: int = 0
+    expand_div: bool = False
+    dont_expand_li: bool = False
+    macro_inc: bool = False
+    use_comm_section: bool = False
+    use_comm_for_lcomm: bool = False
+
+    def with_version(self, aspsx_version: Optional[str]) -> "MaspsxOptions":
+        return replace(self, aspsx_version=aspsx_version)
+
+    @property
+    def preamble(self) -> List[str]:
+        return [
+            '.include "macro.inc"' if self.macro_inc else "",
+        ]
+
+    def version_flags(self) -> Dict[str, bool]:
+        version_flags = get_version_flags(self.aspsx_version)
+        if self.dont_expand_li:
+            version_flags["expand_li"] = False
+        return version_flags
+
+    def base_kwargs(self) -> Dict[str, Any]:
+        """
+        MaspsxProcessor kwargs that do not depend on the ASPSX version
+        """
+        return {
+            "sdata_limit": self.sdata_limit,
+            "expand_div": self.expand_div,
+            "use_comm_section": self.use_comm_section,
+            "use_comm_for_lcomm": self.use_comm_for_lcomm,
+        }
+
+    def processor_kwargs(self) -> Dict[str, Any]:
+        return {
+            **self.base_kwargs(),
+            **self.version_flags(),
+        }
+
+
+def add_option_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Command line flags that map onto MaspsxOptions
+    """
+    parser.add_argument("--aspsx-version", type=str)
+    parser.add_argument("--dont-force-G0", action="store_true")
+    parser.add_argument("--expand-div", action="store_true")
+    parser.add_argument("--macro-inc", action="store_true")
+    parser.add_argument("--dont-expand-li", action="store_true")
+    parser.add_argument("--use-comm-section", action="store_true")
+    parser.add_argument("--use-comm-for-lcomm", action="store_true")
+
+
+def options_from_args(
+    args: argparse.Namespace, as_args: List[str]
+) -> Tuple[MaspsxOptions, List[str]]:
+    """
+    Returns the options and the args to pass to GNU as (including -G0 unless
+    --dont-force-G0 was passed)
+    """
+    filtered_as_args, sdata_limit = filter_as_args(as_args)
+    if not args.dont_force_G0:
+        filtered_as_args.append("-G0")
+
+    options = MaspsxOptions(
+        aspsx_version=args.aspsx_version,
+        sdata_limit=sdata_limit,
+        expand_div=args.expand_div,
+        dont_expand_li=args.dont_expand_li,
+        macro_inc=args.macro_inc,
+        use_comm_section=args.use_comm_section,
+        use_comm_for_lcomm=args.use_comm_for_lcomm,
+    )
+    return (options, filtered_as_args)
+
+
+class FlagParser(argparse.ArgumentParser):
+    def error(self, message: str):
+        # don't exit, the flags may have come from a remote caller
+        raise ValueError(message)
+
+
+def parse_flags(flags: List[str]) -> Tuple[MaspsxOptions, List[str]]:
+    """
+    e.g. ["--aspsx-version=2.77", "-G8", "-march=r3000"]
+    """
+    parser = FlagParser(add_help=False)
+    add_option_arguments(parser)
+    args, as_args = parser.parse_known_args(flags)
+    return options_from_args(args, as_args)
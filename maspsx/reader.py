@@ -0,0 +1,59 @@
+import mmap
+import sys
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Union
+
+# gcc output is ASCII apart from .ascii string literals, latin-1 maps every byte
+# to a single character so input bytes round-trip to output bytes unchanged
+BYTES_ENCODING = "latin-1"
+
+
+def split_text(text: str) -> List[str]:
+    """
+    Split text into stripped lines, equivalent to [x.strip() for x in f.readlines()]
+    """
+    if len(text) == 0:
+        return []
+
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return [x.strip() for x in lines]
+
+
+def decode_lines(data) -> List[str]:
+    """
+    Decode a bytes-like object (bytes, mmap, memoryview) in one pass and split it
+    into stripped lines
+    """
+    return split_text(str(data, BYTES_ENCODING))
+
+
+@contextmanager
+def open_file_bytes(path: Union[str, Path]) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    The contents of the file, mmap'd where possible and unmapped on exit
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # cannot mmap an empty file
+            yield b""
+            return
+        except OSError:
+            # e.g. a named pipe
+            yield f.read()
+            return
+        with data:
+            yield data
+
+
+def read_stdin_bytes() -> bytes:
+    return sys.stdin.buffer.read()
+
+
+def encode_text(text: str) -> bytes:
+    return text.encode(BYTES_ENCODING)
@@ -0,0 +1,256 @@
+"""
+Minimal HTTP front end for AsyncMaspsx, listening on TCP or a Unix socket, e.g.
+
+    python3 -m maspsx.server --listen 127.0.0.1:8700 --max-concurrency 8
+    curl -s --unix-socket /tmp/maspsx.sock http://localhost/compile -d @request.json
+
+POST /compile with a JSON body of:
+
+    {"input": "<gcc output>", "flags": ["--aspsx-version=2.77", "-G8"], "assemble": true}
+
+responds with:
+
+    {"output": "<maspsx output>", "object": "<base64>", "stderr": "...", "returncode": 0}
+
+Only the assembler flags in ALLOWED_AS_ARG_RE are accepted, and .include/.incbin
+(including --macro-inc) only for files within --include-root.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import sys
+
+from typing import List, Optional, Tuple
+
+from maspsx.aio import AsyncMaspsx
+from maspsx.options import MaspsxOptions, parse_flags
+
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+
+# anything else (e.g. -a=FILE, --MD FILE, @FILE or -I) could read or write
+# files on the server
+ALLOWED_AS_ARG_RE = re.compile(
+    r"^(-EL|-mips1|-no-pad-sections|-march=\w+|-mtune=\w+|-G\d+|-O\d?|-g\w*)$"
+)
+
+# GNU as directives are case insensitive
+FILE_DIRECTIVE_RE = re.compile(r"\.(include|incbin)\b", re.IGNORECASE)
+SIMPLE_FILE_DIRECTIVE_RE = re.compile(
+    r'^\s*\.(include|incbin)\s+"([^"\\]+)"\s*(,[^#"]*)?(#.*)?$', re.IGNORECASE
+)
+# macros could spell out a directive (or path) that isn't in the input
+MACRO_DIRECTIVE_RE = re.compile(r"\.(macro|irpc?)\b", re.IGNORECASE)
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    504: "Gateway Timeout",
+}
+
+
+def error(message: str) -> dict:
+    return {"error": message}
+
+
+def check_as_args(as_args: List[str]) -> None:
+    for arg in as_args:
+        if not ALLOWED_AS_ARG_RE.match(arg):
+            raise ValueError(f"Unsupported assembler argument: {arg}")
+
+
+def check_includes(text: str, options: MaspsxOptions, root: Optional[str]) -> None:
+    """
+    Raises ValueError unless every file the output will include is within root
+    """
+    names = ["macro.inc"] if options.macro_inc else []
+    for line in text.splitlines():
+        if MACRO_DIRECTIVE_RE.search(line):
+            raise ValueError(f"Unsupported directive: {line.strip()}")
+        if FILE_DIRECTIVE_RE.search(line):
+            match = SIMPLE_FILE_DIRECTIVE_RE.match(line)
+            if not match:
+                raise ValueError(f"Unsupported directive: {line.strip()}")
+            names.append(match.group(2))
+
+    if names and root is None:
+        raise ValueError(".include and .incbin are not enabled on this server")
+    for name in names:
+        assert root is not None
+        real_root = os.path.realpath(root)
+        path = os.path.realpath(os.path.join(real_root, name))
+        if os.path.commonpath([real_root, path]) != real_root:
+            raise ValueError(f"{name} is outside of the include root")
+
+
+async def handle_compile(maspsx: AsyncMaspsx, body: bytes) -> Tuple[int, dict]:
+    try:
+        request = json.loads(body)
+        text = request["input"]
+        flags = request.get("flags", [])
+        assemble = request.get("assemble", True)
+        if not isinstance(text, str) or not isinstance(flags, list):
+            raise ValueError("'input' must be a string and 'flags' a list")
+        options, as_args = parse_flags([str(x) for x in flags])
+        if assemble:
+            check_as_args(as_args)
+            check_includes(text, options, maspsx.cwd)
+    except (ValueError, KeyError, TypeError) as err:
+        return (400, error(f"Invalid request: {err}"))
+
+    try:
+        result = await maspsx.compile(text, options, as_args, assemble=assemble)
+    except asyncio.TimeoutError:
+        return (504, error(f"Timed out after {maspsx.timeout}s"))
+    except OSError as err:
+        # e.g. GNU as not found
+        return (500, error(str(err)))
+    except Exception as err:
+        # maspsx itself rejected the input
+        return (400, error(f"An exception occurred: {err}"))
+
+    return (
+        200,
+        {
+            "output": result.output,
+            "object": (
+                base64.b64encode(result.object).decode("ascii")
+                if result.object is not None
+                else None
+            ),
+            "stderr": result.stderr,
+            "returncode": result.returncode,
+        },
+    )
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, bytes]]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, *_ = request_line.decode("latin-1").split()
+
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        if key.strip().lower() == "content-length":
+            content_length = int(value.strip())
+
+    if content_length > MAX_REQUEST_SIZE:
+        raise OverflowError(content_length)
+    body = await reader.readexactly(content_length)
+    return (method, path, body)
+
+
+async def write_response(writer: asyncio.StreamWriter, status: int, payload: dict):
+    body = json.dumps(payload).encode("utf")
+    writer.write(
+        (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode("latin-1")
+        + body
+    )
+    await writer.drain()
+
+
+def make_handler(maspsx: AsyncMaspsx):
+    async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                request = await read_request(reader)
+            except OverflowError:
+                await write_response(writer, 413, error("Request too large"))
+                return
+            except (ValueError, asyncio.IncompleteReadError):
+                await write_response(writer, 400, error("Malformed HTTP request"))
+                return
+            if request is None:
+                return
+
+            method, path, body = request
+            if path != "/compile":
+                status, payload = (404, error(f"Unknown path {path}"))
+            elif method != "POST":
+                status, payload = (405, error("Use POST"))
+            else:
+                status, payload = await handle_compile(maspsx, body)
+            await write_response(writer, status, payload)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handler
+
+
+async def serve(
+    maspsx: AsyncMaspsx,
+    host: Optional[str] = None,
+    port: int = 0,
+    unix_path: Optional[str] = None,
+) -> asyncio.AbstractServer:
+    handler = make_handler(maspsx)
+    if unix_path:
+        return await asyncio.start_unix_server(handler, path=unix_path)
+    return await asyncio.start_server(handler, host=host, port=port)
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with AsyncMaspsx(
+        max_concurrency=args.max_concurrency,
+        timeout=args.timeout,
+        as_path=args.gnu_as_path,
+        cwd=args.include_root,
+    ) as maspsx:
+        if args.unix:
+            server = await serve(maspsx, unix_path=args.unix)
+            address = args.unix
+        else:
+            host, _, port = args.listen.rpartition(":")
+            server = await serve(maspsx, host=host or None, port=int(port))
+            address = ":".join(str(x) for x in server.sockets[0].getsockname()[:2])
+
+        sys.stderr.write(f"MASPSX: listening on {address}\n")
+        async with server:
+            await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--listen", default="127.0.0.1:8700", help="host:port")
+    group.add_argument("--unix", type=str, help="path of a Unix socket")
+    parser.add_argument("--max-concurrency", type=int)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--gnu-as-path", default="mipsel-linux-gnu-as")
+    parser.add_argument(
+        "--include-root",
+        type=str,
+        help="where .include/.incbin are resolved, they are rejected if not set",
+    )
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
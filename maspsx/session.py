@@ -0,0 +1,237 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple, Union
+
+from maspsx import is_instruction
+from maspsx.api import DEFAULT_OPTIONS, assemble, create_processor
+from maspsx.manifest import SymbolManifest
+from maspsx.options import MaspsxOptions
+from maspsx.reader import split_text
+
+# directives that change what preprocess_lines sees
+SECTION_DIRECTIVES = (
+    ".comm",
+    ".lcomm",
+    ".sdata",
+    ".data",
+    ".rdata",
+    ".section",
+    ".text",
+)
+
+
+@dataclass
+class Region:
+    start: int
+    end: int
+    function: Optional[str] = None  # None for anything outside of .ent/.end
+    key: Optional[tuple] = None
+    text: str = ""
+    exit_state: Optional[tuple] = None
+
+
+def lookahead(lines: List[str], end: int) -> Tuple[str, ...]:
+    """
+    The instructions that follow a region, as the ones at its end can look at
+    the next two. Both the session's region key and the function cache key
+    include this, so they must agree.
+    """
+    res: List[str] = []
+    i = end
+    while i < len(lines) and len(res) < 2:
+        if is_instruction(lines[i]):
+            res.append(lines[i])
+        i += 1
+    return tuple(res)
+
+
+def split_regions(lines: List[str]) -> List[Region]:
+    """
+    Split lines into alternating non-function and .ent ... .end function regions
+    """
+    regions = []
+    start = 0
+    function = None
+    for i, line in enumerate(lines):
+        if function is None and line.startswith(".ent\t"):
+            if i > start:
+                regions.append(Region(start, i))
+            start = i
+            function = line.split()[1]
+        elif function is not None and line.startswith(".end\t"):
+            regions.append(Region(start, i + 1, function))
+            start = i + 1
+            function = None
+    if start < len(lines):
+        regions.append(Region(start, len(lines), function))
+    return regions
+
+
+def text_to_lines(text_or_lines: Union[str, Iterable[str]]) -> List[str]:
+    if isinstance(text_or_lines, str):
+        return split_text(text_or_lines)
+    return [x.strip() for x in text_or_lines]
+
+
+class MaspsxSession:
+    """
+    Processes a TU once and then allows individual functions to be replaced,
+    only reprocessing regions whose input (or incoming state) has changed
+    """
+
+    def __init__(
+        self,
+        text_or_lines: Union[str, Iterable[str]],
+        options: MaspsxOptions = DEFAULT_OPTIONS,
+        symbol_manifest: Optional[SymbolManifest] = None,
+        cache_size: int = 1024,
+    ):
+        self.options = options
+        self.processor = create_processor(
+            text_to_lines(text_or_lines), options, symbol_manifest, stripped=True
+        )
+        self.symbols_generation = -1
+        self.symbols: Optional[dict] = None
+        self._begin()
+
+        self.regions = split_regions(self.processor.lines)
+        self.cache: "OrderedDict[tuple, Tuple[str, tuple]]" = OrderedDict()
+        self.cache_size = cache_size
+
+        self.preamble_text = "".join(f"{x}\n" for x in options.preamble)
+        self._process_regions(0)
+
+    def functions(self) -> List[str]:
+        return [x.function for x in self.regions if x.function is not None]
+
+    def output(self) -> str:
+        return (
+            self.preamble_text
+            + "".join(x.text for x in self.regions)
+            + self.footer_text
+        )
+
+    def assemble(
+        self,
+        as_path: str = "mipsel-linux-gnu-as",
+        args: Iterable[str] = (),
+        force_G0: bool = True,
+    ) -> bytes:
+        return assemble(self.output(), as_path, args, force_G0=force_G0)
+
+    def replace_function(self, text_or_lines: Union[str, Iterable[str]]) -> str:
+        """
+        Replace a function (from .ent to .end inclusive) and return the new output
+        """
+        new_lines = text_to_lines(text_or_lines)
+        new_regions = [x for x in split_regions(new_lines) if x.function is not None]
+        if len(new_regions) != 1:
+            raise Exception("Expected exactly one .ent ... .end function")
+        (new_region,) = new_regions
+        new_lines = new_lines[new_region.start : new_region.end]
+
+        index = self._find_function(new_region.function)
+        region = self.regions[index]
+
+        lines = self.processor.lines
+        old_lines = lines[region.start : region.end]
+        lines[region.start : region.end] = new_lines
+
+        delta = len(new_lines) - (region.end - region.start)
+        region.end += delta
+        for other in self.regions[index + 1 :]:
+            other.start += delta
+            other.end += delta
+
+        if any(x.startswith(SECTION_DIRECTIVES) for x in old_lines + new_lines):
+            # symbol tables may have changed, start again
+            self.processor.preprocessed_sdata_limit = None
+            self._begin()
+            # every region has to be looked at again, not just up to the
+            # first unchanged one (unchanged regions come from the cache)
+            for other in self.regions:
+                other.key = None
+            self._process_regions(0)
+        else:
+            # the previous region can look ahead into this one
+            self._process_regions(max(index - 1, 0))
+
+        return self.output()
+
+    def update(self, text_or_lines: Union[str, Iterable[str]]) -> str:
+        """
+        Replace the whole input (e.g. after recompiling the C file) and return
+        the new output, functions that haven't changed come from the cache
+        """
+        self.processor.lines = text_to_lines(text_or_lines)
+        self.processor.preprocessed_sdata_limit = None
+        self.regions = split_regions(self.processor.lines)
+        self._begin()
+        self._process_regions(0)
+        return self.output()
+
+    def _begin(self) -> None:
+        self.processor.begin_processing()
+        self.initial_state = self.processor.get_state()
+        if self.processor.symbols != self.symbols:
+            # cached output is only valid for the symbol table it was made with
+            self.symbols = dict(self.processor.symbols)
+            self.symbols_generation += 1
+
+        footer: List[str] = []
+        self.processor.finish_processing_into(footer)
+        self.footer_text = "".join(f"{x}\n" for x in footer)
+
+    def _find_function(self, function: str) -> int:
+        for i, region in enumerate(self.regions):
+            if region.function == function:
+                return i
+        raise Exception(f"Function {function} not found")
+
+    def _region_key(self, region: Region, entry_state: tuple) -> tuple:
+        lines = self.processor.lines
+        return (
+            tuple(lines[region.start : region.end]),
+            entry_state,
+            lookahead(lines, region.end),
+            self.symbols_generation,
+            # expanded div labels are numbered by line index
+            region.start if self.options.expand_div else None,
+        )
+
+    def _process_regions(self, first: int) -> None:
+        processor = self.processor
+        if first > 0:
+            processor.set_state(self.regions[first - 1].exit_state)
+        else:
+            processor.set_state(self.initial_state)
+
+        for region in self.regions[first:]:
+            entry_state = processor.get_state()
+            key = self._region_key(region, entry_state)
+
+            if key == region.key:
+                # unchanged input and state, so everything that follows is unchanged
+                processor.set_state(region.exit_state)
+                if region is not self.regions[first]:
+                    break
+                continue
+
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                region.text, region.exit_state = cached
+                processor.set_state(region.exit_state)
+            else:
+                out_lines: List[str] = []
+                processor.process_range_into(region.start, region.end, out_lines)
+                region.text = "".join(f"{x}\n" for x in out_lines)
+                region.exit_state = processor.get_state()
+                if region.function is not None:
+                    self._store(key, (region.text, region.exit_state))
+            region.key = key
+
+    def _store(self, key: tuple, value: Tuple[str, tuple]) -> None:
+        self.cache[key] = value
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
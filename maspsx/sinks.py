@@ -0,0 +1,134 @@
+import io
+import subprocess
+
+from typing import BinaryIO, Iterable, List, Optional, Protocol, TextIO, Union
+
+
+class OutputSink(Protocol):
+    """
+    Anything that output lines can be written to, a plain list is a valid sink
+    """
+
+    def append(self, line: str) -> None: ...
+
+    def extend(self, lines: Iterable[str]) -> None: ...
+
+
+class LineSink:
+    """
+    Base class for sinks that write each line (plus newline) somewhere
+    """
+
+    def append(self, line: str) -> None:
+        raise NotImplementedError
+
+    def extend(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.append(line)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class NullSink(LineSink):
+    def append(self, line: str) -> None:
+        pass
+
+    def extend(self, lines: Iterable[str]) -> None:
+        pass
+
+
+class StreamSink(LineSink):
+    """
+    Writes to a text stream, or to a binary stream if encoding is passed
+    """
+
+    def __init__(self, stream: Union[TextIO, BinaryIO], encoding: Optional[str] = None):
+        self.stream = stream
+        self.encoding = encoding
+        self._write = stream.write
+
+    def append(self, line: str) -> None:
+        if self.encoding:
+            self._write(line.encode(self.encoding))
+            self._write(b"\n")
+        else:
+            self._write(line)
+            self._write("\n")
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class BufferSink(StreamSink):
+    def __init__(self):
+        super().__init__(io.StringIO())
+
+    def getvalue(self) -> str:
+        return self.stream.getvalue()
+
+
+class DeferredSink(LineSink):
+    """
+    Holds every line until close, so nothing is written if processing fails
+    """
+
+    def __init__(self, sink: LineSink):
+        self.sink = sink
+        self.lines: List[str] = []
+
+    def append(self, line: str) -> None:
+        self.lines.append(line)
+
+    def extend(self, lines: Iterable[str]) -> None:
+        self.lines.extend(lines)
+
+    def close(self) -> None:
+        self.sink.extend(self.lines)
+        self.sink.close()
+
+
+class TeeSink(LineSink):
+    def __init__(self, *sinks: OutputSink):
+        self.sinks = sinks
+
+    def append(self, line: str) -> None:
+        for sink in self.sinks:
+            sink.append(line)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            if isinstance(sink, LineSink):
+                sink.close()
+
+
+class AssemblerSink(StreamSink):
+    """
+    Pipes lines straight into the stdin of the assembler as they are produced
+    """
+
+    def __init__(self, cmd: List[str], encoding: str = "utf"):
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        assert self.process.stdin is not None
+        super().__init__(self.process.stdin, encoding=encoding)
+        self.returncode: Optional[int] = None
+
+    def close(self) -> None:
+        if self.returncode is None:
+            try:
+                self.stream.close()
+            except BrokenPipeError:
+                # assembler has exited, it will have reported why
+                pass
+            self.returncode = self.process.wait()
+
+    def abort(self) -> None:
+        if self.returncode is None:
+            self.process.kill()
+            self.returncode = self.process.wait()
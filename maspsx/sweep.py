@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from maspsx import MaspsxProcessor
+from maspsx.options import MaspsxOptions
+from maspsx.sinks import BufferSink
+
+
+@dataclass
+class VersionVariant:
+    versions: List[str]
+    text: str
+
+
+def group_versions_by_flags(
+    versions: List[str], dont_expand_li=False
+) -> Dict[Tuple[Tuple[str, bool], ...], List[str]]:
+    groups: Dict[Tuple[Tuple[str, bool], ...], List[str]] = {}
+    for version in versions:
+        options = MaspsxOptions(aspsx_version=version, dont_expand_li=dont_expand_li)
+        flags = options.version_flags()
+        groups.setdefault(tuple(sorted(flags.items())), []).append(version)
+    return groups
+
+
+def process_versions(
+    lines: List[str],
+    versions: List[str],
+    preamble: Optional[List[str]] = None,
+    dont_expand_li=False,
+    **kwargs,
+) -> List[VersionVariant]:
+    """
+    Process lines once per distinct set of version flags, and return one
+    variant per distinct output along with the versions that produce it
+    """
+    mp = MaspsxProcessor(lines, **kwargs)
+
+    variants: Dict[str, VersionVariant] = {}
+    for flags, flag_versions in group_versions_by_flags(
+        versions, dont_expand_li=dont_expand_li
+    ).items():
+        for flag, value in flags:
+            setattr(mp, flag, value)
+
+        sink = BufferSink()
+        sink.extend(preamble or [])
+        mp.process_lines_into(sink)
+        text = sink.getvalue()
+
+        if text in variants:
+            variants[text].versions.extend(flag_versions)
+        else:
+            variants[text] = VersionVariant(versions=list(flag_versions), text=text)
+
+    res = list(variants.values())
+    for variant in res:
+        variant.versions.sort(key=versions.index)
+    res.sort(key=lambda x: versions.index(x.versions[0]))
+    return res
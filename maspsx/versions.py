@@ -0,0 +1,76 @@
+from typing import Dict, List, Optional, Tuple
+
+# every ASPSX version known to maspsx, see the "Known Differences" table in README.md
+ASPSX_VERSIONS = [
+    "1.05",
+    "1.07",
+    "2.05",
+    "2.08",
+    "2.21",
+    "2.30",
+    "2.34",
+    "2.56",
+    "2.67",
+    "2.77",
+    "2.79",
+    "2.81",
+    "2.86",
+]
+
+
+def parse_version(aspsx_version: str) -> Tuple[int, ...]:
+    return tuple(int(x) for x in aspsx_version.split("."))
+
+
+def get_version_flags(aspsx_version: Optional[str]) -> Dict[str, bool]:
+    """
+    Returns the MaspsxProcessor flags that emulate the given ASPSX version
+    """
+    div_uses_tge = False  # use tge instruction instead of break in divide
+    nop_at_expansion = False  # insert nop between v0/at?
+    nop_mflo_mfhi = True  # ensure 2 ops between mfhi/mflo and div/mult
+    sltu_at = True  # sltu uses at?
+    expand_li = True  # turn li into lui/ori
+    gp_allow_offset = False  # use gp for sym+offset?
+    gp_allow_la = False  # use gp for la
+    addiu_at = False  # use addiu when expanding lw to use $at
+
+    if aspsx_version:
+        version = parse_version(aspsx_version)
+        if (1, 10) < version < (2, 10):
+            div_uses_tge = True
+        if version < (2, 30):
+            nop_at_expansion = True
+            nop_mflo_mfhi = False
+            addiu_at = True
+        if version >= (2, 50):
+            expand_li = False
+        if version >= (2, 60):
+            sltu_at = False
+        if version >= (2, 70):
+            gp_allow_offset = True
+        if version >= (2, 80):
+            gp_allow_la = True
+
+    return {
+        "div_uses_tge": div_uses_tge,
+        "nop_at_expansion": nop_at_expansion,
+        "nop_mflo_mfhi": nop_mflo_mfhi,
+        "sltu_at": sltu_at,
+        "expand_li": expand_li,
+        "gp_allow_offset": gp_allow_offset,
+        "gp_allow_la": gp_allow_la,
+        "addiu_at": addiu_at,
+    }
+
+
+def parse_version_list(value: str) -> List[str]:
+    """
+    e.g. "all" or "2.56,2.67,2.77"
+    """
+    if value == "all":
+        return list(ASPSX_VERSIONS)
+    versions = [x.strip() for x in value.split(",") if x.strip()]
+    for version in versions:
+        parse_version(version)  # raises ValueError if malformed
+    return versions
@@ -0,0 +1,296 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, TextIO, Tuple
+
+from maspsx.assembler import run_assembler, strip_output_args
+from maspsx.compare import compare_files
+from maspsx.elf import ElfReader
+from maspsx.encoder import UnsupportedAssembly, assemble_native
+from maspsx.manifest import SymbolManifest
+from maspsx.options import MaspsxOptions
+from maspsx.reader import BYTES_ENCODING, decode_lines
+from maspsx.session import MaspsxSession
+
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+# editors often save by writing a new file and renaming it over the old one,
+# so watch the directory rather than the file
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# changes arriving this close together are handled as one
+DEBOUNCE = 0.05
+
+
+class InotifyWatcher:
+    def __init__(self, paths: List[Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.names: Dict[int, Set[str]] = {}
+        self.directories: Dict[int, Path] = {}
+        for path in paths:
+            path = path.absolute()
+            wd = libc.inotify_add_watch(
+                self.fd, bytes(path.parent), ctypes.c_uint32(WATCH_MASK)
+            )
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"Can't watch {path.parent}")
+            self.directories[wd] = path.parent
+            self.names.setdefault(wd, set()).add(path.name)
+
+    def _read_events(self) -> Set[Path]:
+        changed = set()
+        data = os.read(self.fd, 1 << 16)
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+            if name in self.names.get(wd, ()):
+                changed.add(self.directories[wd] / name)
+        return changed
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """
+        Returns the paths that changed, or an empty set on timeout
+        """
+        changed: Set[Path] = set()
+        while True:
+            ready, _, _ = select.select(
+                [self.fd], [], [], DEBOUNCE if changed else timeout
+            )
+            if not ready:
+                return changed
+            changed |= self._read_events()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, paths: List[Path], interval: float = 0.1):
+        self.paths = [x.absolute() for x in paths]
+        self.interval = interval
+        self.stats = {x: self._stat(x) for x in self.paths}
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed: Set[Path] = set()
+        while True:
+            for path in self.paths:
+                stat = self._stat(path)
+                if stat != self.stats[path]:
+                    self.stats[path] = stat
+                    changed.add(path)
+            if changed:
+                time.sleep(DEBOUNCE)
+                for path in self.paths:
+                    self.stats[path] = self._stat(path)
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            time.sleep(self.interval)
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(paths: List[Path]):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths)
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    # readers never see a partially written file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def text_dump(obj: bytes) -> bytes:
+    words = ElfReader(obj).words(".text")
+    return "".join(f"0x{x:08X}\n" for x in words).encode("utf")
+
+
+@dataclass
+class WatchConfig:
+    watch_paths: List[Path]
+    options: MaspsxOptions
+    as_path: str
+    as_args: List[str]  # already filtered, including -G0 if needed
+    object_path: Path
+    input_path: Optional[Path] = None
+    build_command: Optional[str] = None
+    dump_text: Optional[Path] = None
+    compare_to: Optional[Path] = None
+    native: bool = False
+    symbol_manifest: Optional[Path] = None
+
+
+@dataclass
+class Iteration:
+    timings: Dict[str, float] = field(default_factory=dict)
+    unchanged: bool = False
+    results: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        total = sum(self.timings.values())
+        parts = ", ".join(f"{k} {v * 1000:.1f} ms" for k, v in self.timings.items())
+        if self.unchanged:
+            return f"unchanged after {total * 1000:.1f} ms ({parts})"
+        return f"rebuilt in {total * 1000:.1f} ms ({parts})"
+
+
+class Watcher:
+    """
+    Rebuilds the object whenever the input changes, the session (and its
+    per-function cache) stays alive between builds
+    """
+
+    def __init__(self, config: WatchConfig):
+        self.config = config
+        self.session: Optional[MaspsxSession] = None
+        self.last_input: Optional[bytes] = None
+        self.manifest: Optional[SymbolManifest] = None
+        self.manifest_stat: Optional[Tuple[int, int, int]] = None
+
+    def read_input(self) -> bytes:
+        config = self.config
+        if config.build_command:
+            result = subprocess.run(
+                config.build_command, shell=True, stdout=subprocess.PIPE
+            )
+            if result.returncode != 0:
+                raise Exception(f"build command failed ({result.returncode})")
+            return result.stdout
+        assert config.input_path is not None
+        return config.input_path.read_bytes()
+
+    def open_manifest(self) -> Optional[SymbolManifest]:
+        config = self.config
+        if config.symbol_manifest is None:
+            return None
+        stat = PollingWatcher._stat(config.symbol_manifest)
+        if self.manifest is not None and stat == self.manifest_stat:
+            return self.manifest
+        # another build updated the manifest, so start a new session with it
+        if self.manifest is not None:
+            self.manifest.close()
+        self.session = None
+        self.last_input = None
+        self.manifest = SymbolManifest.open(config.symbol_manifest)
+        self.manifest_stat = stat
+        return self.manifest
+
+    def build(self) -> Iteration:
+        config = self.config
+        iteration = Iteration()
+
+        start = time.perf_counter()
+        data = self.read_input()
+        manifest = self.open_manifest()
+        iteration.timings["build" if config.build_command else "read"] = (
+            time.perf_counter() - start
+        )
+        if data == self.last_input:
+            iteration.unchanged = True
+            return iteration
+
+        start = time.perf_counter()
+        lines = decode_lines(data)
+        if self.session is None:
+            self.session = MaspsxSession(lines, config.options, manifest)
+            text = self.session.output()
+        else:
+            text = self.session.update(lines)
+        iteration.timings["maspsx"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        obj = None
+        if config.native:
+            try:
+                obj = assemble_native(text, strip_output_args(config.as_args))
+            except UnsupportedAssembly:
+                pass
+        if obj is None:
+            obj = run_assembler(
+                text, config.as_path, config.as_args, encoding=BYTES_ENCODING
+            )
+        iteration.timings["as"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_atomic(config.object_path, obj)
+        if config.dump_text:
+            write_atomic(config.dump_text, text_dump(obj))
+        if config.compare_to:
+            iteration.results = [
+                str(x) for x in compare_files(config.object_path, config.compare_to)
+            ]
+        iteration.timings["write"] = time.perf_counter() - start
+
+        self.last_input = data
+        return iteration
+
+    def run(
+        self,
+        out: TextIO = sys.stderr,
+        watcher_factory: Callable = create_watcher,
+        max_iterations: Optional[int] = None,
+    ) -> None:
+        watcher = watcher_factory(self.config.watch_paths)
+        try:
+            iterations = 0
+            while max_iterations is None or iterations < max_iterations:
+                try:
+                    iteration = self.build()
+                except Exception as err:
+                    out.write(f"MASPSX: An exception occurred: {err}\n")
+                else:
+                    for result in iteration.results:
+                        out.write(f"{result}\n")
+                    out.write(f"MASPSX: {iteration}\n")
+                out.flush()
+                iterations += 1
+                if max_iterations is not None and iterations >= max_iterations:
+                    break
+                while not watcher.wait():
+                    pass
+        finally:
+            watcher.close()
@@ -0,0 +1,30 @@
+"""
+maspsx-cc, a gcc-style driver that runs cpp | cc1 | maspsx | as without a
+shell pipeline, e.g.
+
+    python3 maspsx_cc.py --cc1-path=bin/cc1 --aspsx-version=2.77 -O2 -G8 \
+        -mcpu=3000 -Iinclude -c src/main.c -o build/main.o
+"""
+
+import sys
+
+from maspsx.driver import compile_source, parse_invocation
+
+
+def main() -> None:
+    try:
+        invocation = parse_invocation(sys.argv[1:])
+    except ValueError as err:
+        sys.stderr.write(f"maspsx-cc: {err}\n")
+        sys.exit(1)
+
+    try:
+        returncode = compile_source(invocation)
+    except Exception as err:
+        sys.stderr.write(f"maspsx-cc: An exception occurred: {err}\n")
+        sys.exit(1)
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
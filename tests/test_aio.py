@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import maspsx
+
+from maspsx import MaspsxOptions
+from maspsx.aio import AsyncMaspsx
+from maspsx.options import parse_flags
+from maspsx.server import handle_compile, serve
+
+# writes its args and input to the object file after sleeping for argv[1] seconds
+FAKE_AS = """#!{python}
+import sys, time
+time.sleep(float({delay!r}))
+args = sys.argv[1:]
+if "--fail" in args:
+    sys.stderr.write("Error: bad\\n")
+    sys.exit(1)
+with open(args[args.index("-o") + 1], "w") as f:
+    f.write(" ".join(args) + "\\n" + sys.stdin.read())
+"""
+
+TEXT = "\tli\t$2,0x12345\n\tsw\t$2,40000($4)\n"
+
+
+class TestAio(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.executor = ThreadPoolExecutor()
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.tmp_dir.cleanup()
+
+    def make_as(self, delay=0.0) -> str:
+        as_path = Path(self.tmp_dir.name) / f"fake-as-{delay}"
+        as_path.write_text(FAKE_AS.format(python=sys.executable, delay=delay))
+        as_path.chmod(as_path.stat().st_mode | stat.S_IEXEC)
+        return str(as_path)
+
+    def make_maspsx(self, **kwargs) -> AsyncMaspsx:
+        kwargs.setdefault("executor", self.executor)
+        return AsyncMaspsx(**kwargs)
+
+    def test_process(self):
+        options = MaspsxOptions(aspsx_version="2.21", macro_inc=True)
+
+        async def run():
+            return await self.make_maspsx().process(TEXT, options)
+
+        self.assertEqual(maspsx.process(TEXT, options), asyncio.run(run()))
+
+    def test_process_pool(self):
+        async def run():
+            async with AsyncMaspsx(max_concurrency=2) as aio:
+                return await asyncio.gather(*[aio.process(TEXT) for _ in range(4)])
+
+        self.assertEqual([maspsx.process(TEXT)] * 4, asyncio.run(run()))
+
+    def test_compile(self):
+        options, as_args = parse_flags(["--aspsx-version=2.77", "-G8", "-o", "x.o"])
+        self.assertEqual(8, options.sdata_limit)
+        self.assertEqual(["-G8", "-o", "x.o", "-G0"], as_args)
+
+        async def run():
+            aio = self.make_maspsx(as_path=self.make_as())
+            return await aio.compile(TEXT, options, as_args)
+
+        result = asyncio.run(run())
+        self.assertEqual(0, result.returncode)
+        self.assertEqual(maspsx.process(TEXT, options), result.output)
+        header, body = result.object.decode("utf").split("\n", 1)
+        self.assertTrue(header.startswith("-G8 -G0 -o "))
+        self.assertEqual(result.output, body)
+
+    def test_compile_failure(self):
+        async def run():
+            aio = self.make_maspsx(as_path=self.make_as())
+            return await aio.compile(TEXT, as_args=["--fail"])
+
+        result = asyncio.run(run())
+        self.assertEqual(1, result.returncode)
+        self.assertIsNone(result.object)
+        self.assertIn("Error: bad", result.stderr)
+
+    def test_concurrency_limit(self):
+        async def run():
+            aio = self.make_maspsx(max_concurrency=2, as_path=self.make_as(0.3))
+            start = time.monotonic()
+            await asyncio.gather(*[aio.assemble(TEXT) for _ in range(4)])
+            return time.monotonic() - start
+
+        # 4 requests, 2 at a time
+        self.assertGreaterEqual(asyncio.run(run()), 0.6)
+
+    def test_timeout(self):
+        async def run():
+            aio = self.make_maspsx(timeout=0.2, as_path=self.make_as(30))
+            with self.assertRaises(asyncio.TimeoutError):
+                await aio.compile(TEXT)
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_handle_compile(self):
+        async def run(body):
+            aio = self.make_maspsx(as_path=self.make_as())
+            return await handle_compile(aio, body)
+
+        status, payload = asyncio.run(run(b"not json"))
+        self.assertEqual(400, status)
+
+        status, payload = asyncio.run(run(json.dumps({"flags": []}).encode()))
+        self.assertEqual(400, status)
+
+        status, payload = asyncio.run(
+            run(json.dumps({"input": TEXT, "flags": ["--aspsx-version"]}).encode())
+        )
+        self.assertEqual(400, status)
+
+        status, payload = asyncio.run(
+            run(json.dumps({"input": "\tdiv\t$2,$3,$4,$5\n"}).encode())
+        )
+        self.assertEqual(400, status)
+
+        status, payload = asyncio.run(
+            run(json.dumps({"input": TEXT, "assemble": False}).encode())
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(maspsx.process(TEXT), payload["output"])
+        self.assertIsNone(payload["object"])
+
+    def test_handle_compile_files(self):
+        root = Path(self.tmp_dir.name) / "root"
+        (root / "asm").mkdir(parents=True)
+        (root / "macro.inc").write_text("")
+        (root / "asm" / "func.s").write_text("")
+        os.symlink("/etc/passwd", root / "passwd")
+
+        async def run(text, flags=(), cwd=None):
+            aio = self.make_maspsx(as_path=self.make_as(), cwd=cwd)
+            body = json.dumps({"input": text, "flags": list(flags)}).encode()
+            return (await handle_compile(aio, body))[0]
+
+        # as args that could read or write files
+        for flags in (["-a=/tmp/listing"], ["--MD", "/tmp/deps"], ["@/tmp/args"]):
+            with self.subTest(flags=flags):
+                self.assertEqual(400, asyncio.run(run(TEXT, flags)))
+        self.assertEqual(200, asyncio.run(run(TEXT, ["-G8", "-march=r3000", "-O2"])))
+
+        # nothing can be included without an include root
+        self.assertEqual(400, asyncio.run(run(TEXT, ["--macro-inc"])))
+        self.assertEqual(200, asyncio.run(run(TEXT, ["--macro-inc"], cwd=str(root))))
+
+        for text, expected in (
+            ('.include "asm/func.s"\n', 200),
+            ('.incbin "asm/func.s",0,4 # maspsx-keep\n', 200),
+            ('.incbin "/etc/passwd"\n', 400),
+            ('.INCBIN "../../etc/passwd"\n', 400),
+            ('.incbin "passwd"\n', 400),  # via a symlink
+            (".incbin\tpath\n", 400),
+            ('.macro\tm d\n.\\d "/etc/passwd"\n.endm\n', 400),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(expected, asyncio.run(run(TEXT + text, cwd=str(root))))
+
+    def test_server(self):
+        request = json.dumps(
+            {"input": TEXT, "flags": ["--aspsx-version=2.34", "--macro-inc"]}
+        ).encode()
+
+        async def fetch(reader, writer, path=b"/compile"):
+            writer.write(
+                b"POST " + path + b" HTTP/1.1\r\n"
+                b"Content-Length: " + str(len(request)).encode() + b"\r\n\r\n"
+            )
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            head, body = response.split(b"\r\n\r\n", 1)
+            return int(head.split()[1]), json.loads(body)
+
+        # macro.inc is resolved against the include root
+        Path(self.tmp_dir.name, "macro.inc").write_text("")
+
+        async def run(unix_path=None):
+            aio = self.make_maspsx(as_path=self.make_as(), cwd=self.tmp_dir.name)
+            server = await serve(aio, host="127.0.0.1", unix_path=unix_path)
+            async with server:
+                if unix_path:
+                    connect = lambda: asyncio.open_unix_connection(unix_path)
+                else:
+                    connect = lambda: asyncio.open_connection(
+                        *server.sockets[0].getsockname()[:2]
+                    )
+                return (
+                    await fetch(*await connect()),
+                    await fetch(*await connect(), b"/nope"),
+                )
+
+        expected = maspsx.process(TEXT, MaspsxOptions("2.34", macro_inc=True))
+        for unix_path in (None, os.path.join(self.tmp_dir.name, "maspsx.sock")):
+            (status, payload), (missing, _) = asyncio.run(run(unix_path))
+            self.assertEqual(200, status)
+            self.assertEqual(0, payload["returncode"])
+            self.assertEqual(expected, payload["output"])
+            self.assertTrue(
+                base64.b64decode(payload["object"]).decode().endswith(expected)
+            )
+            self.assertEqual(404, missing)
@@ -0,0 +1,74 @@
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import maspsx
+
+from maspsx import MaspsxOptions, MaspsxProcessor
+from maspsx.options import filter_as_args
+from maspsx.versions import get_version_flags
+
+FAKE_AS = """#!{python}
+import sys
+args = sys.argv[1:]
+with open(args[args.index("-o") + 1], "w") as f:
+    f.write(" ".join(args) + "\\n" + sys.stdin.read())
+"""
+
+
+class TestApi(unittest.TestCase):
+    def test_process_text(self):
+        text = "\tli\t$2,1\n\tsw\t$2,40000($4)\n"
+        options = MaspsxOptions(aspsx_version="2.05", macro_inc=True)
+
+        mp = MaspsxProcessor(
+            text.splitlines(), **get_version_flags(options.aspsx_version)
+        )
+        expected_text = "\n".join(['.include "macro.inc"'] + mp.process_lines()) + "\n"
+
+        self.assertEqual(expected_text, maspsx.process(text, options))
+        self.assertEqual(expected_text, maspsx.process(text.splitlines(), options))
+
+    def test_options(self):
+        options = MaspsxOptions(aspsx_version="2.86", sdata_limit=8)
+        self.assertEqual(options, MaspsxOptions(aspsx_version="2.86", sdata_limit=8))
+        self.assertEqual(1, len({options, options.with_version("2.86")}))
+
+        kwargs = options.processor_kwargs()
+        self.assertEqual(8, kwargs["sdata_limit"])
+        self.assertTrue(kwargs["gp_allow_la"])
+        self.assertFalse(kwargs["expand_li"])
+
+        self.assertTrue(
+            MaspsxOptions(aspsx_version="2.08").version_flags()["expand_li"]
+        )
+        self.assertFalse(
+            MaspsxOptions(aspsx_version="2.08", dont_expand_li=True).version_flags()[
+                "expand_li"
+            ]
+        )
+
+    def test_filter_as_args(self):
+        self.assertEqual(
+            (["-mtune=3000", "-G8", "-o", "out.o"], 8),
+            filter_as_args(["-KPIC", "-mcpu=3000", "-G8", "-o", "out.o"]),
+        )
+
+    def test_assemble(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            as_path = Path(tmp_dir) / "fake-as"
+            as_path.write_text(FAKE_AS.format(python=sys.executable))
+            as_path.chmod(as_path.stat().st_mode | stat.S_IEXEC)
+
+            obj = maspsx.assemble(
+                "nop\n", str(as_path), ["-mcpu=3000", "-o", "ignored.o"]
+            )
+
+        args, text = obj.decode("utf").split("\n", 1)
+        self.assertEqual("nop\n", text)
+        self.assertTrue(args.startswith("-mtune=3000 -G0 -o "))
+        self.assertNotIn("ignored.o", args)
@@ -0,0 +1,129 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import maspsx
+
+from maspsx import MaspsxOptions
+from maspsx.api import create_processor
+from maspsx.cache import (
+    DirectoryStore,
+    FunctionCache,
+    function_key,
+    process_cached_into,
+)
+from maspsx.session import split_regions
+
+from tests.test_session import FOOTER, FUNC_A, FUNC_B, FUNC_B_NEW, FUNC_C, HEADER
+
+MASPSX = Path(__file__).parent.parent / "maspsx.py"
+
+
+class TestFunctionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = DirectoryStore(Path(self.tmp_dir.name))
+        self.cache = FunctionCache(self.store)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def process(self, lines, options):
+        processor = create_processor(lines, options)
+        res = list(options.preamble)
+        stats = process_cached_into(processor, self.cache, res)
+        self.assertEqual(maspsx.process(lines, options), "".join(f"{x}\n" for x in res))
+        return stats
+
+    def check_rebuild(self, options, expected):
+        lines = HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER
+        stats = self.process(lines, options)
+        self.assertEqual((0, 3), (stats.hits, stats.misses))
+
+        stats = self.process(lines, options)
+        self.assertEqual((3, 0), (stats.hits, stats.misses))
+
+        stats = self.process(HEADER + FUNC_A + FUNC_B_NEW + FUNC_C + FOOTER, options)
+        self.assertEqual(expected, (stats.hits, stats.misses))
+
+    def test_rebuild(self):
+        # only the changed function is processed
+        self.check_rebuild(MaspsxOptions(aspsx_version="2.56", sdata_limit=8), (2, 1))
+
+    def test_rebuild_expand_div(self):
+        # func_c has moved, and its expanded div labels are numbered by line
+        self.check_rebuild(
+            MaspsxOptions(aspsx_version="2.08", sdata_limit=8, expand_div=True),
+            (1, 2),
+        )
+
+    def test_options(self):
+        lines = HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER
+        self.process(lines, MaspsxOptions(aspsx_version="2.56", sdata_limit=8))
+        stats = self.process(lines, MaspsxOptions(aspsx_version="2.86", sdata_limit=8))
+        self.assertEqual(0, stats.hits)
+
+    def test_symbols(self):
+        options = MaspsxOptions(aspsx_version="2.56", sdata_limit=8)
+        self.process(HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER, options)
+
+        # only func_b doesn't refer to smallVar
+        stats = self.process(
+            HEADER + FUNC_A + FUNC_B + FUNC_C + ["	.comm	smallVar,16"], options
+        )
+        self.assertEqual((1, 2), (stats.hits, stats.misses))
+
+        # new symbols don't matter to functions that don't use them
+        stats = self.process(
+            HEADER + ["	.comm	otherVar,4"] + FUNC_A + FUNC_B + FUNC_C + FOOTER,
+            options,
+        )
+        self.assertEqual((3, 0), (stats.hits, stats.misses))
+
+    def test_key(self):
+        options = MaspsxOptions(aspsx_version="2.56", sdata_limit=8)
+
+        def keys(lines):
+            processor = create_processor(lines, options)
+            processor.begin_processing()
+            return [
+                function_key(processor, x)
+                for x in split_regions(processor.lines)
+                if x.function
+            ]
+
+        # moving a function doesn't change its key
+        self.assertEqual(
+            keys(HEADER + FUNC_A + FUNC_B + FOOTER),
+            keys(HEADER + ["	.data", "	.word	1", "	.text"] + FUNC_A + FUNC_B + FOOTER),
+        )
+
+    def test_corrupt(self):
+        lines = HEADER + FUNC_A + FOOTER
+        options = MaspsxOptions(aspsx_version="2.56")
+        self.process(lines, options)
+        for path in Path(self.tmp_dir.name).rglob("*"):
+            if path.is_file():
+                path.write_bytes(b"not json")
+        stats = self.process(lines, options)
+        self.assertEqual((0, 1), (stats.hits, stats.misses))
+
+    def test_maspsx(self):
+        text = "\n".join(HEADER + FUNC_A + FUNC_B + FOOTER) + "\n"
+        args = [sys.executable, str(MASPSX), "--aspsx-version=2.56", "-G8"]
+        expected = subprocess.run(
+            args, input=text, capture_output=True, text=True, check=True
+        ).stdout
+        for _ in range(2):
+            result = subprocess.run(
+                [*args, f"--cache-dir={self.tmp_dir.name}"],
+                input=text,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            self.assertEqual(expected, result.stdout)
+        self.assertTrue(any(Path(self.tmp_dir.name).iterdir()))
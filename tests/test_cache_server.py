@@ -0,0 +1,206 @@
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+
+from maspsx import MaspsxOptions
+from maspsx.api import create_processor
+from maspsx.cache import (
+    CacheBackend,
+    DirectoryStore,
+    FunctionCache,
+    HttpStore,
+    ObjectCacheSink,
+    TieredStore,
+    process_cached_into,
+)
+from maspsx.cache_server import handle, serve
+from maspsx.sinks import AssemblerSink
+
+from tests.test_driver import FAKE_AS
+from tests.test_session import FOOTER, FUNC_A, FUNC_B, FUNC_C, HEADER
+
+KEY = "ab" * 32
+
+
+class ServerThread:
+    """
+    Runs the cache server on an ephemeral port in a background event loop
+    """
+
+    def __init__(self, store):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            serve(store, host="127.0.0.1"), self.loop
+        ).result()
+        host, port = self.server.sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+
+    def close(self):
+        async def stop():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class SlowStore(CacheBackend):
+    def __init__(self, delay):
+        self.delay = delay
+        self.values = {}
+
+    def get(self, key):
+        time.sleep(self.delay)
+        return self.values.get(key)
+
+    def put(self, key, value):
+        self.values[key] = value
+
+
+class TestHandle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = DirectoryStore(Path(self.tmp_dir.name))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_put(self):
+        self.assertEqual((404, b""), handle(self.store, "GET", f"/{KEY}", b""))
+        self.assertEqual((200, b""), handle(self.store, "PUT", f"/{KEY}", b"value"))
+        self.assertEqual((200, b"value"), handle(self.store, "GET", f"/{KEY}", b""))
+
+    def test_errors(self):
+        self.assertEqual(404, handle(self.store, "GET", "/../etc/passwd", b"")[0])
+        self.assertEqual(404, handle(self.store, "PUT", "/abc", b"value")[0])
+        self.assertEqual(405, handle(self.store, "DELETE", f"/{KEY}", b"")[0])
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.server = ServerThread(DirectoryStore(self.path / "server"))
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp_dir.cleanup()
+
+    def tiered(self, name):
+        return TieredStore(DirectoryStore(self.path / name), HttpStore(self.server.url))
+
+    def test_http_store(self):
+        store = HttpStore(self.server.url)
+        self.assertIsNone(store.get(KEY))
+        store.put(KEY, b"\x00value")
+        self.assertEqual(b"\x00value", store.get(KEY))
+
+    def test_unreachable(self):
+        # nothing is listening on port 1
+        store = HttpStore("http://127.0.0.1:1", timeout=0.1)
+        self.assertIsNone(store.get(KEY))
+        store.put(KEY, b"value")
+
+    def test_timeout(self):
+        remote = SlowStore(0.5)
+        remote.put(KEY, b"value")
+        store = TieredStore(None, remote, timeout=0.05)
+        start = time.perf_counter()
+        self.assertIsNone(store.get(KEY))
+        self.assertLess(time.perf_counter() - start, 0.4)
+        store.close()
+
+    def test_prefetch(self):
+        local = DirectoryStore(self.path / "local")
+        remote = SlowStore(0.2)
+        remote.put(KEY, b"value")
+        store = TieredStore(local, remote, timeout=0.05)
+        store.prefetch([KEY])
+        time.sleep(0.3)
+        self.assertEqual(b"value", store.get(KEY))
+        store.close()
+        # remote hits are kept locally
+        self.assertEqual(b"value", local.get(KEY))
+
+    def test_background_put(self):
+        store = self.tiered("local")
+        store.put(KEY, b"value")
+        store.close()
+        self.assertEqual(b"value", HttpStore(self.server.url).get(KEY))
+
+    def test_functions(self):
+        lines = HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER
+        options = MaspsxOptions(aspsx_version="2.56", sdata_limit=8)
+
+        results = []
+        # another machine, with its own (empty) local cache
+        for name, expected in (("first", (0, 3)), ("second", (3, 0))):
+            store = self.tiered(name)
+            res = []
+            processor = create_processor(lines, options)
+            stats = process_cached_into(processor, FunctionCache(store), res)
+            store.close()
+            self.assertEqual(expected, (stats.hits, stats.misses))
+            results.append(res)
+        self.assertEqual(results[0], results[1])
+
+    def test_object(self):
+        as_path = self.path / "as"
+        as_path.write_text(FAKE_AS.format(python=sys.executable))
+        as_path.chmod(0o755)
+        object_path = self.path / "main.o"
+        cmd = [str(as_path), "-G0", "-o", str(object_path), "-"]
+        lines = ["\t.text", "\tnop"]
+
+        store = self.tiered("first")
+        sink = ObjectCacheSink(store, cmd, lambda: AssemblerSink(cmd))
+        sink.extend(lines)
+        sink.close()
+        store.close()
+        self.assertEqual((0, False), (sink.returncode, sink.hit))
+        expected = object_path.read_bytes()
+        object_path.unlink()
+
+        def no_assembler():
+            raise AssertionError("the assembler should not run")
+
+        store = self.tiered("second")
+        sink = ObjectCacheSink(store, cmd, no_assembler)
+        sink.extend(lines)
+        sink.close()
+        store.close()
+        self.assertEqual((0, True), (sink.returncode, sink.hit))
+        self.assertEqual(expected, object_path.read_bytes())
+
+    def test_object_includes(self):
+        as_path = self.path / "as"
+        as_path.write_text(FAKE_AS.format(python=sys.executable))
+        as_path.chmod(0o755)
+        object_path = self.path / "main.o"
+        include_path = self.path / "include" / "func.s"
+        include_path.parent.mkdir()
+        include_path.write_text("\tnop\n")
+        cmd = [str(as_path), "-I", str(include_path.parent), "-o", str(object_path)]
+        lines = ["\t.text", '\t.include "func.s"']
+
+        def build():
+            store = DirectoryStore(self.path / "local")
+            sink = ObjectCacheSink(store, cmd, lambda: AssemblerSink(cmd))
+            sink.extend(lines)
+            sink.close()
+            return sink.hit
+
+        self.assertFalse(build())
+        self.assertTrue(build())
+        # the text is the same, but what it includes isn't
+        include_path.write_text("\tnop\n\tnop\n")
+        self.assertFalse(build())
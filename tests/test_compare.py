@@ -0,0 +1,194 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx.compare import (
+    Difference,
+    compare_files,
+    compare_objects,
+    function_ranges,
+)
+from maspsx.elf import (
+    R_MIPS_HI16,
+    R_MIPS_LO16,
+    SHF_ALLOC,
+    SHF_EXECINSTR,
+    SHT_PROGBITS,
+    STB_GLOBAL,
+    ElfReader,
+    ElfRelocation,
+    ElfSection,
+    ElfSymbol,
+    write_elf_relocatable,
+)
+from maspsx.encoder import assemble_native
+
+MASPSX = Path(__file__).parent.parent / "maspsx.py"
+
+FUNCTIONS = (
+    ".set\tnoreorder\n"
+    ".text\n"
+    ".globl\tfoo\n"
+    ".ent\tfoo\n"
+    "foo:\n"
+    "lui\t$2,%hi(D_1+4)\n"
+    "lw\t$2,%lo(D_1+4)($2)\n"
+    "jr\t$31\n"
+    "nop\n"
+    ".end\tfoo\n"
+    ".globl\tbar\n"
+    ".ent\tbar\n"
+    "bar:\n"
+    "jal\tfoo\n"
+    "addiu\t$4,$4,1\n"
+    ".end\tbar\n"
+)
+
+
+def psyq_style_object(words, symbols, relocations):
+    """
+    Like psyq2elf output: no symbol sizes and no .text padding
+    """
+    text = b"".join(x.to_bytes(4, "little") for x in words)
+    return write_elf_relocatable(
+        [ElfSection(".text", SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, text)],
+        [
+            ElfSymbol(name, value=offset, bind=STB_GLOBAL, section=".text")
+            for name, offset in symbols
+        ]
+        + [ElfSymbol("D_1", bind=STB_GLOBAL)],
+        {".text": relocations},
+    )
+
+
+class TestElfReader(unittest.TestCase):
+    def test_reader(self):
+        reader = ElfReader(assemble_native(FUNCTIONS))
+        self.assertEqual(0x3C020000, reader.words()[0])
+        self.assertEqual(8, len(reader.words()))  # padded to 16 bytes
+
+        symbols = {x.name: (x.value, x.size) for x in reader.symbols if x.name}
+        self.assertEqual({"foo": (0, 16), "bar": (16, 8), "D_1": (0, 0)}, symbols)
+        self.assertEqual(
+            [(0, R_MIPS_HI16), (4, R_MIPS_LO16)],
+            [(offset, type) for offset, _, type in reader.relocations(".text")][:2],
+        )
+
+        with self.assertRaises(Exception):
+            reader.section_data(".rodata")
+
+    def test_function_ranges(self):
+        reader = ElfReader(assemble_native(FUNCTIONS))
+        self.assertEqual({"foo": (0, 4), "bar": (4, 6)}, function_ranges(reader))
+
+        reader = ElfReader(psyq_style_object([0] * 6, [("foo", 0), ("bar", 16)], []))
+        self.assertEqual({"foo": (0, 4), "bar": (4, 6)}, function_ranges(reader))
+
+    def test_open(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "out.o"
+            path.write_bytes(assemble_native(FUNCTIONS))
+            with ElfReader.open(path) as reader:
+                self.assertEqual(0x03E00008, reader.words()[2])
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.ours = ElfReader(assemble_native(FUNCTIONS))
+
+    def test_match(self):
+        # relocated against D_1 with no addend in place
+        target = psyq_style_object(
+            [0x3C020000, 0x8C420000, 0x03E00008, 0, 0x0C000000, 0x24840001],
+            [("foo", 0), ("bar", 16)],
+            [
+                ElfRelocation(0, "D_1", R_MIPS_HI16),
+                ElfRelocation(4, "D_1", R_MIPS_LO16),
+            ],
+        )
+        results = compare_objects(self.ours, ElfReader(target))
+        self.assertEqual(["MATCH: foo", "MATCH: bar"], [str(x) for x in results])
+
+    def test_mismatch(self):
+        target = psyq_style_object(
+            [0x3C020000, 0x8C420000, 0x03E00008, 0, 0x0C000000, 0x24840002, 0],
+            [("foo", 0), ("bar", 16), ("baz", 24)],
+            [
+                ElfRelocation(0, "D_1", R_MIPS_HI16),
+                ElfRelocation(4, "D_1", R_MIPS_LO16),
+            ],
+        )
+        results = compare_objects(self.ours, ElfReader(target))
+        self.assertTrue(results[0].matches)
+        self.assertEqual(Difference(4, 0x24840001, 0x24840002), results[1].difference)
+        self.assertEqual("baz: not in ours object", str(results[2]))
+
+    def test_unrelocated(self):
+        # a relocated word in ours must still match the target where it isn't
+        target = psyq_style_object(
+            [0x3C020001, 0x8C420004, 0x03E00008, 0, 0x0C000000, 0x24840001],
+            [("foo", 0), ("bar", 16)],
+            [],
+        )
+        (foo, _) = compare_objects(self.ours, ElfReader(target))
+        self.assertEqual(Difference(0, 0x3C020000, 0x3C020001), foo.difference)
+
+    def test_shorter(self):
+        target = psyq_style_object(
+            [0x3C020000, 0x8C420000, 0x03E00008, 0, 0x0C000000],
+            [("foo", 0), ("bar", 16)],
+            [],
+        )
+        (_, bar) = compare_objects(self.ours, ElfReader(target))
+        self.assertEqual(Difference(4, 0x24840001, None), bar.difference)
+
+
+class TestCompareTo(unittest.TestCase):
+    def test_compare_to(self):
+        source = (
+            "\t.text\n"
+            "\t.globl\tfoo\n"
+            "\t.ent\tfoo\n"
+            "foo:\n"
+            "\tlw\t$2,D_1\n"
+            "\tj\t$31\n"
+            "\t.end\tfoo\n"
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reference = Path(tmp_dir) / "reference.o"
+            reference.write_bytes(
+                psyq_style_object(
+                    [0x3C020000, 0x8C420000, 0x03E00008, 0],
+                    [("foo", 0)],
+                    [
+                        ElfRelocation(0, "D_1", R_MIPS_HI16),
+                        ElfRelocation(4, "D_1", R_MIPS_LO16),
+                    ],
+                )
+            )
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    str(MASPSX),
+                    "--run-assembler",
+                    "--native-assembler",
+                    "--gnu-as-path",
+                    sys.executable,  # never run
+                    f"--compare-to={reference}",
+                    "-o",
+                    str(Path(tmp_dir) / "out.o"),
+                ],
+                input=source,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual("MATCH: foo\n", result.stdout, result.stderr)
+            self.assertEqual(0, result.returncode)
+
+            self.assertEqual(
+                ["MATCH: foo"],
+                [str(x) for x in compare_files(Path(tmp_dir) / "out.o", reference)],
+            )
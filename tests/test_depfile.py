@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx.depfile import (
+    IncludeSink,
+    find_dependencies,
+    find_includes,
+    format_depfile,
+    include_dirs,
+)
+
+MASPSX = Path(__file__).parent.parent / "maspsx.py"
+
+
+class TestDepfile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        (self.path / "include").mkdir()
+        (self.path / "asm").mkdir()
+        (self.path / "include" / "macro.inc").write_text(".macro glabel label\n")
+        (self.path / "asm" / "func.s").write_text(
+            '.include "macro.inc"\n.incbin "func.bin"\n'
+        )
+        (self.path / "include" / "func.bin").write_bytes(b'.include "nope.s"\n')
+        self.cwd = os.getcwd()
+        os.chdir(self.path)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_find_includes(self):
+        sink = IncludeSink()
+        sink.extend(
+            [
+                '.include "macro.inc"',
+                "nop",
+                '.include "asm/func.s" # maspsx-keep',
+                '# .include "asm/skipped.s" # DEBUG: skipped due to include asm hack',
+                '\t.incbin "data.bin"',
+            ]
+        )
+        self.assertEqual(
+            [
+                ("include", "macro.inc"),
+                ("include", "asm/func.s"),
+                ("incbin", "data.bin"),
+            ],
+            sink.includes,
+        )
+
+    def test_include_dirs(self):
+        self.assertEqual(
+            [Path("include"), Path("build/include")],
+            include_dirs(["-march=r3000", "-Iinclude", "-I", "build/include", "-G0"]),
+        )
+
+    def test_find_dependencies(self):
+        dependencies = find_dependencies(
+            [("include", "asm/func.s"), ("include", "missing.s")], [Path("include")]
+        )
+        # nested includes are found, but .incbin files aren't read
+        self.assertEqual(
+            [
+                Path("asm/func.s"),
+                Path("include/macro.inc"),
+                Path("include/func.bin"),
+            ],
+            dependencies,
+        )
+
+    def test_format(self):
+        self.assertEqual(
+            "build/a\\ b.o: \\\n  asm/$$x.s \\\n  include/macro.inc\n",
+            format_depfile(
+                "build/a b.o", [Path("asm/$x.s"), Path("include/macro.inc")]
+            ),
+        )
+        self.assertEqual("a.o:\n", format_depfile("a.o", []))
+
+    def test_maspsx(self):
+        text = (
+            "\t.text\n"
+            "\t.ent\t__maspsx_include_asm_hack_func\n"
+            "__maspsx_include_asm_hack_func:\n"
+            '\t.include "asm/func.s" # maspsx-keep\n'
+            "\t.end\t__maspsx_include_asm_hack_func\n"
+        )
+        subprocess.run(
+            [
+                sys.executable,
+                str(MASPSX),
+                "--macro-inc",
+                "-MD",
+                "-Iinclude",
+                "-o",
+                "build/func.o",
+            ],
+            input=text,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(
+            "build/func.o: \\\n"
+            "  include/macro.inc \\\n"
+            "  asm/func.s \\\n"
+            "  include/func.bin\n",
+            (self.path / "build" / "func.d").read_text(),
+        )
@@ -0,0 +1,118 @@
+import struct
+import unittest
+import zlib
+
+from maspsx.detect import Difference, detect_version, find_first_difference
+from maspsx.elf import read_elf_section
+from maspsx.encoder import assemble_native
+from maspsx.sweep import process_versions
+from maspsx.versions import ASPSX_VERSIONS
+
+from tests.test_compare import FUNCTIONS
+
+
+def fake_assemble(text: str) -> bytes:
+    # one word per instruction, enough to tell variants apart
+    res = b""
+    for line in text.splitlines():
+        line = line.split("#")[0].strip()
+        if line and not line.startswith("."):
+            res += struct.pack("<I", zlib.crc32(line.encode("utf")))
+    return res
+
+
+def make_elf(text: bytes) -> bytes:
+    shstrtab = b"\0.text\0.shstrtab\0"
+    text_offset = 52
+    shstrtab_offset = text_offset + len(text)
+    shoff = shstrtab_offset + len(shstrtab)
+    header = struct.pack(
+        "<16sHHIIIIIHHHHHH",
+        b"\x7fELF\x01\x01\x01" + bytes(9),
+        1,  # ET_REL
+        8,  # EM_MIPS
+        1,
+        0,
+        0,
+        shoff,
+        0,
+        52,
+        0,
+        0,
+        40,
+        3,
+        2,
+    )
+    section_headers = (
+        bytes(40)
+        + struct.pack("<IIIIIIIIII", 1, 1, 6, 0, text_offset, len(text), 0, 0, 4, 0)
+        + struct.pack(
+            "<IIIIIIIIII", 7, 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0
+        )
+    )
+    return header + text + shstrtab + section_headers
+
+
+LINES = [
+    "	li	$2,1",
+    "	sltu	$3,$2,-1",
+]
+
+
+class TestDetect(unittest.TestCase):
+    def test_detect_version(self):
+        (target_variant,) = [
+            x
+            for x in process_versions(LINES, ASPSX_VERSIONS)
+            if x.versions[0] == "2.56"
+        ]
+        target_text = fake_assemble(target_variant.text)
+
+        assembled = []
+
+        def assemble(text):
+            assembled.append(text)
+            return fake_assemble(text)
+
+        results = detect_version(LINES, target_text, ASPSX_VERSIONS, assemble, jobs=2)
+
+        # identical variants are only assembled once
+        self.assertEqual(len(set(assembled)), len(assembled))
+        self.assertEqual(len(results), len(assembled))
+
+        self.assertEqual([["2.56"]], [x.versions for x in results if x.matches])
+        self.assertEqual(
+            [
+                (["1.05", "1.07", "2.05", "2.08", "2.21", "2.30", "2.34"], 0),
+                (["2.67", "2.77", "2.79", "2.81", "2.86"], 4),
+            ],
+            [(x.versions, x.difference.offset) for x in results if not x.matches],
+        )
+
+    def test_find_first_difference(self):
+        self.assertIsNone(find_first_difference(b"\1\0\0\0", b"\1\0\0\0"))
+        self.assertEqual(
+            Difference(4, 2, 3),
+            find_first_difference(b"\1\0\0\0\2\0\0\0", b"\1\0\0\0\3\0\0\0"),
+        )
+        self.assertEqual(
+            Difference(4, None, 3),
+            find_first_difference(b"\1\0\0\0", b"\1\0\0\0\3\0\0\0"),
+        )
+
+    def test_find_first_difference_linked(self):
+        # GNU as pads .text to 16 bytes, a linked binary has no padding, and
+        # has its %hi/%lo and jal targets filled in
+        ours = assemble_native(FUNCTIONS)
+        linked = [0x3C028001, 0x8C421234, 0x03E00008, 0, 0x0C020010, 0x24840001]
+        self.assertIsNone(find_first_difference(ours, struct.pack("<6I", *linked)))
+
+        linked[5] = 0x24840002
+        self.assertEqual(
+            Difference(20, 0x24840001, 0x24840002),
+            find_first_difference(ours, struct.pack("<6I", *linked)),
+        )
+
+    def test_read_elf_section(self):
+        text = bytes.fromhex("0000000008e00003")
+        self.assertEqual(text, read_elf_section(make_elf(text), ".text"))
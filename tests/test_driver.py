@@ -0,0 +1,133 @@
+import io
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx.driver import compile_source, parse_invocation, read_lines
+
+# copies stdin (or the file argument) to stdout, logging args to stderr
+FAKE_TOOL = """#!{python}
+import sys
+args = [x for x in sys.argv[1:] if not x.startswith("-")]
+data = open(args[0], "rb").read() if args else sys.stdin.buffer.read()
+sys.stdout.buffer.write(data)
+sys.exit({returncode})
+"""
+
+# writes its args and input to the object file
+FAKE_AS = """#!{python}
+import sys
+args = sys.argv[1:]
+with open(args[args.index("-o") + 1], "wb") as f:
+    f.write(" ".join(args).encode() + b"\\n" + sys.stdin.buffer.read())
+"""
+
+SOURCE = (
+    "\t.text\n"
+    "\t.globl\tfoo\n"
+    "\t.ent\tfoo\n"
+    "foo:\n"
+    "\tlw\t$2,D_1\n"
+    "\tj\t$31\n"
+    "\t.end\tfoo\n"
+    '\t.ascii\t"\x82\xa0\\000"\n'
+)
+
+
+class ChunkedStream(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read1(self, size=-1):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+class TestParseInvocation(unittest.TestCase):
+    def test_split(self):
+        invocation = parse_invocation(
+            [
+                "--aspsx-version=2.77",
+                "-Iinclude",
+                "-D",
+                "VERSION=1",
+                "-O2",
+                "-G8",
+                "-mcpu=3000",
+                "-gcoff",
+                "-fno-builtin",
+                "-Wa,-EL,-no-pad-sections",
+                "-c",
+                "src/main.c",
+                "-o",
+                "build/main.o",
+            ]
+        )
+        self.assertEqual("src/main.c", invocation.source)
+        self.assertEqual(["-Iinclude", "-D", "VERSION=1"], invocation.cpp_args)
+        self.assertEqual(
+            ["-O2", "-G8", "-mcpu=3000", "-gcoff", "-fno-builtin", "-quiet"],
+            invocation.cc1_args,
+        )
+        self.assertEqual(
+            ["-O2", "-G8", "-mtune=3000", "-g", "-EL", "-no-pad-sections", "-G0"],
+            invocation.as_args,
+        )
+        self.assertEqual(8, invocation.options.sdata_limit)
+        self.assertEqual("2.77", invocation.options.aspsx_version)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            parse_invocation(["-c", "a.c", "b.c", "-o", "a.o"])
+        with self.assertRaises(ValueError):
+            parse_invocation(["-c", "a.c"])
+
+
+class TestReadLines(unittest.TestCase):
+    def test_chunks(self):
+        stream = ChunkedStream([b"\tnop\n\tj", b'\t$31\n.ascii\t"\x82', b'\xa0"'])
+        self.assertEqual(["nop", "j\t$31", '.ascii\t"\x82\xa0"'], read_lines(stream))
+
+
+class TestCompile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        (self.path / "main.c").write_bytes(SOURCE.encode("latin-1"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def tool(self, name, template, returncode=0):
+        path = self.path / name
+        path.write_text(template.format(python=sys.executable, returncode=returncode))
+        path.chmod(0o755)
+        return str(path)
+
+    def invocation(self, cc1_returncode=0):
+        return parse_invocation(
+            [
+                f"--cpp-path={self.tool('cpp', FAKE_TOOL)}",
+                f"--cc1-path={self.tool('cc1', FAKE_TOOL, cc1_returncode)}",
+                f"--gnu-as-path={self.tool('as', FAKE_AS)}",
+                "-G8",
+                "-c",
+                str(self.path / "main.c"),
+                "-o",
+                str(self.path / "main.o"),
+            ]
+        )
+
+    def test_compile(self):
+        self.assertEqual(0, compile_source(self.invocation()))
+        args, *lines = (self.path / "main.o").read_bytes().split(b"\n")
+        self.assertEqual(f"-G8 -G0 -o {self.path / 'main.o'} -", args.decode("utf"))
+        # processed, with the string literal bytes untouched
+        self.assertIn(b"nop  # DEBUG: branch/jump", lines)
+        self.assertIn(b'.ascii\t"\x82\xa0\\000"', lines)
+
+    def test_failure(self):
+        (self.path / "main.o").write_bytes(b"stale")
+        self.assertEqual(1, compile_source(self.invocation(cc1_returncode=1)))
+        self.assertFalse((self.path / "main.o").exists())
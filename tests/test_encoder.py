@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from unittest import mock
+
+from maspsx import MaspsxProcessor
+from maspsx.elf import read_elf_sections
+from maspsx.encoder import (
+    NativeAssemblerSink,
+    UnsupportedAssembly,
+    assemble_native,
+    parse_expression,
+)
+
+GNU_AS = "mipsel-linux-gnu-as"
+AS_ARGS = ["-march=r3000", "-mtune=r3000", "-G0"]
+
+R_MIPS_32 = 2
+R_MIPS_26 = 4
+R_MIPS_HI16 = 5
+R_MIPS_LO16 = 6
+
+# writes its args and input to the object file
+FAKE_AS = """#!{python}
+import sys
+args = sys.argv[1:]
+with open(args[args.index("-o") + 1], "w") as f:
+    f.write(" ".join(args) + "\\n" + sys.stdin.read())
+"""
+
+# tests whose maspsx output is compared against GNU as
+CORPUS_MODULES = [
+    "tests.test_at",
+    "tests.test_break",
+    "tests.test_directives",
+    "tests.test_div",
+    "tests.test_float",
+    "tests.test_functions",
+    "tests.test_gp_rel",
+    "tests.test_include_asm_hack",
+    "tests.test_li",
+    "tests.test_mflo",
+    "tests.test_move",
+    "tests.test_mtlo",
+    "tests.test_nop",
+    "tests.test_sltu",
+]
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "gnu_as"
+
+SECTIONS = (".text", ".data", ".rodata", ".sdata", ".sbss", ".bss")
+
+
+def text_words(text):
+    sections = read_elf_sections(
+        assemble_native(".set\tnoreorder\n" + text, ["-no-pad-sections"])
+    )
+    data = sections[".text"]
+    return [x for (x,) in struct.iter_unpack("<I", data)]
+
+
+def relocations(sections, name=".rel.text"):
+    return [
+        (offset, info & 0xFF)
+        for offset, info in struct.iter_unpack("<II", sections[name])
+    ]
+
+
+def record_corpus():
+    """
+    Returns every MaspsxProcessor output produced while running CORPUS_MODULES
+    """
+    outputs = []
+    process_lines_into = MaspsxProcessor.process_lines_into
+
+    def record(self, sink):
+        lines = []
+        process_lines_into(self, lines)
+        outputs.append(lines)
+        sink.extend(lines)
+
+    suite = unittest.defaultTestLoader.loadTestsFromNames(CORPUS_MODULES)
+    with mock.patch.object(MaspsxProcessor, "process_lines_into", record):
+        unittest.TextTestRunner(stream=open(os.devnull, "w")).run(suite)
+    return outputs
+
+
+class TestEncoder(unittest.TestCase):
+    def test_expressions(self):
+        self.assertEqual(0x10004, parse_expression("0x10000+(1<<2)").addend)
+        self.assertEqual(-8, parse_expression("-(4*2)").addend)
+
+        value = parse_expression("%hi(D_1+0x10)")
+        self.assertEqual(
+            ("D_1", 0x10, "hi"), (value.symbol, value.addend, value.operator)
+        )
+
+        value = parse_expression("$LC0-4")
+        self.assertEqual(
+            ("$LC0", -4, None), (value.symbol, value.addend, value.operator)
+        )
+
+    def test_encodings(self):
+        self.assertEqual([0x3C020001, 0x34422345], text_words("li\t$2,0x12345\n"))
+        self.assertEqual([0x2402FFFF], text_words("li\t$2,0xFFFFFFFF\n"))
+        self.assertEqual([0x34028000], text_words("li\t$2,0x8000\n"))
+        self.assertEqual([0x000001CD], text_words("break\t0x0,0x7\n"))
+        self.assertEqual([0x00001770], text_words("tge\t$zero,$zero,93\n"))
+        self.assertEqual([0x00431021], text_words("addu\t$2,$2,$3\n"))
+        self.assertEqual([0x00801021], text_words("move\t$2,$4\n"))
+        self.assertEqual([0x0082001A], text_words("div\t$zero,$4,$2\n"))
+        self.assertEqual([0x03E00008], text_words("j\t$31\n"))
+        self.assertEqual([0x8C830028], text_words("lw\t$3,40($4)\n"))
+        self.assertEqual([0x34421234], text_words("ori\t$2,0x1234\n"))
+
+    def test_branches(self):
+        words = text_words("$L2:\n\tnop\n\tbne\t$2,$0,$L2\n\tnop\n\tb\t$L3\n$L3:\n")
+        self.assertEqual([0, 0x1440FFFE, 0, 0x10000000], words[:4])
+
+    def test_relocations(self):
+        text = (
+            ".set\tnoreorder\n"
+            "lui\t$2,%hi(D_1)\n"
+            "lw\t$2,%lo(D_1)($2)\n"
+            "lui\t$3,%hi($LC0+4)\n"
+            "addiu\t$3,$3,%lo($LC0+4)\n"
+            "jal\tbar\n"
+            "nop\n"
+            ".rdata\n"
+            "$LC0:\n"
+            ".word\t1,2,3\n"
+            ".data\n"
+            ".word\t$LC0\n"
+        )
+        sections = read_elf_sections(assemble_native(text))
+        self.assertEqual(
+            [
+                (0, R_MIPS_HI16),
+                (4, R_MIPS_LO16),
+                (8, R_MIPS_HI16),
+                (12, R_MIPS_LO16),
+                (16, R_MIPS_26),
+            ],
+            relocations(sections),
+        )
+        # local symbols are relocated against their section, with the addend in place
+        words = [x for (x,) in struct.iter_unpack("<I", sections[".text"])]
+        self.assertEqual(0x24630004, words[3])
+        self.assertEqual([(0, R_MIPS_32)], relocations(sections, ".rel.data"))
+
+    def test_padding(self):
+        sections = read_elf_sections(assemble_native(".set\tnoreorder\nnop\n"))
+        self.assertEqual(16, len(sections[".text"]))
+
+        sections = read_elf_sections(
+            assemble_native(".set\tnoreorder\nnop\n", ["-no-pad-sections"])
+        )
+        self.assertEqual(4, len(sections[".text"]))
+
+    def test_data(self):
+        text = '.data\nD_1:\t.byte\t1\nD_2:\t.word\t2\n.ascii\t"ab\\000"\n.space\t3\n'
+        sections = read_elf_sections(assemble_native(text, ["-no-pad-sections"]))
+        self.assertEqual(b"\x01\0\0\0\x02\0\0\0ab\0\0\0\0", sections[".data"])
+
+    def test_unsupported(self):
+        for text in [
+            '.include "macro.inc"\n',
+            ".set\tnoreorder\n.loc\t1 2\n",
+            "addu\t$2,$2,$3\n",  # reorder mode
+            ".set\tnoreorder\ndiv\t$4,$2\n",
+            ".set\tnoreorder\nbeq\t$2,$0,func\n",
+            ".comm\tD_1,4\n",
+        ]:
+            with self.subTest(text=text):
+                with self.assertRaises(UnsupportedAssembly):
+                    assemble_native(text)
+
+        with self.assertRaises(UnsupportedAssembly):
+            assemble_native("nop\n", ["-KPIC"])
+
+    def test_gp_size(self):
+        text = ".set\tnoreorder\nnop\n"
+        # maspsx.py appends -G0 to the project's -G, and the last -G wins
+        for as_args in (["-G0"], ["-G8", "-G0"], ["-G", "8", "-G0"], []):
+            with self.subTest(as_args=as_args):
+                assemble_native(text, as_args)
+        for as_args in (["-G8"], ["-G0", "-G8"], ["-G", "8"]):
+            with self.subTest(as_args=as_args):
+                with self.assertRaises(UnsupportedAssembly):
+                    assemble_native(text, as_args)
+
+
+class TestNativeAssemblerSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fake_as = Path(self.tmp_dir.name) / "fake-as"
+        self.fake_as.write_text(FAKE_AS.format(python=sys.executable))
+        self.fake_as.chmod(0o755)
+        self.object_path = Path(self.tmp_dir.name) / "out.o"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assemble(self, lines):
+        sink = NativeAssemblerSink(
+            [str(self.fake_as), *AS_ARGS, "-o", str(self.object_path), "-"]
+        )
+        sink.extend(lines)
+        sink.close()
+        return sink
+
+    def test_native(self):
+        sink = self.assemble([".set\tnoreorder\n", "nop\n"])
+        self.assertFalse(sink.used_fallback)
+        self.assertEqual(0, sink.returncode)
+        sections = read_elf_sections(self.object_path.read_bytes())
+        self.assertEqual(bytes(16), sections[".text"])
+
+    def test_fallback(self):
+        sink = self.assemble(['.include "macro.inc"\n'])
+        self.assertTrue(sink.used_fallback)
+        self.assertEqual(0, sink.returncode)
+        self.assertIn('.include "macro.inc"', self.object_path.read_text())
+
+
+def reference_key(text: str) -> str:
+    key = json.dumps([text, AS_ARGS])
+    return hashlib.sha256(key.encode("utf")).hexdigest()
+
+
+class ReferenceStore:
+    """
+    Recorded GNU as section contents (or None if it rejected the input), one
+    JSON file per reference_key, so that the corpus is checked without GNU as
+    """
+
+    def __init__(self, path: Path = FIXTURES_DIR):
+        self.path = path
+
+    def _fixture_path(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def get(self, key: str) -> Tuple[bool, Optional[Dict[str, bytes]]]:
+        fixture_path = self._fixture_path(key)
+        if not fixture_path.exists():
+            return (False, None)
+        sections = json.loads(fixture_path.read_text())["sections"]
+        if sections is None:
+            return (True, None)
+        return (True, {k: bytes.fromhex(v) for k, v in sections.items()})
+
+    def put(self, key: str, sections: Optional[Dict[str, bytes]]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        fixture_path = self._fixture_path(key)
+        tmp_path = fixture_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "as_args": AS_ARGS,
+                    "sections": (
+                        None
+                        if sections is None
+                        else {k: v.hex() for k, v in sections.items()}
+                    ),
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        tmp_path.replace(fixture_path)
+
+
+def gnu_as_sections(
+    text: str, store: ReferenceStore
+) -> Tuple[bool, Optional[Dict[str, bytes]]]:
+    """
+    Replays the recorded GNU as result for the text if there is one, otherwise
+    runs GNU as (when it's available) and records the result. Set
+    GNU_AS_RERECORD=1 to re-run GNU as even if a result was recorded.
+    Returns whether there is a result, and the sections (None on failure).
+    """
+    key = reference_key(text)
+    available = shutil.which(GNU_AS) is not None
+    recorded, sections = store.get(key)
+    if recorded and not (available and os.environ.get("GNU_AS_RERECORD") == "1"):
+        return (recorded, sections)
+    if not available:
+        return (False, None)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        object_path = Path(tmp_dir) / "out.o"
+        result = subprocess.run(
+            [GNU_AS, *AS_ARGS, "-o", str(object_path), "-"],
+            input=text.encode("utf"),
+            capture_output=True,
+        )
+        sections = None
+        if result.returncode == 0:
+            # e.g. fragments that branch to labels they don't define fail
+            all_sections = read_elf_sections(object_path.read_bytes())
+            sections = {x: all_sections[x] for x in SECTIONS if x in all_sections}
+    store.put(key, sections)
+    return (True, sections)
+
+
+class TestEncoderCorpus(unittest.TestCase):
+    def test_corpus(self):
+        """
+        Everything maspsx outputs in the other tests should assemble to the same
+        section contents as GNU as, or be rejected as unsupported
+        """
+        store = ReferenceStore()
+        compared = 0
+        for lines in record_corpus():
+            # the fragments aren't within a .ent, which is where maspsx would
+            # write the .set noreorder
+            text = "".join(f"{x}\n" for x in [".set\tnoreorder", *lines])
+            try:
+                native = read_elf_sections(assemble_native(text, AS_ARGS))
+            except UnsupportedAssembly:
+                continue
+
+            recorded, expected = gnu_as_sections(text, store)
+            if not recorded or expected is None:
+                continue
+
+            for name in SECTIONS:
+                with self.subTest(text=text, section=name):
+                    self.assertEqual(expected.get(name), native.get(name))
+            compared += 1
+
+        if compared == 0:
+            # with GNU as available every fragment is recorded, so comparing
+            # nothing means something is broken rather than missing
+            self.assertIsNone(
+                shutil.which(GNU_AS), f"Nothing was compared against {GNU_AS}"
+            )
+            self.skipTest(f"No recorded {GNU_AS} output, and it can't be run here")
@@ -203,3 +203,48 @@ class TestGpRel(unittest.TestCase):
 
         clean_lines = strip_comments(res)
         self.assertEqual(expected_lines, clean_lines[:1])
+
+    def test_symbol_table(self):
+        lines = [
+            "	.comm	smallCommon,4",
+            "	.lcomm	smallLocal,8",
+            "	.comm	bigCommon,32",
+            "	.sdata",
+            "smallData:",
+            "	.half	1",
+            "	.text",
+        ]
+
+        mp = MaspsxProcessor(
+            lines,
+            sdata_limit=8,
+            gp_allow_offset=False,
+            gp_allow_la=True,
+        )
+        mp.process_lines()
+
+        small_common = mp.get_symbol("smallCommon")
+        self.assertEqual("sbss", small_common.section)
+        self.assertEqual(4, small_common.size)
+        self.assertTrue(small_common.is_common)
+        self.assertTrue(small_common.gp_rel)
+        self.assertFalse(small_common.gp_rel_offset)
+        self.assertTrue(small_common.gp_rel_la)
+
+        small_local = mp.get_symbol("smallLocal")
+        self.assertFalse(small_local.is_common)
+        self.assertTrue(small_local.gp_rel_offset)
+
+        big_common = mp.get_symbol("bigCommon")
+        self.assertEqual("bss", big_common.section)
+        self.assertFalse(big_common.gp_rel)
+
+        small_data = mp.get_symbol("smallData")
+        self.assertEqual("sdata", small_data.section)
+        self.assertEqual(2, small_data.size)
+
+        self.assertIsNone(mp.get_symbol("externSymbol"))
+        self.assertEqual(
+            ["smallCommon", "smallLocal", "smallData"],
+            [x.name for x in mp.gp_rel_symbols()],
+        )
@@ -0,0 +1,108 @@
+import io
+import unittest
+
+from maspsx import MaspsxProcessor
+from maspsx.ir import (
+    IrRecord,
+    deserialize_records,
+    read_jsonl,
+    serialize_records,
+    split_comment,
+    write_jsonl,
+)
+
+LINES = [
+    ".data",
+    ".ent\tfunc",
+    "func:",
+    "li\t$2,0x12345",
+    "lw\t$3,40000($4)",
+    "addu\t$2,$2,$3",
+    "$L2:",
+    "beq\t$2,$0,$L2",
+    '.ascii\t"a,#b\\000"',
+    ".end\tfunc",
+    ".comm\tD_1,4",
+]
+
+
+class TestIr(unittest.TestCase):
+    def setUp(self):
+        mp = MaspsxProcessor(LINES, expand_li=True, sdata_limit=8)
+        self.records = mp.process_records()
+
+    def test_records(self):
+        by_line = {}
+        for record in self.records:
+            by_line.setdefault(record.line_index, []).append(record)
+
+        (data,) = by_line[0]
+        self.assertEqual((".section", [".data"]), (data.op, data.operands))
+        self.assertTrue(data.rewritten)
+
+        ent, set_noreorder = by_line[1]
+        self.assertEqual("func", ent.function)
+        self.assertFalse(ent.inserted or ent.rewritten)
+        self.assertTrue(set_noreorder.inserted)
+
+        self.assertEqual(["lui", "ori"], [x.op for x in by_line[3]])
+        self.assertTrue(all(x.rewritten for x in by_line[3]))
+
+        self.assertEqual(
+            [".set", "lui", "addu", "lw", ".set", "nop"], [x.op for x in by_line[4]]
+        )
+        self.assertEqual(["$3", "%lo(40000)($at)"], by_line[4][3].operands)
+        self.assertTrue(by_line[4][-1].inserted)
+
+        (label,) = by_line[6]
+        self.assertEqual(("label", "$L2"), (label.kind, label.op))
+
+        beq, nop = by_line[7]
+        self.assertEqual(["$2", "$0", "$L2"], beq.operands)
+        self.assertTrue(nop.inserted)
+
+        (ascii_,) = by_line[8]
+        self.assertEqual(['"a,#b\\000"'], ascii_.operands)
+
+        # .comm symbols are emitted after everything else
+        footer = by_line[None]
+        self.assertEqual(
+            [".section", ".align", "D_1", ".space"], [x.op for x in footer]
+        )
+        self.assertTrue(all(x.function is None and x.inserted for x in footer))
+
+    def test_lookahead(self):
+        # addu and mult are written early, while processing the mflo
+        mp = MaspsxProcessor(["mflo\t$2", "addu\t$3,$3,$4", "mult\t$2,$5", "mflo\t$6"])
+        self.assertEqual(
+            [
+                ("mflo", 0, False, False),
+                ("addu", 1, False, False),
+                ("nop", 0, True, False),
+                ("mult", 2, False, False),
+                ("mflo", 3, False, False),
+            ],
+            [
+                (x.op, x.line_index, x.inserted, x.rewritten)
+                for x in mp.process_records()
+            ],
+        )
+
+    def test_serialize(self):
+        self.assertEqual(
+            self.records, deserialize_records(serialize_records(self.records))
+        )
+
+        stream = io.StringIO()
+        write_jsonl(self.records, stream)
+        stream.seek(0)
+        self.assertEqual(self.records, read_jsonl(stream))
+
+    def test_text(self):
+        self.assertEqual(
+            "lw\t$3,%lo(40000)($at)",
+            IrRecord("instruction", "lw", ["$3", "%lo(40000)($at)"]).text,
+        )
+        self.assertEqual("$L2:", IrRecord("label", "$L2").text)
+        self.assertEqual("nop", split_comment("nop  # DEBUG: branch/jump"))
+        self.assertEqual('.ascii\t"#"', split_comment('.ascii\t"#"  # comment'))
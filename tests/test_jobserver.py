@@ -0,0 +1,131 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from maspsx.aio import AsyncMaspsx
+from maspsx.jobserver import JobServer, job_slots, parse_makeflags
+
+
+class TestParseMakeflags(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            ("fds", "3", "4"), parse_makeflags(" -j4 --jobserver-auth=3,4")
+        )
+        self.assertEqual(
+            ("fifo", "/tmp/GMfifo1"),
+            parse_makeflags("-j8 --jobserver-auth=fifo:/tmp/GMfifo1"),
+        )
+        self.assertEqual(("fds", "5", "6"), parse_makeflags("--jobserver-fds=5,6 -j"))
+        # the last one wins
+        self.assertEqual(
+            ("fds", "7", "8"),
+            parse_makeflags("--jobserver-auth=3,4 --jobserver-auth=7,8"),
+        )
+
+    def test_no_jobserver(self):
+        self.assertIsNone(parse_makeflags(""))
+        self.assertIsNone(parse_makeflags("s -- VERBOSE=1"))
+        self.assertIsNone(parse_makeflags("--jobserver-auth=-2,-2"))
+        # dry run
+        self.assertIsNone(parse_makeflags("n --jobserver-auth=3,4"))
+
+
+class TestJobServer(unittest.TestCase):
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.environ = {
+            "MAKEFLAGS": f"-j --jobserver-auth={self.read_fd},{self.write_fd}"
+        }
+
+    def tearDown(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def available(self):
+        os.set_blocking(self.read_fd, False)
+        try:
+            tokens = os.read(self.read_fd, 64)
+        except BlockingIOError:
+            tokens = b""
+        os.set_blocking(self.read_fd, True)
+        os.write(self.write_fd, tokens)
+        return tokens
+
+    def test_acquire(self):
+        os.write(self.write_fd, b"++")
+        with job_slots(8, self.environ) as jobs:
+            self.assertEqual(3, jobs)
+            self.assertEqual(b"", self.available())
+        self.assertEqual(b"++", self.available())
+
+    def test_limit(self):
+        os.write(self.write_fd, b"+++")
+        with job_slots(2, self.environ) as jobs:
+            self.assertEqual(2, jobs)
+            self.assertEqual(b"++", self.available())
+        self.assertEqual(b"+++", self.available())
+
+    def test_no_tokens(self):
+        with job_slots(8, self.environ) as jobs:
+            self.assertEqual(1, jobs)
+
+    def test_exception(self):
+        os.write(self.write_fd, b"ab")
+        with self.assertRaises(ValueError):
+            with job_slots(8, self.environ):
+                raise ValueError("worker crashed")
+        self.assertEqual(b"ab", bytes(sorted(self.available())))
+
+    def test_async_maspsx(self):
+        os.write(self.write_fd, b"+")
+
+        async def run():
+            maspsx = AsyncMaspsx(8)
+            self.assertEqual(2, maspsx.max_concurrency)
+            self.assertEqual(b"", self.available())
+            await maspsx.close()
+
+        with mock.patch.dict(os.environ, self.environ):
+            asyncio.run(run())
+        self.assertEqual(b"+", self.available())
+
+    def test_shared_pipe_stays_blocking(self):
+        os.write(self.write_fd, b"+")
+        with job_slots(8, self.environ):
+            self.assertTrue(os.get_blocking(self.read_fd))
+
+    def test_closed_fds(self):
+        environ = {"MAKEFLAGS": "-j --jobserver-auth=1000,1001"}
+        self.assertIsNone(JobServer.from_environ(environ))
+        with job_slots(3, environ) as jobs:
+            self.assertEqual(3, jobs)
+
+    def test_fifo(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "fifo"
+            os.mkfifo(path)
+            environ = {"MAKEFLAGS": f"-j4 --jobserver-auth=fifo:{path}"}
+            # keep the fifo open, as make does
+            fd = os.open(path, os.O_RDWR)
+            try:
+                os.write(fd, b"+++")
+                with job_slots(8, environ) as jobs:
+                    self.assertEqual(4, jobs)
+                with job_slots(2, environ) as jobs:
+                    self.assertEqual(2, jobs)
+                os.set_blocking(fd, False)
+                self.assertEqual(b"+++", os.read(fd, 64))
+            finally:
+                os.close(fd)
+
+
+class TestNoJobServer(unittest.TestCase):
+    def test_fallback(self):
+        with job_slots(5, {}) as jobs:
+            self.assertEqual(5, jobs)
+        with job_slots(None, {}) as jobs:
+            self.assertEqual(os.cpu_count() or 1, jobs)
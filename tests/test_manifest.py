@@ -0,0 +1,196 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx import MaspsxProcessor
+from maspsx.manifest import ManifestEntry, SymbolManifest, update_manifest
+
+from .util import strip_comments
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manifest_path = Path(self.tmp_dir.name) / "symbols.bin"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_manifest_roundtrip(self):
+        update_manifest(
+            self.manifest_path,
+            {
+                "zeta": ManifestEntry("zeta", "bss", 256, False),
+                "alpha": ManifestEntry("alpha", "sbss", 4, True),
+            },
+        )
+        update_manifest(
+            self.manifest_path,
+            {
+                "middle": ManifestEntry("middle", "sdata", 2, False),
+            },
+        )
+
+        manifest = SymbolManifest.open(self.manifest_path)
+        self.assertEqual(3, len(manifest))
+        self.assertEqual(
+            ManifestEntry("alpha", "sbss", 4, True), manifest.lookup("alpha")
+        )
+        self.assertEqual(
+            ManifestEntry("middle", "sdata", 2, False), manifest.lookup("middle")
+        )
+        self.assertEqual(
+            ManifestEntry("zeta", "bss", 256, False), manifest.lookup("zeta")
+        )
+        self.assertIsNone(manifest.lookup("missing"))
+        self.assertEqual(
+            ["alpha", "middle", "zeta"], [x.name for x in manifest.entries()]
+        )
+        manifest.close()
+
+    def test_update_replaces_owner_entries(self):
+        update_manifest(
+            self.manifest_path,
+            {
+                "renamed": ManifestEntry("renamed", "sbss", 4, True),
+                "resized": ManifestEntry("resized", "sbss", 4, True),
+                "shared": ManifestEntry("shared", "sbss", 4, True),
+            },
+            "a.o",
+        )
+        update_manifest(
+            self.manifest_path,
+            {"shared": ManifestEntry("shared", "sbss", 4, True)},
+            "b.o",
+        )
+        update_manifest(
+            self.manifest_path,
+            {
+                "newName": ManifestEntry("newName", "sbss", 4, True),
+                "resized": ManifestEntry("resized", "bss", 40, True),
+            },
+            "a.o",
+        )
+
+        manifest = SymbolManifest.open(self.manifest_path)
+        self.assertIsNone(manifest.lookup("renamed"))
+        self.assertEqual(
+            ManifestEntry("resized", "bss", 40, True, "a.o"), manifest.lookup("resized")
+        )
+        # still declared by b.o
+        self.assertEqual(
+            ManifestEntry("shared", "sbss", 4, True, "b.o"), manifest.lookup("shared")
+        )
+        self.assertEqual(
+            ["newName", "resized", "shared"], [x.name for x in manifest.entries()]
+        )
+        manifest.close()
+
+    def test_missing_manifest_is_empty(self):
+        manifest = SymbolManifest.open(self.manifest_path)
+        self.assertEqual(0, len(manifest))
+        self.assertIsNone(manifest.lookup("anything"))
+
+    def test_extern_uses_gp_from_manifest(self):
+        mp = MaspsxProcessor(
+            [
+                "	.comm	localVar,4",
+                "	.lcomm	localStatic,8",
+            ],
+            sdata_limit=8,
+        )
+        mp.process_lines()
+        update_manifest(self.manifest_path, mp.manifest_entries())
+
+        lines = [
+            "	lw	$2,localVar",
+            "	sw	$2,localStatic+4",
+            "	lw	$3,localVar+4",
+            "	lw	$4,unknownVar",
+        ]
+        expected_lines = [
+            "lw\t$2,%gp_rel(localVar)($gp)",
+            # static, so not in the manifest
+            "sw\t$2,localStatic+4",
+            "lw\t$3,localVar+4",
+            "lw\t$4,unknownVar",
+        ]
+
+        mp = MaspsxProcessor(
+            lines,
+            sdata_limit=8,
+            symbol_manifest=SymbolManifest.open(self.manifest_path),
+        )
+        res = mp.process_lines()
+
+        clean_lines = strip_comments(res)
+        self.assertEqual(expected_lines, [x for x in clean_lines if x != "nop"])
+
+    def test_manifest_entries(self):
+        mp = MaspsxProcessor(
+            [
+                "	.comm	globalVar,4",
+                "	.lcomm	staticVar,4",
+                "	.globl	globalData",
+                "	.sdata",
+                "globalData:",
+                "	.word	1",
+                "staticData:",
+                "	.word	2",
+            ],
+            sdata_limit=8,
+        )
+        mp.process_lines()
+        self.assertEqual(
+            {
+                "globalVar": ManifestEntry("globalVar", "sbss", 4, True),
+                "globalData": ManifestEntry("globalData", "sdata", 4, False),
+            },
+            mp.manifest_entries(),
+        )
+
+    def test_extern_section_uses_our_gp_size(self):
+        update_manifest(
+            self.manifest_path,
+            {
+                # written by TUs built with -G8 and -G0 respectively
+                "smallVar": ManifestEntry("smallVar", "sbss", 8, True),
+                "otherVar": ManifestEntry("otherVar", "bss", 4, True),
+                # from a manifest written before statics were left out
+                "staticVar": ManifestEntry("staticVar", "sbss", 4, False),
+            },
+        )
+        lines = [
+            "	lw	$2,smallVar",
+            "	lw	$3,otherVar",
+            "	lw	$4,staticVar",
+        ]
+
+        mp = MaspsxProcessor(
+            lines,
+            sdata_limit=4,
+            symbol_manifest=SymbolManifest.open(self.manifest_path),
+        )
+        self.assertEqual(
+            [
+                "lw\t$2,smallVar",
+                "lw\t$3,%gp_rel(otherVar)($gp)",
+                "lw\t$4,staticVar",
+            ],
+            [x for x in strip_comments(mp.process_lines()) if x != "nop"],
+        )
+
+    def test_manifest_ignored_without_gp(self):
+        update_manifest(
+            self.manifest_path,
+            {"externVar": ManifestEntry("externVar", "sbss", 4, False)},
+        )
+        mp = MaspsxProcessor(
+            ["	sw	$2,externVar"],
+            symbol_manifest=SymbolManifest.open(self.manifest_path),
+        )
+        res = mp.process_lines()
+
+        clean_lines = strip_comments(res)
+        self.assertEqual(["sw\t$2,externVar"], clean_lines)
@@ -0,0 +1,56 @@
+import io
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx import MaspsxProcessor
+from maspsx.reader import decode_lines, encode_text, open_file_bytes
+
+MASPSX = Path(__file__).parent.parent / "maspsx.py"
+
+
+class TestReader(unittest.TestCase):
+    def test_decode_lines_matches_readlines(self):
+        text = "\t.text\n\tlw\t$2,0($4)\r\n\n  label:  \n\tj\t$31"
+        expected_lines = [x.strip() for x in io.StringIO(text).readlines()]
+        self.assertEqual(expected_lines, decode_lines(text.encode("utf")))
+
+    def test_decode_lines_trailing_newline(self):
+        self.assertEqual(["nop", "nop"], decode_lines(b"nop\nnop\n"))
+        self.assertEqual([], decode_lines(b""))
+
+    def test_non_ascii_round_trip(self):
+        data = '\t.ascii\t"\xe3\x83\x86\\000"\n'.encode("utf")
+        (line,) = decode_lines(data)
+        self.assertEqual(data.strip(), encode_text(line))
+
+    def test_open_file_bytes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "input.s"
+            path.write_bytes(b"\tnop\n")
+            with open_file_bytes(path) as data:
+                self.assertEqual(["nop"], decode_lines(data))
+            # unmapped once done with
+            self.assertTrue(data.closed)
+
+            path.write_bytes(b"")
+            with open_file_bytes(path) as data:
+                self.assertEqual([], decode_lines(data))
+
+    def test_stripped_lines_are_not_copied(self):
+        lines = decode_lines(b"\tnop\n\tj\t$31\n")
+        self.assertIs(lines, MaspsxProcessor(lines, stripped=True).lines)
+
+    def test_print_output_bytes(self):
+        data = '\t.ascii\t"\xe3\x83\x86\\000"\n'.encode("utf")
+        result = subprocess.run(
+            [sys.executable, str(MASPSX), "--bytes-io", "--print-output"],
+            input=data,
+            capture_output=True,
+        )
+        self.assertEqual(0, result.returncode)
+        self.assertIn(data.strip(), result.stdout)
+        self.assertIn(data.strip(), result.stderr)
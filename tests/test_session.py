@@ -0,0 +1,179 @@
+import unittest
+
+import maspsx
+
+from maspsx import MaspsxOptions
+from maspsx.session import MaspsxSession, lookahead
+
+
+def make_function(name, body):
+    return (
+        [
+            "	.align	2",
+            f"	.globl	{name}",
+            f"	.ent	{name}",
+            f"{name}:",
+        ]
+        + body
+        + [
+            "	j	$31",
+            f"	.end	{name}",
+        ]
+    )
+
+
+FUNC_A = make_function(
+    "func_a",
+    [
+        "	lw	$2,smallVar",
+        "	div	$2,$2,$3",
+        "	addu	$2,$2,$4",
+    ],
+)
+FUNC_B = make_function(
+    "func_b",
+    [
+        "	lw	$2,40000($4)",
+        "	addu	$3,$2,$2",
+    ],
+)
+FUNC_B_NEW = make_function(
+    "func_b",
+    [
+        "	lw	$2,smallVar+4",
+        "	sw	$2,40000($4)",
+        "	li	$3,0x12345",
+        "	mflo	$2",
+        "	mult	$2,$3",
+    ],
+)
+FUNC_C = make_function(
+    "func_c",
+    [
+        "	div	$2,$2,$3",
+        "	sw	$2,smallVar",
+    ],
+)
+
+HEADER = [
+    '	.file	1 "test.c"',
+    "	.text",
+]
+FOOTER = [
+    "	.comm	smallVar,8",
+]
+
+
+class TestSession(unittest.TestCase):
+    def check_replace(self, options):
+        lines = HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER
+        session = MaspsxSession("\n".join(lines) + "\n", options)
+
+        self.assertEqual(["func_a", "func_b", "func_c"], session.functions())
+        self.assertEqual(maspsx.process(lines, options), session.output())
+
+        new_lines = HEADER + FUNC_A + FUNC_B_NEW + FUNC_C + FOOTER
+        self.assertEqual(
+            maspsx.process(new_lines, options), session.replace_function(FUNC_B_NEW)
+        )
+
+        # swapping back should give the original output again
+        self.assertEqual(
+            maspsx.process(lines, options), session.replace_function(FUNC_B)
+        )
+
+    def test_lookahead(self):
+        lines = ["nop", "", "lw\t$2,0($4)", "", "addu\t$2,$2,$3", "j\t$31"]
+        self.assertEqual(("lw\t$2,0($4)", "addu\t$2,$2,$3"), lookahead(lines, 1))
+        self.assertEqual(("j\t$31",), lookahead(lines, 5))
+
+    def test_replace_function(self):
+        self.check_replace(MaspsxOptions(aspsx_version="2.56", sdata_limit=8))
+
+    def test_replace_function_expand_div(self):
+        # expanded div labels depend on the line number
+        self.check_replace(
+            MaspsxOptions(aspsx_version="2.08", sdata_limit=8, expand_div=True)
+        )
+
+    def test_replace_function_changes_symbols(self):
+        options = MaspsxOptions(aspsx_version="2.86", sdata_limit=8)
+        lines = HEADER + FUNC_A + FUNC_B + FOOTER
+        session = MaspsxSession(lines, options)
+
+        func_b = FUNC_B[:-1] + ["	.lcomm	otherVar,4", FUNC_B[-1]]
+        new_lines = HEADER + FUNC_A + func_b + FOOTER
+        self.assertEqual(
+            maspsx.process(new_lines, options), session.replace_function(func_b)
+        )
+
+    def test_replace_function_with_jump_table(self):
+        options = MaspsxOptions(aspsx_version="2.56", sdata_limit=8)
+
+        def with_jump_table(func):
+            return (
+                func[:-2]
+                + [
+                    "	.rdata",
+                    "	.align	2",
+                    "$L5:",
+                    "	.word	$L2",
+                    "	.text",
+                    "$L2:",
+                ]
+                + func[-2:]
+            )
+
+        func_b = with_jump_table(FUNC_B)
+        func_b_new = with_jump_table(
+            make_function("func_b", ["	lw	$3,50000($5)", "	addu	$3,$3,$3"])
+        )
+        session = MaspsxSession(HEADER + FUNC_A + func_b + FUNC_C + FOOTER, options)
+
+        new_lines = HEADER + FUNC_A + func_b_new + FUNC_C + FOOTER
+        self.assertEqual(
+            maspsx.process(new_lines, options), session.replace_function(func_b_new)
+        )
+
+    def test_only_changed_function_is_processed(self):
+        options = MaspsxOptions(aspsx_version="2.56")
+        session = MaspsxSession(HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER, options)
+
+        processed = []
+        process_range_into = session.processor.process_range_into
+
+        def spy(start, end, res):
+            processed.append(session.processor.lines[start])
+            process_range_into(start, end, res)
+
+        session.processor.process_range_into = spy
+        session.replace_function(FUNC_B_NEW)
+
+        self.assertEqual([".ent\tfunc_b"], processed)
+
+    def test_unknown_function(self):
+        session = MaspsxSession(HEADER + FUNC_A)
+        with self.assertRaises(Exception):
+            session.replace_function(FUNC_B)
+
+    def test_update(self):
+        options = MaspsxOptions(aspsx_version="2.56", sdata_limit=8)
+        session = MaspsxSession(HEADER + FUNC_A + FUNC_B + FUNC_C + FOOTER, options)
+
+        processed = []
+        process_range_into = session.processor.process_range_into
+
+        def spy(start, end, res):
+            processed.append(session.processor.lines[start])
+            process_range_into(start, end, res)
+
+        session.processor.process_range_into = spy
+
+        new_lines = HEADER + FUNC_A + FUNC_B_NEW + FUNC_C + FOOTER
+        self.assertEqual(maspsx.process(new_lines, options), session.update(new_lines))
+        self.assertNotIn(".ent\tfunc_a", processed)
+        self.assertNotIn(".ent\tfunc_c", processed)
+
+        # a different symbol table invalidates everything
+        new_lines = HEADER + FUNC_A + FUNC_C + ["	.comm	smallVar,4"]
+        self.assertEqual(maspsx.process(new_lines, options), session.update(new_lines))
@@ -0,0 +1,91 @@
+import io
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx import MaspsxProcessor
+from maspsx.sinks import (
+    AssemblerSink,
+    BufferSink,
+    DeferredSink,
+    NullSink,
+    StreamSink,
+    TeeSink,
+)
+
+MASPSX = Path(__file__).parent.parent / "maspsx.py"
+
+LINES = [
+    "	.comm	savedInfoTracker,16",
+    "	lw	$2,40000($4)",
+    "	li	$3,0x12345",
+    "	div	$2,$2,$3",
+]
+
+
+class TestSinks(unittest.TestCase):
+    def test_buffer_sink_matches_process_lines(self):
+        expected_lines = MaspsxProcessor(LINES, expand_li=True).process_lines()
+
+        sink = BufferSink()
+        MaspsxProcessor(LINES, expand_li=True).process_lines_into(sink)
+
+        self.assertEqual("".join(f"{x}\n" for x in expected_lines), sink.getvalue())
+
+    def test_null_sink(self):
+        mp = MaspsxProcessor(LINES, sdata_limit=8)
+        mp.process_lines_into(NullSink())
+        self.assertIsNotNone(mp.get_symbol("savedInfoTracker"))
+
+    def test_binary_stream_and_tee(self):
+        binary = io.BytesIO()
+        buffer = BufferSink()
+        sink = TeeSink(StreamSink(binary, encoding="utf"), buffer)
+        sink.extend(["nop", ".set\tnoreorder"])
+        sink.close()
+
+        self.assertEqual(b"nop\n.set\tnoreorder\n", binary.getvalue())
+        self.assertEqual("nop\n.set\tnoreorder\n", buffer.getvalue())
+
+    def test_deferred_sink(self):
+        buffer = BufferSink()
+        sink = DeferredSink(buffer)
+        sink.extend(["nop"])
+        sink.append(".set\tnoreorder")
+        self.assertEqual("", buffer.getvalue())
+        sink.close()
+        self.assertEqual("nop\n.set\tnoreorder\n", buffer.getvalue())
+
+    def test_assembler_sink(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_path = Path(tmp_dir) / "out.s"
+            cmd = [
+                sys.executable,
+                "-c",
+                "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], 'wb'))",
+                str(out_path),
+            ]
+            sink = AssemblerSink(cmd)
+            MaspsxProcessor(LINES).process_lines_into(sink)
+            sink.close()
+
+            self.assertEqual(0, sink.returncode)
+            expected_lines = MaspsxProcessor(LINES).process_lines()
+            self.assertEqual(
+                "".join(f"{x}\n" for x in expected_lines), out_path.read_text()
+            )
+
+    def test_stdout_on_failure(self):
+        # the lines before the failing one aren't printed
+        result = subprocess.run(
+            [sys.executable, str(MASPSX), "--aspsx-version=2.56"],
+            input="\tnop\n\tlw\t$2,\n",
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(1, result.returncode)
+        self.assertEqual("", result.stdout)
+        self.assertIn("Unable to parse load/store instruction", result.stderr)
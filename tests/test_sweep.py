@@ -0,0 +1,58 @@
+import unittest
+
+from maspsx import MaspsxProcessor
+from maspsx.sweep import process_versions
+from maspsx.versions import ASPSX_VERSIONS, get_version_flags
+
+
+class TestSweep(unittest.TestCase):
+    def test_versions_collapse(self):
+        lines = [
+            "	li	$2,1",
+        ]
+
+        variants = process_versions(lines, ASPSX_VERSIONS)
+
+        self.assertEqual(
+            [
+                ["1.05", "1.07", "2.05", "2.08", "2.21", "2.30", "2.34"],
+                ["2.56", "2.67", "2.77", "2.79", "2.81", "2.86"],
+            ],
+            [x.versions for x in variants],
+        )
+
+    def test_variants_match_single_version(self):
+        lines = [
+            "	.comm	savedInfoTracker,16",
+            "	la	$4,savedInfoTracker",
+            "	lw	$4,savedInfoTracker+4",
+            "	sltu	$2,$4,-1",
+            "	li	$3,0x12345",
+            "	div	$2,$2,$3",
+            "	lw	$2,40000($4)",
+            "	addu	$2,$2,$3",
+        ]
+
+        variants = process_versions(
+            lines, ASPSX_VERSIONS, preamble=[""], sdata_limit=65536, expand_div=True
+        )
+        self.assertEqual(
+            sorted(ASPSX_VERSIONS), sorted(sum([x.versions for x in variants], []))
+        )
+        self.assertEqual(len(variants), len(set(x.text for x in variants)))
+
+        for variant in variants:
+            for version in variant.versions:
+                with self.subTest(version=version):
+                    mp = MaspsxProcessor(
+                        lines,
+                        sdata_limit=65536,
+                        expand_div=True,
+                        **get_version_flags(version),
+                    )
+                    expected_text = "\n".join([""] + mp.process_lines()) + "\n"
+                    self.assertEqual(expected_text, variant.text)
+
+    def test_dont_expand_li(self):
+        variants = process_versions(["	li	$2,1"], ["1.07", "2.86"], dont_expand_li=True)
+        self.assertEqual([["1.07", "2.86"]], [x.versions for x in variants])
@@ -0,0 +1,159 @@
+import io
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from maspsx.manifest import ManifestEntry, update_manifest
+from maspsx.options import MaspsxOptions
+from maspsx.watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    WatchConfig,
+    Watcher,
+    write_atomic,
+)
+
+SOURCE = (
+    "\t.text\n"
+    "\t.globl\tfoo\n"
+    "\t.ent\tfoo\n"
+    "foo:\n"
+    "\tlw\t$2,D_1{}\n"
+    "\tj\t$31\n"
+    "\t.end\tfoo\n"
+)
+
+
+class FakeWatcher:
+    def __init__(self, on_wait):
+        self.on_wait = on_wait
+
+    def wait(self, timeout=None):
+        self.on_wait()
+        return {Path("changed")}
+
+    def close(self):
+        pass
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.input_path = self.path / "main.s"
+        self.input_path.write_text(SOURCE.format(""))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def config(self, options=MaspsxOptions(), **kwargs):
+        return WatchConfig(
+            watch_paths=[self.input_path],
+            options=options,
+            as_path="mipsel-linux-gnu-as",
+            as_args=["-G0"],
+            object_path=self.path / "main.o",
+            dump_text=self.path / "main.txt",
+            native=True,
+            **kwargs,
+        )
+
+    def test_build(self):
+        watcher = Watcher(self.config(input_path=self.input_path))
+        iteration = watcher.build()
+        self.assertFalse(iteration.unchanged)
+        self.assertEqual(["read", "maspsx", "as", "write"], list(iteration.timings))
+        self.assertTrue((self.path / "main.o").exists())
+        self.assertEqual(
+            "0x3C020000\n0x8C420000\n0x03E00008\n0x00000000\n",
+            (self.path / "main.txt").read_text(),
+        )
+
+        self.assertTrue(watcher.build().unchanged)
+
+        self.input_path.write_text(SOURCE.format("+4"))
+        self.assertFalse(watcher.build().unchanged)
+        self.assertIn("0x8C420004", (self.path / "main.txt").read_text())
+
+    def test_build_command(self):
+        config = self.config(
+            build_command=f"{sys.executable} -c \"print(open('{self.input_path}').read())\""
+        )
+        Watcher(config).build()
+        self.assertIn("0x8C420000", (self.path / "main.txt").read_text())
+
+        config.build_command = "exit 1"
+        with self.assertRaises(Exception):
+            Watcher(config).build()
+
+    def test_symbol_manifest(self):
+        manifest_path = self.path / "symbols.bin"
+        update_manifest(manifest_path, {"D_1": ManifestEntry("D_1", "sbss", 4, True)})
+        watcher = Watcher(
+            self.config(
+                options=MaspsxOptions(sdata_limit=8),
+                input_path=self.input_path,
+                symbol_manifest=manifest_path,
+            )
+        )
+        watcher.build()
+        self.assertIn("0x8F820000", (self.path / "main.txt").read_text())
+
+        # the input is the same, but the manifest isn't
+        update_manifest(manifest_path, {"D_1": ManifestEntry("D_1", "bss", 16, True)})
+        self.assertFalse(watcher.build().unchanged)
+        self.assertIn("0x8C420000", (self.path / "main.txt").read_text())
+
+    def test_run(self):
+        edits = iter(["+4", "+4"])
+        out = io.StringIO()
+        watcher = Watcher(self.config(input_path=self.input_path))
+        watcher.run(
+            out,
+            lambda paths: FakeWatcher(
+                lambda: self.input_path.write_text(SOURCE.format(next(edits)))
+            ),
+            max_iterations=3,
+        )
+        reports = out.getvalue().splitlines()
+        self.assertEqual(3, len(reports))
+        self.assertTrue(reports[0].startswith("MASPSX: rebuilt in"))
+        self.assertTrue(reports[1].startswith("MASPSX: rebuilt in"))
+        self.assertTrue(reports[2].startswith("MASPSX: unchanged after"))
+
+    def test_write_atomic(self):
+        path = self.path / "out" / "main.o"
+        write_atomic(path, b"one")
+        write_atomic(path, b"two")
+        self.assertEqual(b"two", path.read_bytes())
+        self.assertEqual(["main.o"], [x.name for x in path.parent.iterdir()])
+
+
+class TestFileWatchers(unittest.TestCase):
+    def check_watcher(self, factory):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "main.c"
+            other = Path(tmp_dir) / "other.c"
+            path.write_text("1")
+            watcher = factory([path])
+            try:
+                self.assertEqual(set(), watcher.wait(timeout=0.1))
+                other.write_text("2")
+                self.assertEqual(set(), watcher.wait(timeout=0.2))
+
+                # replaced by rename, as editors do
+                tmp_path = Path(tmp_dir) / "main.c.tmp"
+                tmp_path.write_text("22")
+                tmp_path.rename(path)
+                self.assertEqual({path.absolute()}, watcher.wait(timeout=1))
+            finally:
+                watcher.close()
+
+    def test_polling(self):
+        self.check_watcher(lambda paths: PollingWatcher(paths, interval=0.01))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_inotify(self):
+        self.check_watcher(InotifyWatcher)
@@ -1,3 +1,9 @@
+import struct
+
+from maspsx.api import assemble
+from maspsx.elf import read_elf_section
+
+
 def strip_comments(lines):
     res = []
     for line in lines:
@@ -7,3 +13,13 @@ def strip_comments(lines):
             line, *_ = line.split("#")
         res.append(line.strip())
     return res
+
+
+def text_words(lines):
+    """
+    The .text of the lines (e.g. maspsx output) once assembled, as hex words
+    """
+    text = "".join(f"{x}\n" for x in lines)
+    obj = assemble(text, args=["-no-pad-sections"], native=True)
+    data = read_elf_section(obj, ".text")
+    return [f"0x{x:08X}" for (x,) in struct.iter_unpack("<I", data)]